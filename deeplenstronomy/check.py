@@ -2,32 +2,43 @@
 configuration file before dataset generation begins."""
 
 import glob
+import importlib
 from inspect import getfullargspec
 import os
 import sys
 
 from astropy.io import fits
 import pandas as pd
-from lenstronomy.LensModel import Profiles as LensModelProfiles
-from lenstronomy.LightModel import Profiles as LightModelProfiles
 
-# import lenstronomy models into the global scope so dir() can find them
-import lenstronomy
-lenstronomy_path = lenstronomy.__file__[:-11] # length of __init__.py
-light_models = [x.split('/')[-1][0:-3] for x in glob.glob(lenstronomy_path + 'LightModel/Profiles/*.py') if not x.split('/')[-1].startswith('__')]
-lens_models = [x.split('/')[-1][0:-3] for x in glob.glob(lenstronomy_path + 'LensModel/Profiles/*.py') if not x.split('/')[-1].startswith('__')]
-for model in light_models:
-    exec(f'import lenstronomy.LightModel.Profiles.{model} as {model}_light')
-for model in lens_models:
-    exec(f'import lenstronomy.LensModel.Profiles.{model} as {model}_lens')
-
-
-from deeplenstronomy.utils import KeyPathDict, read_cadence_file
+from deeplenstronomy.utils import KeyPathDict, read_cadence_file, read_distribution_columns
 import deeplenstronomy.distributions as distributions
 
 class ConfigFileError(Exception): pass
 class LenstronomyWarning(Exception): pass
 
+# lenstronomy profile modules are only imported when a config uses them
+_profile_packages = {"LightModelProfiles": "lenstronomy.LightModel.Profiles",
+                     "LensModelProfiles": "lenstronomy.LensModel.Profiles"}
+_profile_parameters = {}
+
+def profile_parameters(profile_type, class_path):
+    """
+    Get the arguments of the function method of a lenstronomy profile, importing its module on first use
+
+    Args:
+        profile_type (str): 'LightModelProfiles' or 'LensModelProfiles'
+        class_path (str): module and class of the profile, e.g. '.sersic.Sersic'
+
+    Returns:
+        list of argument names
+    """
+    key = (profile_type, class_path)
+    if key not in _profile_parameters:
+        module_name, class_name = class_path.lstrip('.').rsplit('.', 1)
+        module = importlib.import_module(_profile_packages[profile_type] + '.' + module_name)
+        _profile_parameters[key] = getfullargspec(getattr(module, class_name).function)[0]
+    return _profile_parameters[key]
+
 class AllChecks():
     """
     Define checks as methods starting with 'check_'
@@ -181,28 +192,21 @@ class AllChecks():
          setattr(self, "lenstronomy_lens_map", d)
          return
     
-    @staticmethod
-    def config_dict_format(*args):
-        """
-        From a list of parameters, construct the path through the config dictionary
-        """
-        return "['" + "']['".join(args) + "']"
-
     def config_lookup(self, lookup_str, full=False):
         """
         From a key path, get the value in the dictionary
 
         Args:
-            lookup_str (str): path of keys through a nested dictionary
+            lookup_str (str): '.'-separated path of keys through a nested dictionary
             full (bool, optional, default=False): `True for lookup in the `full_dict`, `False` for lookup in the `config_dict`
 
         Returns:
             The value in the dictionary at the location of the keypath
         """
         if not full:
-            return eval("self.config" + lookup_str)
+            return self.config.get_keypath(lookup_str)
         else:
-            return eval("self.full" + lookup_str)
+            return self.full.get_keypath(lookup_str)
         
     ### Check functions
     def check_top_level_existence(self):
@@ -257,7 +261,7 @@ class AllChecks():
                        "SURVEY.PARAMETERS.num_exposures"}
         for param in param_names:
             try:
-                config_obj = self.config_lookup(self.config_dict_format(*param.split('.')))
+                config_obj = self.config_lookup(param)
             except KeyError:
                 errs.append(param + " is missing from the Config File")
 
@@ -284,7 +288,7 @@ class AllChecks():
                        "COSMOLOGY.PARAMETERS.Ob0"}
         for param in param_names:
             try:
-                config_obj = self.config_lookup(self.config_dict_format(*param.split('.')))
+                config_obj = self.config_lookup(param)
             except KeyError:
                 # The checked parameter was not in the config dict
                 continue
@@ -300,7 +304,7 @@ class AllChecks():
         """
         errs = []
         input_paths = [x for x in self.full_keypaths if x.find("INPUT") != -1]
-        input_files = [self.config_lookup(self.config_dict_format(*param.split('.')), full=True) for param in input_paths]
+        input_files = [self.config_lookup(param, full=True) for param in input_paths]
         for filename in input_files:
             if not os.path.exists(filename):
                 errs.append("Unable to find auxiliary file: " + filename)
@@ -313,7 +317,7 @@ class AllChecks():
         """
         errs = []
         distribution_paths = [x for x in self.full_keypaths if x.endswith("DISTRIBUTION")]
-        distribution_dicts = [self.config_lookup(self.config_dict_format(*param.split('.'))) for param in distribution_paths]
+        distribution_dicts = [self.config_lookup(param) for param in distribution_paths]
         for distribution_dict, path in zip(distribution_dicts, distribution_paths):
             # must have name key - return early to not break the remaining parts of this function
             if "NAME" not in distribution_dict.keys():
@@ -377,15 +381,14 @@ class AllChecks():
                             errs.append("DISTRIBUTIONS." + userdist + " File '" + self.config["DISTRIBUTIONS"][userdist]['FILENAME'] + "' not found")
                         else:
                             # must be able to read file
-                            df = None
                             try:
-                                df = pd.read_csv(self.config["DISTRIBUTIONS"][userdist]['FILENAME'], delim_whitespace=True)
-                                if "WEIGHT" not in df.columns:
-                                    errs.append("WEIGHT column not found in  DISTRIBUTIONS." + userdist + "File '" + self.config["DISTRIBUTIONS"][userdist]['FILENAME'] + "'")
+                                # text tables are kept in memory for drawing from them later,
+                                # only the header of a binary table is read
+                                read_distribution_columns(self.config["DISTRIBUTIONS"][userdist]['FILENAME'])
+                            except AssertionError:
+                                errs.append("WEIGHT column not found in  DISTRIBUTIONS." + userdist + "File '" + self.config["DISTRIBUTIONS"][userdist]['FILENAME'] + "'")
                             except Exception as e:
                                 errs.append("Error reading DISTRIBUTIONS." + userdist + " File '" + self.config["DISTRIBUTIONS"][userdist]['FILENAME'] + "'")
-                            finally:
-                                del df
 
                         # mode must be valid
                         if self.config["DISTRIBUTIONS"][userdist]['MODE'] not in ['interpolate', 'sample']:
@@ -594,7 +597,7 @@ class AllChecks():
                     else:
                         # specified parameters must be what lenstronomy is expecting
                         for param_name in self.config['SPECIES'][k][profile_k]["PARAMETERS"].keys():
-                            if param_name not in getfullargspec(eval(profile_type + lenstronomy_map[self.config['SPECIES'][k][profile_k]["NAME"]] + ".function"))[0]:
+                            if param_name not in profile_parameters(profile_type, lenstronomy_map[self.config['SPECIES'][k][profile_k]["NAME"]]):
                                 if param_name not in ['magnitude', 'sigma_v']:
                                     #lenstronomy functions use `amp` but deeplenstronomy works with `magnitude`
                                     #allow sigma_v to be used as a way to parameterize the lensing
@@ -646,7 +649,7 @@ class AllChecks():
                 pass
             else:
                 # host must appear in SPECIES section
-                species_paths = [self.config_lookup(self.config_dict_format(*x.split('.'))) for x in self.config_keypaths if x.startswith("SPECIES.") and x.endswith(".NAME")]
+                species_paths = [self.config_lookup(x) for x in self.config.keypaths("SPECIES.") if x.endswith(".NAME")]
                 species_paths = [x for x in species_paths if x == self.config['SPECIES'][k]["HOST"]]
                 if len(species_paths) == 0:
                     errs.append("HOST for SPECIES." + k + " is not found in SPECIES section")
@@ -839,7 +842,7 @@ class AllChecks():
                             if not isinstance(self.config['GEOMETRY'][k][config_k][obj_k], str):
                                 errs.append('GEOMETRY.' + k + '.' + config_k + '.' + obj_k + ' must be a single name')
 
-                            species_paths = [self.config_lookup(self.config_dict_format(*x.split('.'))) for x in self.config_keypaths if x.startswith('SPECIES.') and x.endswith('.NAME')]
+                            species_paths = [self.config_lookup(x) for x in self.config.keypaths('SPECIES.') if x.endswith('.NAME')]
                             species_paths = [x for x in species_paths if x == self.config['GEOMETRY'][k][config_k][obj_k]]
                             if len(species_paths) == 0:
                                 errs.append('GEOMETRY.' + k + '.' + config_k + '.' + obj_k + '(' + self.config['GEOMETRY'][k][config_k][obj_k] + ') is missing from the SPECIES section')
@@ -863,7 +866,7 @@ class AllChecks():
                     if not isinstance(self.config['GEOMETRY'][k][config_k], str):
                         errs.append('GEOMETRY.' + k + '.' + config_k + ' must be a single name')
 
-                    species_paths = [self.config_lookup(self.config_dict_format(*x.split('.'))) for x in self.config_keypaths if x.startswith('SPECIES.') and x.endswith('.NAME')]
+                    species_paths = [self.config_lookup(x) for x in self.config.keypaths('SPECIES.') if x.endswith('.NAME')]
                     species_paths = [x for x in species_paths if x == self.config['GEOMETRY'][k][config_k]]
                     if len(species_paths) == 0:
                         errs.append('GEOMETRY.' + k + '.' + config_k + ' is missing from the SPECIES section')
@@ -879,14 +882,14 @@ class AllChecks():
                         else:
                             # listed objects must appear in species section, in the configuration, and have a model defined
                             for obj in self.config['GEOMETRY'][k][config_k]['OBJECTS']:
-                                species_paths = [x for x in self.config_keypaths if x.startswith('SPECIES.') and x.endswith('.NAME')]
-                                species_paths = ['.'.join(x.split('.')[:-1]) for x in species_paths if self.config_lookup(self.config_dict_format(*x.split('.'))) == obj]
+                                species_paths = [x for x in self.config.keypaths('SPECIES.') if x.endswith('.NAME')]
+                                species_paths = ['.'.join(x.split('.')[:-1]) for x in species_paths if self.config_lookup(x) == obj]
                                 if len(species_paths) == 0:
                                     errs.append(obj + " in GEOMETRY." + k + ".TIMESERIES.OBJECTS is missing from the SPECIES section")
-                                elif "MODEL" not in self.config_lookup(self.config_dict_format(*species_paths[0].split('.'))).keys():
+                                elif "MODEL" not in self.config_lookup(species_paths[0]).keys():
                                     errs.append("MODEL for " + obj + " in GEOMETRY." + k + ".TIMESERIES.OBJECTS is missing from the SPECIES section")
-                                configuration_paths = [x for x in self.config_keypaths if x.startswith('GEOMETRY.' + k + '.') and x.find('.OBJECT_') != -1]
-                                configuration_paths = [x for x in configuration_paths if self.config_lookup(self.config_dict_format(*x.split('.'))) == obj]
+                                configuration_paths = [x for x in self.config.keypaths('GEOMETRY.' + k + '.') if x.find('.OBJECT_') != -1]
+                                configuration_paths = [x for x in configuration_paths if self.config_lookup(x) == obj]
                                 if len(configuration_paths) == 0:
                                     errs.append(obj + " in GEOMETRY." + k + ".TIMESERIES.OBJECTS is missing from GEOMETRY." + k)
                         
@@ -941,6 +944,14 @@ class AllChecks():
                             except TypeError:
                                 errs.append("PEAK argument in GEOMETRY." + k + ".TIMESERIES.PEAK must be numeric")
                                 
+                    # Check validity of the redshift grid arguments, if passed
+                    if "REDSHIFT_NODES" in self.config['GEOMETRY'][k][config_k].keys():
+                        if not isinstance(self.config['GEOMETRY'][k][config_k]["REDSHIFT_NODES"], int) or self.config['GEOMETRY'][k][config_k]["REDSHIFT_NODES"] < 1:
+                            errs.append("GEOMETRY." + k + ".TIMESERIES.REDSHIFT_NODES must be a positive integer")
+                    if "INTERPOLATE_REDSHIFT" in self.config['GEOMETRY'][k][config_k].keys():
+                        if not isinstance(self.config['GEOMETRY'][k][config_k]["INTERPOLATE_REDSHIFT"], bool):
+                            errs.append("GEOMETRY." + k + ".TIMESERIES.INTERPOLATE_REDSHIFT must be True or False")
+                                
                     # Impose restriction on num_exposures
                     if isinstance(self.config["SURVEY"]["PARAMETERS"]["num_exposures"], dict):
                         errs.append("You must set SURVEY.PARAMETERS.num_exposures to 1 if you use TIMESERIES")
@@ -1,9 +1,13 @@
 """The main module for dataset generation."""
 
+import itertools
+import multiprocessing
 import os
 import random
+import shutil
 import sys
 import time
+import traceback
 
 import h5py
 import numpy as np
@@ -11,7 +15,8 @@ import pandas as pd
 
 from deeplenstronomy.input_reader import Organizer, Parser
 from deeplenstronomy.image_generator import ImageGenerator
-from deeplenstronomy.utils import draw_from_user_dist, organize_image_backgrounds, read_images
+from deeplenstronomy.output import BackgroundWriter, Checkpoint, default_metadata_format, epoch_index, HDF5Writer, LazyMetadata, MetadataWriter, open_hdf5_dataset, save_h5
+from deeplenstronomy.utils import BackgroundBank, draw_from_user_dist, KeyPathDict, organize_image_backgrounds
 from deeplenstronomy import surveys
 
 class Dataset():
@@ -30,6 +35,90 @@ class Dataset():
             make_dataset(config, dataset=self, save=save, store=store)
         return
 
+    @classmethod
+    def load(cls, outdir):
+        """
+        Open a dataset previously saved to disk by make_dataset without reading it into memory.
+        Images and planes are memory-mapped ('npy') or read from HDF5 when indexed ('h5' and
+        'hdf5'). Metadata is a LazyMetadata object that reads only the columns and OBJIDs accessed.
+
+        Args:
+            outdir (str): the OUTDIR of the dataset
+
+        Returns:
+            dataset (Dataset): with {configuration}_images, {configuration}_planes, {configuration}_metadata, and
+                {configuration}_epoch_index attributes
+        """
+        dataset = cls()
+        dataset.outdir = outdir
+        configurations = set()
+
+        for filename in sorted(os.listdir(outdir)):
+            path = outdir + '/' + filename
+            if filename.endswith('.hdf5'):
+                # consolidated file, one group per configuration
+                hf = h5py.File(path, 'r')
+                for configuration in hf.keys():
+                    configurations.add(configuration)
+                    for kind in ['images', 'planes']:
+                        if kind in hf[configuration]:
+                            setattr(dataset, '{0}_{1}'.format(configuration, kind), hf[configuration][kind])
+                    if 'epoch_index' in hf[configuration]:
+                        setattr(dataset, '{0}_epoch_index'.format(configuration),
+                                {k: v[()] for k, v in hf[configuration]['epoch_index'].items()})
+                    setattr(dataset, '{0}_metadata'.format(configuration), LazyMetadata(path, configuration))
+                continue
+
+            if not filename.startswith('CONFIGURATION_') or filename.find('_sim_dicts') != -1:
+                continue
+            name, extension = os.path.splitext(filename)
+            if name.endswith('_epoch_index'):
+                with np.load(path) as npz:
+                    setattr(dataset, '{0}_epoch_index'.format(name[:-len('_epoch_index')]), {k: npz[k] for k in npz.files})
+                continue
+            configuration, kind = name.rsplit('_', 1)
+            if kind in ['images', 'planes']:
+                if extension == '.npy':
+                    data = np.load(path, mmap_mode='r')
+                elif extension == '.h5':
+                    data = open_hdf5_dataset(path)
+                else:
+                    continue
+            elif kind == 'metadata':
+                data = LazyMetadata(path)
+            else:
+                continue
+            configurations.add(configuration)
+            setattr(dataset, '{0}_{1}'.format(configuration, kind), data)
+
+        dataset.configurations = sorted(configurations, key=lambda x: int(x.split('_')[-1]))
+        return dataset
+
+    def epochs(self, configuration, objid, kind='images'):
+        """
+        Get the images of every epoch of a time series object, ordered by nite. For images
+        in memory or memory-mapped, the result is a view and no data is copied.
+
+        Args:
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            objid (int): the OBJID of the object
+            kind (str, optional, default='images'): 'images' or 'planes'
+
+        Returns:
+            array with shape (number of epochs, bands, numPix, numPix) for images
+        """
+        if not hasattr(self, '{0}_epoch_index'.format(configuration)):
+            metadata = getattr(self, '{0}_metadata'.format(configuration))
+            objid_column = [x for x in metadata.columns if x.startswith('OBJID')][0]
+            objids, offsets = epoch_index(np.asarray(metadata[objid_column]))
+            setattr(self, '{0}_epoch_index'.format(configuration), {'objid': objids, 'offsets': offsets})
+        index = getattr(self, '{0}_epoch_index'.format(configuration))
+
+        position = np.searchsorted(index['objid'], objid)
+        if position == len(index['objid']) or index['objid'][position] != objid:
+            raise KeyError("OBJID {0} not found in {1}".format(objid, configuration))
+        return getattr(self, '{0}_{1}'.format(configuration, kind))[index['offsets'][position]:index['offsets'][position + 1]]
+
     def update_param(self, new_param_dict, configuration):
         """
         Update single parameters to new values.
@@ -40,7 +129,7 @@ class Dataset():
         """
         # Put in the updated values
         for new_param, new_value in new_param_dict.items():
-            exec("self.config_dict" + self._locate(new_param, configuration) + " = new_value")
+            self.config_dict.set_keypath(self._locate(new_param, configuration), new_value)
             
         return
 
@@ -64,10 +153,8 @@ class Dataset():
         # Put in the updated distributions
         for new_param, new_dist_info in new_param_dist_dict.items():
             location = self._locate(new_param, configuration)
-            exec("self.config_dict" + location + " = {'DISTRIBUTION': {'NAME': '', 'PARAMETERS': {}}}")
-            exec("self.config_dict" + location + "['DISTRIBUTION']['NAME'] = new_dist_info['name']")
-            for new_dist_param, new_dist_param_value in new_dist_info['parameters'].items():
-                exec("self.config_dict" + location + "['DISTRIBUTION']['PARAMETERS'][new_dist_param] = new_dist_param_value")
+            self.config_dict.set_keypath(location, {'DISTRIBUTION': {'NAME': new_dist_info['name'],
+                                                                     'PARAMETERS': dict(new_dist_info['parameters'])}})
 
         return
 
@@ -78,7 +165,7 @@ class Dataset():
 
         :param param: the name of the parameter you want to find the path for
         :param configuration: like 'CONFIGURATION_1', 'CONFIGURATION_2', etc... 
-        :return: the path to the parameter
+        :return: the keypath to the parameter
         """
         if param[-1] in self.config_dict['SURVEY']['PARAMETERS']['BANDS'].split(','):
             # Trim the band if the user left it in
@@ -86,21 +173,21 @@ class Dataset():
 
         # DATASET- allowed params
         if param in ['SIZE', 'OUTDIR']:
-            return "['DATASET']['PARAMETERS']['{0}']".format(param)
+            return "DATASET.PARAMETERS.{0}".format(param)
         # COSMOLOGY
         elif param in ['H0', 'Om0', 'Tcmb0', 'Neff', 'm_nu', 'Ob0']:
-            return "['COSMOLOGY']['PARAMETERS']['{0}']".format(param)
+            return "COSMOLOGY.PARAMETERS.{0}".format(param)
         # IMAGE
         elif param in ['exposure_time', 'numPix', 'pixel_scale', 'psf_type', 'read_noise', 'ccd_gain']:
-            return "['IMAGE']['PARAMETERS']['{0}']".format(param)
+            return "IMAGE.PARAMETERS.{0}".format(param)
         # SURVEY
         elif param in ['BANDS', 'seeing', 'magnitude_zero_point', 'sky_brightness', 'num_exposures']:
-            return "['SURVEY']['PARAMETERS']['{0}']".format(param)
+            return "SURVEY.PARAMETERS.{0}".format(param)
         # NOISE
         elif param[0:5] == 'NOISE':
             # type of noise
             if param[-4:] == 'NAME':
-                return "['GEOMETRY']['{0}']['{1}']".format(configuration, param.split('-')[0])
+                return "GEOMETRY.{0}.{1}".format(configuration, param.split('-')[0])
             # noise properties
             else:
                 noise_name = self.config_dict['GEOMETRY'][configuration][param.split('-')[0]]
@@ -108,13 +195,13 @@ class Dataset():
                     for v_key in v.keys():
                         if v_key[0:5] == 'NOISE':
                             if v['NAME'] == noise_name:
-                                return "['SPECIES']['{0}']['PARAMETERS']['{1}']".format(k, param.split('-')[-1])
+                                return "SPECIES.{0}.PARAMETERS.{1}".format(k, param.split('-')[-1])
             
         # GEOMETRY and SPECIES
         elif param[0:5] == 'PLANE':
             # redshift
             if param[-8:] == 'REDSHIFT':
-                return "['GEOMETRY']['{0}']['{1}']['PARAMETERS']['REDSHIFT']".format(configuration, param.split('-')[0])
+                return "GEOMETRY.{0}.{1}.PARAMETERS.REDSHIFT".format(configuration, param.split('-')[0])
             # timeseries - not available yet
             
             # species
@@ -123,7 +210,7 @@ class Dataset():
                 for k, v in self.config_dict['SPECIES'].items():
                     if 'NAME' in v.keys():
                         if obj_name == self.config_dict['SPECIES'][k]['NAME']:
-                            return "['SPECIES']['{0}']['{1}']['PARAMETERS']['{2}']".format(k, param.split('-')[2], param.split('-')[-1])
+                            return "SPECIES.{0}.{1}.PARAMETERS.{2}".format(k, param.split('-')[2], param.split('-')[-1])
                 print("If you're seeing this message, you're trying to update something I wasn't prepared for.\nShoot me a message on Slack")
         else:
             print("If you're seeing this message, you're trying to update something I wasn't prepared for.\nShoot me a message on Slack")
@@ -153,27 +240,23 @@ class Dataset():
         Returns:
             dict: keys contain object names, values contain a list of all possible USERDIST column headers
         """
-        obj_paths = ['["' + x[9:].replace('.', '"]["') + '"]' for x in self.config_dict.keypaths() if x.startswith("GEOMETRY") and x.find("OBJECT_") != -1]
-        obj_names = []
-        for x in obj_paths:
-            obj_names.append(eval('self.config_dict["GEOMETRY"]' + x))
-        species_paths = ['["' + x.replace('.', '"]["') + '"]' for x in self.config_dict.keypaths() if x.startswith("SPECIES") and x.endswith("NAME") and x.find("LIGHT_PROFILE_") == -1 and x.find("MASS_PROFILE_") == -1 and x.find("SHEAR_PROFILE_") == -1]
-        species_names = []
-        for x in species_paths:
-            species_names.append(eval('self.config_dict' + x))
+        obj_paths = [x[9:] for x in self.config_dict.keypaths("GEOMETRY") if x.find("OBJECT_") != -1]
+        obj_names = [self.config_dict.get_keypath("GEOMETRY." + x) for x in obj_paths]
+        species_paths = [x for x in self.config_dict.keypaths("SPECIES") if x.endswith("NAME") and x.find("LIGHT_PROFILE_") == -1 and x.find("MASS_PROFILE_") == -1 and x.find("SHEAR_PROFILE_") == -1]
+        species_names = [self.config_dict.get_keypath(x) for x in species_paths]
     
         paths = []
         for obj_idx, obj_name in enumerate(obj_names):
             for species_idx, species_name in enumerate(species_names):
                 if obj_name == species_name:
                     paths.append({'name': obj_name,
-                                  'obj_path': obj_paths[obj_idx].replace('"]["', '.')[2:-2],
-                                  'spe_path': species_paths[species_idx].replace('"]["', '.')[2:-6]})
+                                  'obj_path': obj_paths[obj_idx],
+                                  'spe_path': species_paths[species_idx][:-4]})
                     
         output_dict = {} 
         for p in paths:
 
-            hr_paths = [p['obj_path'] + '.' + x.replace('.PARAMETERS.', '.')[len(p['spe_path']):] for x in self.config_dict.keypaths() if x.startswith(p['spe_path']) and x.find(param_name) != -1]
+            hr_paths = [p['obj_path'] + '.' + x.replace('.PARAMETERS.', '.')[len(p['spe_path']):] for x in self.config_dict.keypaths(p['spe_path']) if x.find(param_name) != -1]
             output_paths = []
             for hr_path in hr_paths:
                 if hr_path.find('DISTRIBUTION') != -1:
@@ -235,7 +318,7 @@ def _get_forced_sim_inputs(forced_inputs, configurations, bands):
                 suffices = bands[:]
                 param_name = param_name # this is not necessary at all, but makes me feel good inside seeing it match with the other blocks
 
-            # Duplicate drawn values to necessary configurations / bands
+            # Reference the drawn values from the necessary configurations / bands
             for prefix in prefices:
                 for suffix in suffices:
                     if len(np.shape(force_params['values'])) == 1:
@@ -250,7 +333,7 @@ def _check_survey(survey):
     if survey is None:
         return True
     else:
-        return survey in dir(surveys)   
+        return survey in dir(surveys) and not survey.startswith('_')
 
 def _format_time(elapsed_time):
     """
@@ -264,24 +347,171 @@ def _format_time(elapsed_time):
     seconds = elapsed_time - (hours * 3600) - (minutes * 60)
     return "%i H %i M %i S         " %(hours, minutes, seconds)
 
+def _objid_range(size, shard_index, num_shards):
+    """
+    Find the OBJIDs of a configuration generated by a shard
+
+    :param size: number of objects in the configuration
+    :param shard_index: index of the shard
+    :param num_shards: number of shards
+    :return: start, stop: the shard generates OBJIDs start to stop - 1
+    """
+    return size * shard_index // num_shards, size * (shard_index + 1) // num_shards
+
+def _image_seed(seed, config_num, image_num):
+    """
+    Seed of the noise of one image. The key has one more entry than the seeds
+    of the background noise, so the two never share a random stream.
+
+    :param seed: the SEED of the dataset
+    :param config_num: the number of the configuration
+    :param image_num: position of the image in the configuration
+    :return: seed for np.random.seed
+    """
+    return [seed, config_num, image_num, 1]
+
+def _draw_user_dist_inputs(parser, config_dict, configurations, bands):
+    """
+    Draw the values of the USERDIST files for the objects
+
+    :param parser: the Parser of the configuration
+    :param config_dict: the configuration dictionary
+    :param configurations: list of the configurations
+    :param bands: list of the bands
+    :return: force_param_inputs: dict mapping (configuration, param_name, band) to the drawn values
+    """
+    forced_inputs = {}
+    # every configuration reads the draws by OBJID, so only the largest one sets the number needed
+    max_size = max([int(config_dict['DATASET']['PARAMETERS']['SIZE'] * v['FRACTION']) for v in config_dict['GEOMETRY'].values()])
+
+    for fp in parser.file_paths:
+        filename = parser.config_dict.get_keypath(fp + '.FILENAME')
+        mode = parser.config_dict.get_keypath(fp + '.MODE')
+        try:
+            step = parser.config_dict.get_keypath(fp + '.STEP')
+        except KeyError:
+            step = 10
+        draw_param_names, draw_param_values = draw_from_user_dist(filename, max_size, mode, step)
+        forced_inputs[filename] = {'names': draw_param_names, 'values': draw_param_values}
+
+    return _get_forced_sim_inputs(forced_inputs, configurations, bands)
+
+def _background_indices(im_dir, image_bank_size, sim_inputs, configuration, bands):
+    """
+    Choose the image background of each image. The epochs of a time series object use the same background
+
+    :param im_dir: directory of the image backgrounds
+    :param image_bank_size: number of image backgrounds
+    :param sim_inputs: the image infos of the configuration, in order
+    :param configuration: like 'CONFIGURATION_1'
+    :param bands: list of the bands
+    :return: background_indices: array with the index of the background of each image
+    """
+    image_indices = organize_image_backgrounds(im_dir, image_bank_size, [_flatten_image_info(sim_input) for sim_input in sim_inputs], configuration)
+    objids = np.array([sim_input[bands[0]]['OBJID'] for sim_input in sim_inputs])
+    # objects are numbered in the order they appear
+    object_nums = np.cumsum(np.append(0, objids[1:] != objids[:-1]))
+    return image_indices[object_nums]
+
+def _render_configuration(organizer, configuration, sim_inputs, image_generator, seed, bands,
+                          image_backgrounds=None, background_indices=None, skip=None, first_image_num=0):
+    """
+    Generate the images of a configuration one at a time
+
+    :param organizer: the Organizer of the dataset
+    :param configuration: like 'CONFIGURATION_1'
+    :param sim_inputs: the image infos of the configuration from the Organizer, in order
+    :param image_generator: an ImageGenerator instance
+    :param seed: the SEED of the dataset
+    :param bands: list of the bands
+    :param image_backgrounds: a BackgroundBank if the configuration uses image backgrounds
+    :param background_indices: the index of the background of each image from _background_indices
+    :param skip: function of the image number and the OBJID that is True for images that should not be generated
+    :param first_image_num: position of the first image of sim_inputs in the configuration, when sim_inputs are the images of a shard
+    :yield: image_num, result: the position of the image and a tuple (image, planes, metadata row), or None for skipped images.
+        planes is None unless the image generator returns planes
+    """
+    configuration_plan = organizer.plan.configurations[configuration]
+    config_num = int(configuration.split('_')[-1])
+    background_objid, background_rng = None, None
+    for image_num, image_info in enumerate(sim_inputs, first_image_num):
+        objid = image_info[bands[0]]['OBJID']
+        if skip is not None and skip(image_num, objid):
+            yield image_num, None
+            continue
+
+        # Add background image index to image_info
+        image_idx = background_indices[image_num - first_image_num] if background_indices is not None else 0
+        for band in bands:
+            image_info[band]['BACKGROUND_IDX'] = image_idx
+
+        # make the image, with noise drawn from the image's own seed so that shards match a single run
+        np.random.seed(_image_seed(seed, config_num, image_num))
+        simulated_image_data = image_generator.sim_image(image_info, configuration_plan.profiles, organizer.image_positions[configuration].get(objid))
+
+        # Add the image background, with Poisson noise drawn from the object's own random state.
+        # The epochs of an object are consecutive, so only the current object's state is kept
+        if image_backgrounds is not None:
+            if objid != background_objid:
+                background_objid, background_rng = objid, np.random.RandomState([seed, config_num, objid])
+            image_background = image_backgrounds[image_idx]
+            simulated_image_data['output_image'] = simulated_image_data['output_image'] + background_rng.poisson(np.where(image_background > 0, image_background, 1.e-3))
+
+        planes = None
+        if image_generator.return_planes:
+            planes = np.array([simulated_image_data['output_lens_plane'],
+                               simulated_image_data['output_source_plane'],
+                               simulated_image_data['output_point_source_plane'],
+                               simulated_image_data['output_noise_plane']])
+
+        # Add any additional metadata to the image info
+        if len(simulated_image_data['additional_metadata']) != 0:
+            for info in simulated_image_data['additional_metadata']:
+                band = info['PARAM_NAME'].split('-')[-1]
+                param = '-'.join(info['PARAM_NAME'].split('-')[0:-1])
+                image_info[band][param] = info['PARAM_VALUE']
+
+        if image_generator.solve_lens_equation:
+            for band in bands:
+                image_info[band]['x_mins'] = np.array(simulated_image_data['x_mins'])
+                image_info[band]['y_mins'] = np.array(simulated_image_data['y_mins'])
+                image_info[band]['num_source_images'] = simulated_image_data['num_source_images']
+
+        yield image_num, (simulated_image_data['output_image'], planes, _flatten_image_info(image_info))
+    return
+
 def make_dataset(config, dataset=None, save_to_disk=False, store_in_memory=True,
                  verbose=False, store_sample=False, image_file_format='npy',
                  survey=None, return_planes=False, skip_image_generation=False,
-                 solve_lens_equation=False):
+                 solve_lens_equation=False, hdf5_compression=None, metadata_format=None,
+                 shard_index=0, num_shards=1, checkpoint_size=None, resume=False, revalidate=False):
     """
     Generate a dataset from a config file.
 
+    The noise of each image is drawn from a random state seeded by the SEED, the configuration,
+    and the position of the image, so an image is the same in every shard and in a resumed run.
+    Datasets made with earlier versions drew the noise of all images from the single global
+    random state, so their images do not match those made with the same SEED by this version.
+    The simulation inputs are drawn as before and are unchanged.
+
     Args:
         config (str or dict): name of yaml file specifying dataset characteristics or pre-parsed yaml file as dictionary
         verbose (bool, optional, default=False): print progress and status  updates at runtime
         store_in_memory (bool, optional, default=True): save images and metadata as attributes 
         save_to_disk (bool, optional, default=False): save images and metadata to disk   
         store_sample (bool, optional, default=False): save five images and metadata as attribute 
-        image_file_format (str, optional, default='npy'): outfile format type, options include ('npy', 'h5')
+        image_file_format (str, optional, default='npy'): outfile format type, options include ('npy', 'h5', 'hdf5'). 'hdf5' writes the images, planes, and metadata of all configurations to {OUTDIR}/{NAME}.hdf5
         survey (str or None, optional, default=None): a default astronomical survey to use 
         return_planes (bool, optional, default=False): return the lens, source, noise, and point source planes of the simulated images
         skip_image_generation (bool, optional, default=False): skip image generation
         solve_lens_equation (bool, optional, default=False): calculate the source positions
+        hdf5_compression (str or None, optional, default=None): compression of the 'hdf5' format, options include ('lzf', 'gzip')
+        metadata_format (str or None, optional, default=None): metadata file format when not using the 'hdf5' format, options include ('csv', 'parquet', 'feather', 'npz'). 'parquet' and 'feather' require pyarrow and fall back to 'npz'. If None, 'parquet' is used when pyarrow is installed and 'npz' otherwise
+        shard_index (int, optional, default=0): the part of the dataset to generate when splitting it into num_shards parts
+        num_shards (int, optional, default=1): number of parts to split the dataset into. Each shard generates the images of its own range of OBJIDs of every configuration into {OUTDIR}/shard_{shard_index}. Every shard still draws the simulation inputs of all objects, so that an object gets the same inputs in every shard, but only keeps the inputs of its own objects and only generates their images. Combine the shards with merge_shards()
+        checkpoint_size (int or None, optional, default=None): save the images in chunks of this many images to {OUTDIR}/checkpoint while they are generated, so that an interrupted run can be continued with resume=True. The chunks are written while the next images are generated. Requires save_to_disk=True
+        resume (bool, optional, default=False): continue an interrupted run with the same configuration and arguments from its last saved chunks
+        revalidate (bool, optional, default=False): check the configuration for errors even if it passed the checks before
         
     Returns:
         dataset (Dataset): and instance of the Dataset class
@@ -289,11 +519,19 @@ def make_dataset(config, dataset=None, save_to_disk=False, store_in_memory=True,
     Raises:
         RuntimeError: If `skip_image_generation == True` and `solve_lens_equation == True`
         RuntimeError: If `survey` is not a valid survey name
+        RuntimeError: If `shard_index` is not between 0 and `num_shards` - 1
+        RuntimeError: If `checkpoint_size` or `resume` are used without `save_to_disk == True` and a `checkpoint_size`
         
     """
 
     if solve_lens_equation and skip_image_generation:
         raise RuntimeError("You cannot skip image generation and solve the lens equation")
+    if not 0 <= shard_index < num_shards:
+        raise RuntimeError("shard_index={0} must be between 0 and num_shards - 1 = {1}".format(shard_index, num_shards - 1))
+    if (checkpoint_size is not None or resume) and not (save_to_disk and checkpoint_size is not None):
+        raise RuntimeError("Checkpoints require save_to_disk=True and a checkpoint_size")
+    if metadata_format is None:
+        metadata_format = default_metadata_format()
     
     if dataset is None:
         dataset = Dataset()
@@ -304,7 +542,7 @@ def make_dataset(config, dataset=None, save_to_disk=False, store_in_memory=True,
     dataset.arguments = dict(**locals())
 
     if isinstance(config, dict):
-        dataset.config_dict = config
+        dataset.config_dict = config if isinstance(config, KeyPathDict) else KeyPathDict(config, keypath_separator='.')
     else:    
         # Store config file
         dataset.config_file = config
@@ -312,7 +550,7 @@ def make_dataset(config, dataset=None, save_to_disk=False, store_in_memory=True,
         # Parse the config file and store config dict
         if not _check_survey(survey):
             raise RuntimeError("survey={0} is not a valid survey.".format(survey))
-        parser = Parser(config, survey=survey)
+        parser = Parser(config, survey=survey, revalidate=revalidate)
         dataset.config_dict = parser.config_dict
 
     # store parser
@@ -322,234 +560,496 @@ def make_dataset(config, dataset=None, save_to_disk=False, store_in_memory=True,
     dataset.name = dataset.config_dict['DATASET']['NAME']
     dataset.size = dataset.config_dict['DATASET']['PARAMETERS']['SIZE']
     dataset.outdir = dataset.config_dict['DATASET']['PARAMETERS']['OUTDIR']
+    if num_shards > 1:
+        dataset.outdir = '{0}/shard_{1}'.format(dataset.outdir, shard_index)
     dataset.bands = dataset.config_dict['SURVEY']['PARAMETERS']['BANDS'].split(',')
     try:
         dataset.seed = int(dataset.config_dict['DATASET']['PARAMETERS']["SEED"])
     except KeyError:
         dataset.seed = random.randint(0, 100)
+
+    # An interrupted run is continued with its own seed, so every random draw is repeated exactly
+    checkpoint = None
+    if checkpoint_size is not None and not skip_image_generation:
+        key = {'CONFIGURATION': dataset.config_dict, 'CHUNK_SIZE': checkpoint_size, 'SHARD': [shard_index, num_shards],
+               'RETURN_PLANES': return_planes, 'SOLVE_LENS_EQUATION': solve_lens_equation}
+        checkpoint = Checkpoint('{0}/checkpoint'.format(dataset.outdir), key, dataset.seed, resume)
+        dataset.seed = checkpoint.seed
     np.random.seed(dataset.seed)
     random.seed(dataset.seed)
 
     # Make the output directory if it doesn't exist already
+    writer, hdf5_writer, image_backgrounds = None, None, None
     if save_to_disk:
         if not os.path.exists(dataset.outdir):
-            os.mkdir(dataset.outdir)
+            os.makedirs(dataset.outdir)
 
-    # Store configurations
-    dataset.configurations = list(dataset.config_dict['GEOMETRY'].keys())
+        # Writes happen on their own thread while the next images are generated. The outputs of a
+        # configuration are submitted once all its images are made, so they overlap with the next
+        # configuration. Within a configuration, only the checkpoint chunks are written as they finish
+        writer = BackgroundWriter()
 
-    # If user-specified distributions exist, draw from them
-    forced_inputs = {}
-    max_size = dataset.size * 100 # maximum 100 epochs if timeseries
+        # All configurations share one file in the hdf5 format
+        if image_file_format == 'hdf5':
+            hdf5_writer = HDF5Writer('{0}/{1}.hdf5'.format(dataset.outdir, dataset.name), compression=hdf5_compression, mode='w')
 
-    for fp in parser.file_paths:
-        filename = eval("parser.config_dict['" + fp.replace('.', "']['") + "']" + "['FILENAME']")
-        mode = eval("parser.config_dict['" + fp.replace('.', "']['") + "']" + "['MODE']")
-        try:
-            step = eval("parser.config_dict['" + fp.replace('.', "']['") + "']" + "['STEP']")
-        except KeyError:
-            step = 10
-        draw_param_names, draw_param_values = draw_from_user_dist(filename, max_size, mode, step)
-        forced_inputs[filename] = {'names': draw_param_names, 'values': draw_param_values}
+    try:
+        # Store configurations
+        dataset.configurations = list(dataset.config_dict['GEOMETRY'].keys())
 
-        
-    # Overwrite the configuration dict with any forced values from user distribtuions
-    force_param_inputs = _get_forced_sim_inputs(forced_inputs, dataset.configurations, dataset.bands)
+        # If user-specified distributions exist, draw from them
+        force_param_inputs = _draw_user_dist_inputs(parser, dataset.config_dict, dataset.configurations, dataset.bands)
 
-    # Organize the configuration dict
-    organizer = Organizer(dataset.config_dict, forced_inputs=force_param_inputs, verbose=verbose)
-    dataset.organizer = organizer
+        # Organize the configuration dict
+        organizer = Organizer(dataset.config_dict, forced_inputs=force_param_inputs, verbose=verbose)
+        dataset.organizer = organizer
 
-    # Store species map
-    dataset.species_map = organizer._species_map
+        # Store species map
+        dataset.species_map = organizer._species_map
                     
-    # Skip image generation if desired
-    if skip_image_generation:
-        # Handle metadata and return dataset object
-        for configuration, sim_inputs in organizer.configuration_sim_dicts.items():
-            metadata = [_flatten_image_info(image_info) for image_info in sim_inputs]
-            metadata_df = pd.DataFrame(metadata)
-            del metadata
+        # Every shard draws the inputs of all objects, so each object gets the same inputs in every shard
+        objid_ranges = {configuration: _objid_range(int(dataset.size * dataset.config_dict['GEOMETRY'][configuration]['FRACTION']), shard_index, num_shards)
+                        for configuration in dataset.configurations}
+
+        # Skip image generation if desired
+        if skip_image_generation:
+            # Handle metadata and return dataset object
+            for configuration, sim_inputs in organizer.configuration_sim_dicts.items():
+                start, stop = objid_ranges[configuration]
+                metadata = MetadataWriter(organizer.plan.configurations[configuration].metadata_columns(dataset.bands))
+                for image_info in sim_inputs:
+                    if start <= image_info[dataset.bands[0]]['OBJID'] < stop:
+                        metadata.append(_flatten_image_info(image_info))
+                if metadata.num_rows == 0:
+                    continue
+                metadata_df = metadata.to_frame()
+                del metadata
+                if save_to_disk:
+                    if image_file_format == 'hdf5':
+                        writer.submit(hdf5_writer.append, configuration, metadata_df)
+                    else:
+                        writer.submit(MetadataWriter.write, metadata_df, '{0}/{1}_metadata'.format(dataset.outdir, configuration), metadata_format)
+                if store_in_memory:
+                    setattr(dataset, '{0}_metadata'.format(configuration), metadata_df)
             if save_to_disk:
-                metadata_df.to_csv('{0}/{1}_metadata.csv'.format(dataset.outdir, configuration), index=False)
-            if store_in_memory:
-                setattr(dataset, '{0}_metadata'.format(configuration), metadata_df)
-        return dataset
+                if image_file_format == 'hdf5':
+                    writer.submit(hdf5_writer.close)
+                writer.close()
+            return dataset
                 
-    # Initialize the ImageGenerator
-    ImGen = ImageGenerator(return_planes, solve_lens_equation)
+        # Initialize the ImageGenerator
+        ImGen = ImageGenerator(return_planes, solve_lens_equation)
 
-    # Handle image backgrounds if they exist
-    if len(parser.image_paths) > 0:
-        im_dir = parser.config_dict['BACKGROUNDS']["PATH"]
-        image_backgrounds = read_images(im_dir, parser.config_dict['IMAGE']['PARAMETERS']['numPix'], dataset.bands)
-    else:
-        image_backgrounds = np.zeros((len(dataset.bands), parser.config_dict['IMAGE']['PARAMETERS']['numPix'], parser.config_dict['IMAGE']['PARAMETERS']['numPix']))[np.newaxis,:]
+        # Handle image backgrounds if they exist
+        if len(parser.image_paths) > 0:
+            im_dir = parser.config_dict['BACKGROUNDS']["PATH"]
+            image_backgrounds = BackgroundBank(im_dir, parser.config_dict['IMAGE']['PARAMETERS']['numPix'], dataset.bands)
+        else:
+            image_backgrounds = np.zeros((len(dataset.bands), parser.config_dict['IMAGE']['PARAMETERS']['numPix'], parser.config_dict['IMAGE']['PARAMETERS']['numPix']))[np.newaxis,:]
 
-    # Clear the sim_dicts out of memory
-    if not os.path.exists(dataset.outdir):
-        os.system('mkdir ' + dataset.outdir)
-        
-    for configuration in dataset.configurations:
-        np.save("{0}/{1}_sim_dicts.npy".format(dataset.outdir, configuration), {0: organizer.configuration_sim_dicts[configuration]}, allow_pickle=True)
-        del organizer.configuration_sim_dicts[configuration]
+        # Clear the sim_dicts out of memory
+        if not os.path.exists(dataset.outdir):
+            os.makedirs(dataset.outdir)
         
-    # Simulate images
-    #for configuration, sim_inputs in organizer.configuration_sim_dicts.items():
-    for configuration in dataset.configurations:
-        sim_inputs = np.load("{0}/{1}_sim_dicts.npy".format(dataset.outdir, configuration), allow_pickle=True).item()[0]
+        background_indices, first_image_nums = {}, {}
+        for configuration in dataset.configurations:
+            sim_inputs = organizer.configuration_sim_dicts[configuration]
 
-        if verbose:
-            print("Generating images for {0}".format(configuration))
-            start_time = time.time()
-            counter = 0
-            total = len(sim_inputs)
+            # Choose the backgrounds from all objects before any image is made, so every shard chooses the same ones
+            if len(parser.image_paths) > 0 and configuration in parser.image_configurations:
+                background_indices[configuration] = _background_indices(im_dir, len(image_backgrounds), sim_inputs, configuration, dataset.bands)
+
+            # Only keep the images of the objects of this shard, which are consecutive
+            start, stop = objid_ranges[configuration]
+            shard_image_nums = [image_num for image_num, sim_input in enumerate(sim_inputs) if start <= sim_input[dataset.bands[0]]['OBJID'] < stop]
+            first_image_num = shard_image_nums[0] if len(shard_image_nums) > 0 else 0
+            first_image_nums[configuration] = first_image_num
+            if configuration in background_indices:
+                background_indices[configuration] = background_indices[configuration][first_image_num:first_image_num + len(shard_image_nums)]
+            np.save("{0}/{1}_sim_dicts.npy".format(dataset.outdir, configuration), {0: sim_inputs[first_image_num:first_image_num + len(shard_image_nums)]}, allow_pickle=True)
+            del sim_inputs
+            del organizer.configuration_sim_dicts[configuration]
+        
+        # Simulate images
+        #for configuration, sim_inputs in organizer.configuration_sim_dicts.items():
+        for configuration in dataset.configurations:
+            sim_inputs = np.load("{0}/{1}_sim_dicts.npy".format(dataset.outdir, configuration), allow_pickle=True).item()[0]
+            first_image_num, last_image_num = first_image_nums[configuration], first_image_nums[configuration] + len(sim_inputs) - 1
 
-        # Handle image backgrounds if they exist
-        real_image_indices = []
-        if len(parser.image_paths) > 0 and configuration in parser.image_configurations:
-            image_indices = organize_image_backgrounds(im_dir, len(image_backgrounds), [_flatten_image_info(sim_input) for sim_input in sim_inputs], configuration)
-        else:
-            image_indices = np.zeros(len(sim_inputs), dtype=int)
-            
-        metadata, images = [], []
-        if return_planes:
-            planes = []
-
-        objid_bkg_map = {}
-        img_counter, prev_objid = 0, sim_inputs[0][dataset.bands[0]]['OBJID']
-        for image_info in sim_inputs:
-            # track progress if verbose
             if verbose:
-                counter += 1
-                if counter % 50 == 0:
-                    progress = counter / total * 100
-                    elapsed_time = time.time() - start_time
-                    sys.stdout.write('\r\tProgress: %.1f %%  ---  Elapsed Time: %s' %(progress, _format_time(elapsed_time)))
-                    sys.stdout.flush()
-            
+                print("Generating images for {0}".format(configuration))
+                start_time = time.time()
+                counter = 0
+                total = len(sim_inputs)
 
-            # Check if the objid already has an image_idx in use
-            if image_info[dataset.bands[0]]['OBJID'] != prev_objid:
-                img_counter += 1
-            image_idx_ = image_indices[img_counter]
-            if image_info[dataset.bands[0]]['OBJID'] in objid_bkg_map:
-                image_idx = objid_bkg_map[image_info[dataset.bands[0]]['OBJID']]
-            else:
-                image_idx = image_idx_
-                objid_bkg_map[image_info[dataset.bands[0]]['OBJID']] = image_idx
+            metadata, images = MetadataWriter(organizer.plan.configurations[configuration].metadata_columns(dataset.bands)), []
+            if return_planes:
+                planes = []
 
-            prev_objid = image_info[dataset.bands[0]]['OBJID']
-            real_image_indices.append(image_idx)
+            # Leave the chunks finished by an interrupted run
+            skip = lambda image_num, objid: checkpoint is not None and checkpoint.is_complete(configuration, image_num // checkpoint_size)
+            chunk_start, chunk_rows = 0, []
+            for image_num, result in _render_configuration(organizer, configuration, sim_inputs, ImGen, dataset.seed, dataset.bands,
+                                                           image_backgrounds if configuration in background_indices else None,
+                                                           background_indices.get(configuration), skip, first_image_num):
+                # track progress if verbose
+                if verbose:
+                    counter += 1
+                    if counter % 50 == 0:
+                        progress = counter / total * 100
+                        elapsed_time = time.time() - start_time
+                        sys.stdout.write('\r\tProgress: %.1f %%  ---  Elapsed Time: %s' %(progress, _format_time(elapsed_time)))
+                        sys.stdout.flush()
 
-            
-            # Add background image index to image_info
-            for band in dataset.bands:
-                image_info[band]['BACKGROUND_IDX'] = image_idx
-                
-            # make the image
-            simulated_image_data = ImGen.sim_image(image_info)
-            if not return_planes:
-                images.append(simulated_image_data['output_image'])
-            else:
-                images.append(simulated_image_data['output_image'])
-                planes.append(np.array([simulated_image_data['output_lens_plane'],
-                                        simulated_image_data['output_source_plane'],
-                                        simulated_image_data['output_point_source_plane'],
-                                        simulated_image_data['output_noise_plane']]))
-
-            # Add any additional metadata to the image info
-            if len(simulated_image_data['additional_metadata']) != 0:
-                for info in simulated_image_data['additional_metadata']:
-                    band = info['PARAM_NAME'].split('-')[-1]
-                    param = '-'.join(info['PARAM_NAME'].split('-')[0:-1])
-                    image_info[band][param] = info['PARAM_VALUE']
-
-            if solve_lens_equation:
-                for band in dataset.bands:
-                    image_info[band]['x_mins'] = ';'.join([str(x) for x in simulated_image_data['x_mins']])
-                    image_info[band]['y_mins'] = ';'.join([str(x) for x in simulated_image_data['y_mins']])
-                    image_info[band]['num_source_images'] = simulated_image_data['num_source_images']
-                              
-            # Save metadata for each simulated image 
-            metadata.append(_flatten_image_info(image_info))
-
-            # update the progress if in verbose mode
-            if verbose:
-                elapsed_time = time.time() - start_time
-                if counter == len(sim_inputs):
-                    sys.stdout.write('\r\tProgress: 100.0 %%  ---  Elapsed Time: %s\n' %(_format_time(elapsed_time)))
-                    sys.stdout.flush()
+                # Use the chunks saved by an interrupted run
+                if checkpoint is not None:
+                    chunk_num = image_num // checkpoint_size
+                    if image_num % checkpoint_size == 0 or image_num == first_image_num:
+                        chunk_start, chunk_rows = len(images), []
+                        if checkpoint.is_complete(configuration, chunk_num):
+                            chunk = checkpoint.load(configuration, chunk_num)
+                            images.extend(chunk['images'])
+                            if return_planes:
+                                planes.extend(chunk['planes'])
+                            for row in chunk['rows']:
+                                metadata.append(row)
+
+                # Save metadata for each simulated image 
+                if result is not None:
+                    image, image_planes, row = result
+                    images.append(image)
+                    if return_planes:
+                        planes.append(image_planes)
+                    metadata.append(row)
+                    chunk_rows.append(row)
+
+                # Save each chunk when it is finished
+                if checkpoint is not None and (image_num % checkpoint_size == checkpoint_size - 1 or image_num == last_image_num):
+                    if not checkpoint.is_complete(configuration, chunk_num):
+                        writer.submit(checkpoint.save, configuration, chunk_num, images[chunk_start:],
+                                      planes[chunk_start:] if return_planes else None, chunk_rows)
 
-        # Clear sim_inputs out of memory
-        del sim_inputs
+                # update the progress if in verbose mode
+                if verbose:
+                    elapsed_time = time.time() - start_time
+                    if counter == len(sim_inputs):
+                        sys.stdout.write('\r\tProgress: 100.0 %%  ---  Elapsed Time: %s\n' %(_format_time(elapsed_time)))
+                        sys.stdout.flush()
+
+            # Clear sim_inputs out of memory
+            del sim_inputs
+
+            # Small configurations can have no objects in a shard
+            if len(images) == 0:
+                continue
                     
-        # Group images -- the array index will correspond to the id_num of the metadata
-        configuration_images = np.array(images)
+            # Group images -- the array index will correspond to the id_num of the metadata
+            configuration_images = np.array(images)
 
-        # Group planes if requested
-        if return_planes:
-            configuration_planes = np.array(planes)
+            # Group planes if requested
+            if return_planes:
+                configuration_planes = np.array(planes)
 
-        # Add image backgrounds -- will just add zeros if no backgrounds have been specified
-        if len(parser.image_paths) > 0 and configuration in parser.image_configurations:
-            additive_image_backgrounds = image_backgrounds[np.array(real_image_indices)]
-            additive_image_backgrounds = np.random.poisson(np.where(additive_image_backgrounds > 0, additive_image_backgrounds, 1.e-3 ))
-        else:
-            temp_array = np.zeros((len(dataset.bands), parser.config_dict['IMAGE']['PARAMETERS']['numPix'], parser.config_dict['IMAGE']['PARAMETERS']['numPix']))[np.newaxis,:]
-            additive_image_backgrounds = temp_array[np.array(real_image_indices)]
+            # Convert the metadata to a dataframe
+            metadata_df = metadata.to_frame()
+            del metadata
 
+            # Index the epochs of each object in a time series
+            time_series = getattr(organizer, configuration + '_time_series')
+            if time_series:
+                epoch_objids, epoch_offsets = epoch_index(metadata_df['OBJID-' + dataset.bands[0]].values)
 
-        configuration_images += additive_image_backgrounds
-        
-        # Convert the metadata to a dataframe
-        metadata_df = pd.DataFrame(metadata)
-        del metadata
+            # Save the images and metadata to the outdir if desired (ideal for large simulation production)
+            if save_to_disk:
+                #Images
+                if image_file_format == 'npy':
+                    writer.submit(np.save, '{0}/{1}_images.npy'.format(dataset.outdir, configuration), configuration_images)
+                    if return_planes:
+                        writer.submit(np.save, '{0}/{1}_planes.npy'.format(dataset.outdir, configuration), configuration_planes)
+                elif image_file_format == 'h5':
+                    writer.submit(save_h5, '{0}/{1}_images.h5'.format(dataset.outdir, configuration), dataset.name, configuration_images)
+                    if return_planes:
+                        writer.submit(save_h5, '{0}/{1}_planes.h5'.format(dataset.outdir, configuration), dataset.name, configuration_planes)
+                elif image_file_format == 'hdf5':
+                    writer.submit(hdf5_writer.append, configuration, metadata_df, configuration_images,
+                                  configuration_planes if return_planes else None)
+                else:
+                    print("ERROR: {0} is not a supported argument for image_file_format".format(image_file_format))
+                #Metadata
+                if image_file_format != 'hdf5':
+                    writer.submit(MetadataWriter.write, metadata_df, '{0}/{1}_metadata'.format(dataset.outdir, configuration), metadata_format)
+                #Epochs
+                if time_series:
+                    if image_file_format == 'hdf5':
+                        writer.submit(hdf5_writer.write_epoch_index, configuration, epoch_objids, epoch_offsets)
+                    else:
+                        writer.submit(np.savez, '{0}/{1}_epoch_index.npz'.format(dataset.outdir, configuration), objid=epoch_objids, offsets=epoch_offsets)
 
-        # Save the images and metadata to the outdir if desired (ideal for large simulation production)
-        if save_to_disk:
-            #Images
-            if image_file_format == 'npy':
-                np.save('{0}/{1}_images.npy'.format(dataset.outdir, configuration), configuration_images)
+            # Store the images and metadata to the Dataset object (ideal for small scale testing)
+            if store_in_memory:
+                setattr(dataset, '{0}_images'.format(configuration), configuration_images)
+                setattr(dataset, '{0}_metadata'.format(configuration), metadata_df)
                 if return_planes:
-                    np.save('{0}/{1}_planes.npy'.format(dataset.outdir, configuration), configuration_planes)
-            elif image_file_format == 'h5':
-                hf = h5py.File('{0}/{1}_images.h5'.format(dataset.outdir, configuration), 'w')
-                hf.create_dataset(dataset.name, data=configuration_images)
-                hf.close()
+                    setattr(dataset, '{0}_planes'.format(configuration), configuration_planes)
+                if time_series:
+                    setattr(dataset, '{0}_epoch_index'.format(configuration), {'objid': epoch_objids, 'offsets': epoch_offsets})
+            elif store_sample:
+                setattr(dataset, '{0}_images'.format(configuration), configuration_images[0:5].copy())
+                setattr(dataset, '{0}_metadata'.format(configuration), metadata_df.iloc[0:5].copy())
+                del configuration_images
+                del metadata_df                
                 if return_planes:
-                    hf = h5py.File('{0}/{1}_planes.h5'.format(dataset.outdir, configuration), 'w')
-                    hf.create_dataset(dataset.name, data=configuration_planes)
-                    hf.close()
+                    setattr(dataset, '{0}_planes'.format(configuration), configuration_planes[0:5].copy())
+                    del configuration_planes
             else:
-                print("ERROR: {0} is not a supported argument for image_file_format".format(image_file_format))
-            #Metadata
-            metadata_df.to_csv('{0}/{1}_metadata.csv'.format(dataset.outdir, configuration), index=False)
-
-        # Store the images and metadata to the Dataset object (ideal for small scale testing)
-        if store_in_memory:
-            setattr(dataset, '{0}_images'.format(configuration), configuration_images)
-            setattr(dataset, '{0}_metadata'.format(configuration), metadata_df)
-            if return_planes:
-                setattr(dataset, '{0}_planes'.format(configuration), configuration_planes)
-        elif store_sample:
-            setattr(dataset, '{0}_images'.format(configuration), configuration_images[0:5].copy())
-            setattr(dataset, '{0}_metadata'.format(configuration), metadata_df.iloc[0:5].copy())
-            del configuration_images
-            del metadata_df                
-            if return_planes:
-                setattr(dataset, '{0}_planes'.format(configuration), configuration_planes[0:5].copy())
-                del configuration_planes
-        else:
-            # Clean up things that are done to save space
-            del configuration_images
-            del metadata_df
-            if return_planes:
-                del configuration_planes
+                # Clean up things that are done to save space
+                del configuration_images
+                del metadata_df
+                if return_planes:
+                    del configuration_planes
+
+        if save_to_disk:
+            if image_file_format == 'hdf5':
+                writer.submit(hdf5_writer.close)
+            writer.close()
 
+        # The outputs are complete, so the run no longer needs to be continued
+        if checkpoint is not None:
+            checkpoint.remove()
+    finally:
+        # Finish the submitted writes and close the files even if generation fails, so the chunks
+        # saved so far can be used by resume=True. An error raised by a write is raised here
+        if isinstance(image_backgrounds, BackgroundBank):
+            image_backgrounds.close()
+        if writer is not None:
+            try:
+                writer.close()
+            finally:
+                if hdf5_writer is not None:
+                    hdf5_writer.close()
                 
     return dataset
 
+
+def merge_shards(outdir):
+    """
+    Combine the shards written by make_dataset with num_shards > 1 into the files a single
+    run would have written. Images, planes, metadata, and epoch indices of each configuration
+    are concatenated in shard order and written to outdir in the format of the shards.
+    Images and planes are copied one shard at a time, so they never all need to be in memory.
+
+    Args:
+        outdir (str): the OUTDIR of the dataset, containing the shard_{i} directories
+
+    Returns:
+        dataset (Dataset): the merged dataset, opened with Dataset.load()
+    """
+    shard_dirs = sorted([x for x in os.listdir(outdir) if x.startswith('shard_')], key=lambda x: int(x.split('_')[-1]))
+    shards = [Dataset.load('{0}/{1}'.format(outdir, x)) for x in shard_dirs]
+    configurations = sorted(set(itertools.chain(*[x.configurations for x in shards])), key=lambda x: int(x.split('_')[-1]))
+
+    hdf5_files = [x for x in os.listdir('{0}/{1}'.format(outdir, shard_dirs[0])) if x.endswith('.hdf5')]
+    if len(hdf5_files) > 0:
+        images = [getattr(x, '{0}_images'.format(c)) for x in shards for c in x.configurations if hasattr(x, '{0}_images'.format(c))]
+        hdf5_writer = HDF5Writer('{0}/{1}'.format(outdir, hdf5_files[0]), compression=images[0].compression if len(images) > 0 else None, mode='w')
+
+    for configuration in configurations:
+        parts = [x for x in shards if configuration in x.configurations]
+        metadata = [getattr(x, '{0}_metadata'.format(configuration)) for x in parts]
+
+        # Epoch indices, shifted by the images of the earlier shards
+        time_series = all([hasattr(x, '{0}_epoch_index'.format(configuration)) for x in parts])
+        if time_series:
+            indices = [getattr(x, '{0}_epoch_index'.format(configuration)) for x in parts]
+            sizes = [x['offsets'][-1] for x in indices]
+            epoch_objids = np.concatenate([x['objid'] for x in indices])
+            epoch_offsets = np.append(np.concatenate([x['offsets'][:-1] + shift for x, shift in zip(indices, np.cumsum([0] + sizes[:-1]))]), sum(sizes))
+
+        if len(hdf5_files) > 0:
+            for shard, shard_metadata in zip(parts, metadata):
+                images, planes = [getattr(shard, '{0}_{1}'.format(configuration, kind), None) for kind in ['images', 'planes']]
+                hdf5_writer.append(configuration, shard_metadata.read(),
+                                   images[()] if images is not None else None,
+                                   planes[()] if planes is not None else None)
+            if time_series:
+                hdf5_writer.write_epoch_index(configuration, epoch_objids, epoch_offsets)
+            continue
+
+        #Images and planes
+        for kind in ['images', 'planes']:
+            if not hasattr(parts[0], '{0}_{1}'.format(configuration, kind)):
+                continue
+            arrays = [getattr(x, '{0}_{1}'.format(configuration, kind)) for x in parts]
+            shape = (sum([len(x) for x in arrays]),) + arrays[0].shape[1:]
+            if isinstance(arrays[0], np.ndarray):
+                merged = np.lib.format.open_memmap('{0}/{1}_{2}.npy'.format(outdir, configuration, kind), mode='w+', dtype=arrays[0].dtype, shape=shape)
+            else:
+                hf = h5py.File('{0}/{1}_{2}.h5'.format(outdir, configuration, kind), 'w')
+                merged = hf.create_dataset(arrays[0].name.strip('/'), shape=shape, dtype=arrays[0].dtype)
+            position = 0
+            for array in arrays:
+                merged[position:position + len(array)] = array[()] if not isinstance(array, np.ndarray) else array
+                position += len(array)
+            if isinstance(arrays[0], np.ndarray):
+                merged.flush()
+                del merged
+            else:
+                hf.close()
+
+        #Metadata
+        metadata_file = '{0}/{1}'.format(outdir, os.path.basename(metadata[0].filename))
+        if metadata_file.endswith('.csv') and len(set([tuple(x.columns) for x in metadata])) == 1:
+            # copy the rows as text so that values are written exactly as in the shards
+            with open(metadata_file, 'w') as outfile:
+                for idx, shard_metadata in enumerate(metadata):
+                    with open(shard_metadata.filename, 'r') as infile:
+                        header = infile.readline()
+                        if idx == 0:
+                            outfile.write(header)
+                        shutil.copyfileobj(infile, outfile)
+        else:
+            name, extension = os.path.splitext(metadata_file)
+            MetadataWriter.write(pd.concat([x.read() for x in metadata], ignore_index=True, sort=False), name, extension[1:])
+
+        #Epochs
+        if time_series:
+            np.savez('{0}/{1}_epoch_index.npz'.format(outdir, configuration), objid=epoch_objids, offsets=epoch_offsets)
+
+    if len(hdf5_files) > 0:
+        hdf5_writer.close()
+    return Dataset.load(outdir)
+
+# make_dataset arguments that control how the dataset is stored, or that skip the images or add planes, which stream_dataset does not accept
+STREAM_UNSUPPORTED_ARGS = ('dataset', 'save_to_disk', 'store_in_memory', 'store_sample', 'image_file_format', 'metadata_format',
+                           'hdf5_compression', 'shard_index', 'num_shards', 'checkpoint_size', 'resume', 'skip_image_generation',
+                           'return_planes')
+
+def _stream_worker(parser, worker_id, num_workers, base_seed, batch_size, queue, solve_lens_equation=False, verbose=False):
+    """
+    Organize the dataset with a new seed each round and put its images and metadata on a queue
+    as soon as each batch is generated. Only the simulation inputs of a round and one batch of
+    images are held in memory, and nothing is written to disk.
+
+    :param parser: a Parser of the configuration
+    :param worker_id: index of this worker
+    :param num_workers: number of workers, used to give every round of every worker its own seed
+    :param base_seed: the SEED of the configuration
+    :param batch_size: number of images put on the queue at a time
+    :param queue: multiprocessing queue to put (images, metadata) on, or an error message
+    :param solve_lens_equation: passed from the make_dataset arguments of stream_dataset
+    :param verbose: passed from the make_dataset arguments of stream_dataset
+    """
+    try:
+        config_dict = parser.config_dict
+        bands = config_dict['SURVEY']['PARAMETERS']['BANDS'].split(',')
+        configurations = list(config_dict['GEOMETRY'].keys())
+        image_generator = ImageGenerator(solve_lens_equation=solve_lens_equation)
+        if len(parser.image_paths) > 0:
+            im_dir = config_dict['BACKGROUNDS']['PATH']
+            image_backgrounds = BackgroundBank(im_dir, config_dict['IMAGE']['PARAMETERS']['numPix'], bands)
+
+        images, metadata_parts = [], []
+        for round_num in itertools.count():
+            # seed the round like make_dataset, so a round is the dataset make_dataset generates with its SEED
+            seed = (base_seed + 1 + round_num * num_workers + worker_id) % 2**32
+            config_dict.set_keypath('DATASET.PARAMETERS.SEED', seed)
+            np.random.seed(seed)
+            random.seed(seed)
+            organizer = Organizer(config_dict, forced_inputs=_draw_user_dist_inputs(parser, config_dict, configurations, bands),
+                                  verbose=verbose, cache_lightcurves=False)
+
+            for configuration in configurations:
+                sim_inputs = organizer.configuration_sim_dicts.pop(configuration)
+                use_backgrounds = len(parser.image_paths) > 0 and configuration in parser.image_configurations
+                background_indices = _background_indices(im_dir, len(image_backgrounds), sim_inputs, configuration, bands) if use_backgrounds else None
+                columns = organizer.plan.configurations[configuration].metadata_columns(bands)
+                metadata = MetadataWriter(columns)
+                for _, (image, _, row) in _render_configuration(organizer, configuration, sim_inputs, image_generator, seed, bands,
+                                                                image_backgrounds if use_backgrounds else None, background_indices):
+                    images.append(image)
+                    metadata.append(row)
+                    if len(images) == batch_size:
+                        metadata_parts.append(metadata.to_frame())
+                        queue.put((np.array(images), pd.concat(metadata_parts, ignore_index=True, sort=False)))
+                        images, metadata_parts, metadata = [], [], MetadataWriter(columns)
+
+                # a batch can continue with the next configuration
+                if metadata.num_rows > 0:
+                    metadata_parts.append(metadata.to_frame())
+                del sim_inputs
+    except Exception:
+        queue.put(traceback.format_exc())
+    return
+
+def stream_dataset(config, batch_size=32, num_batches=None, num_workers=1, prefetch=2, survey=None, **make_dataset_args):
+    """
+    Generate batches of images on the fly, without storing a dataset in memory or on disk.
+    Worker processes repeatedly draw the simulation inputs of the whole dataset described by
+    the configuration, each time with a new seed, and put each batch on a queue as soon as its
+    images are generated. A round makes the images make_dataset makes with its seed. With more
+    than one worker, the order of the batches depends on which worker finishes first.
+
+    Args:
+        config (str): name of yaml file specifying dataset characteristics
+        batch_size (int, optional, default=32): number of images per batch
+        num_batches (int or None, optional, default=None): number of batches to yield, unlimited if None
+        num_workers (int, optional, default=1): number of worker processes
+        prefetch (int, optional, default=2): number of generated batches waiting to be yielded before the workers pause
+        survey (str or None, optional, default=None): a default astronomical survey to use
+        make_dataset_args (dict): additional arguments for make_dataset, like solve_lens_equation. Arguments
+            that control how the dataset is stored, like save_to_disk, skip_image_generation, and return_planes are not accepted
+
+    Yields:
+        images: np.array with shape (batch_size, bands, numPix, numPix)
+        metadata: pandas.DataFrame with one row per image. The CONFIGURATION_LABEL columns identify the configuration
+
+    Raises:
+        RuntimeError: if a worker fails
+        RuntimeError: If `survey` is not a valid survey name
+        RuntimeError: If make_dataset_args contains an argument in STREAM_UNSUPPORTED_ARGS
+    """
+    unsupported_args = [x for x in make_dataset_args.keys() if x in STREAM_UNSUPPORTED_ARGS]
+    if len(unsupported_args) > 0:
+        raise RuntimeError("stream_dataset does not accept the make_dataset arguments {0}".format(', '.join(unsupported_args)))
+    if not _check_survey(survey):
+        raise RuntimeError("survey={0} is not a valid survey.".format(survey))
+    parser = Parser(config, survey=survey, revalidate=make_dataset_args.pop('revalidate', False))
+
+    try:
+        base_seed = int(parser.config_dict['DATASET']['PARAMETERS']["SEED"])
+    except KeyError:
+        base_seed = random.randint(0, 100)
+
+    context = multiprocessing.get_context()
+    queue = context.Queue(maxsize=prefetch)
+    workers = [context.Process(target=_stream_worker, daemon=True, kwargs=make_dataset_args,
+                               args=(parser, worker_id, num_workers, base_seed, batch_size, queue))
+               for worker_id in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        images, metadata, batch_num = None, None, 0
+        while num_batches is None or batch_num < num_batches:
+            # collect generated batches until a full batch is available
+            while images is None or len(images) < batch_size:
+                item = queue.get()
+                if isinstance(item, str):
+                    raise RuntimeError("A stream_dataset worker failed:\n" + item)
+                if images is None:
+                    images, metadata = item
+                else:
+                    images = np.concatenate((images, item[0]))
+                    metadata = pd.concat((metadata, item[1]), ignore_index=True)
+
+            yield images[:batch_size], metadata.iloc[:batch_size].reset_index(drop=True)
+            images, metadata = images[batch_size:], metadata.iloc[batch_size:]
+            batch_num += 1
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+
     
 if __name__ == "__main__":
     pass
@@ -34,7 +34,52 @@ class ImageGenerator():
         return
 
 
-    def parse_single_band_info_dict(self, sim_dict, cosmo, band='g'):
+    @staticmethod
+    def solve_image_positions(solutions, lens_model_class, lens_model_list, kwargs_lens_model_list,
+                              ra_source, dec_source, pixel_scale, num_pix):
+        """
+        Find the images of a point source, reusing the solution if this lens and source have been solved before
+
+        Args:
+            solutions (dict): image positions already solved, new solutions are added to it
+            lens_model_class (LensModel): lenstronomy LensModel instance for the lens
+            lens_model_list (list): names of the lens model profiles
+            kwargs_lens_model_list (list): lensing kwargs of the lens model profiles
+            ra_source (float): ra of the point source in the source plane
+            dec_source (float): dec of the point source in the source plane
+            pixel_scale (float): pixel scale of the image
+            num_pix (int): number of pixels on a side of the image
+
+        Returns:
+            x_image, y_image: arrays of the image positions
+        """
+        key = repr((lens_model_list, kwargs_lens_model_list, ra_source, dec_source, pixel_scale, num_pix))
+        if key not in solutions:
+            lensEquationSolver = LensEquationSolver(lens_model_class)
+            solutions[key] = lensEquationSolver.findBrightImage(ra_source,
+                                                                dec_source,
+                                                                kwargs_lens_model_list,
+                                                                numImages=4, # max number of images
+                                                                min_distance=pixel_scale,
+                                                                search_window=num_pix * pixel_scale)
+        return solutions[key]
+
+
+    @staticmethod
+    def _profile_params(sim_dict, profile_prefix, profiles=None):
+        """
+        Get the parameters and values of a profile
+
+        :param sim_dict: one band of the flattened image info
+        :param profile_prefix: i.e. "PLANE_1-OBJECT_2-LIGHT_PROFILE_1-"
+        :param profiles: ConfigurationPlan.profiles listing the keys of each profile, or None to search the keys
+        :return: parameter dictionary for profile
+        """
+        if profiles is None or profile_prefix not in profiles:
+            return select_params(sim_dict, profile_prefix)
+        return {param: sim_dict[key] for param, key in profiles[profile_prefix]}
+
+    def parse_single_band_info_dict(self, sim_dict, cosmo, band='g', profiles=None):
         """
         Convert a dictionary from input_reader.Organizer.breakup() to lenstronomy function calls
 
@@ -42,6 +87,7 @@ class ImageGenerator():
             info_dict (dict): One band of a single element from the list produced interanlly by input_reader.Organizer.breakup().
                 Contains all the properties of a single image to generate in one band.
             cosmo (astropy.cosmology): An astropy.cosmology instance
+            profiles (dict or None, optional, default=None): ConfigurationPlan.profiles of the configuration, the parameters of profiles it does not list, or of all profiles if None, are found by searching the keys
         Returns:
             kwargs_single_band, kwargs_model, kwargs_numerics, kwargs_lens_light_list, kwargs_source_list, kwargs_point_source_list, kwargs_lens_model_list, output_metadata
         """
@@ -132,11 +178,11 @@ class ImageGenerator():
                     for light_profile_num in range(1, sim_dict[prefix + 'NUMBER_OF_LIGHT_PROFILES'] +1):
                         kwargs_model['lens_light_model_list'].append(sim_dict[prefix + 'LIGHT_PROFILE_{0}-NAME'.format(light_profile_num)])
                         #kwargs_model['lens_redshift_list'].append(sim_dict[prefix + 'REDSHIFT'])
-                        kwargs_lens_light_list.append(select_params(sim_dict, prefix + 'LIGHT_PROFILE_{0}-'.format(light_profile_num)))
+                        kwargs_lens_light_list.append(self._profile_params(sim_dict, prefix + 'LIGHT_PROFILE_{0}-'.format(light_profile_num), profiles))
                     for mass_profile_num in range(1, sim_dict[prefix + 'NUMBER_OF_MASS_PROFILES'] +1):
                         kwargs_model['lens_model_list'].append(sim_dict[prefix + 'MASS_PROFILE_{0}-NAME'.format(mass_profile_num)])
                         kwargs_model['lens_redshift_list'].append(sim_dict[prefix + 'REDSHIFT'])
-                        mass_params = select_params(sim_dict, prefix + 'MASS_PROFILE_{0}-'.format(mass_profile_num))
+                        mass_params = self._profile_params(sim_dict, prefix + 'MASS_PROFILE_{0}-'.format(mass_profile_num), profiles)
                         kwargs_lens_model_list.append(mass_params)
                         if 'sigma_v' in mass_params.keys(): # save simga_v locations so that we can calculate theta_E for the metadata
                             output_metadata.append({'PARAM_NAME':  prefix + 'MASS_PROFILE_{0}-sigma_v-{1}'.format(mass_profile_num, band),
@@ -145,8 +191,7 @@ class ImageGenerator():
                     for shear_profile_num in range(1, sim_dict[prefix + 'NUMBER_OF_SHEAR_PROFILES'] +1):
                         kwargs_model['lens_model_list'].append(sim_dict[prefix + 'SHEAR_PROFILE_{0}-NAME'.format(shear_profile_num)])
                         kwargs_model['lens_redshift_list'].append(sim_dict[prefix + 'REDSHIFT'])
-                        mass_params = select_params(sim_dict, prefix + 'SHEAR_PROFILE_{0}-'.format(shear_profile_num))
-                        kwargs_lens_model_list.append(select_params(sim_dict, prefix + 'SHEAR_PROFILE_{0}-'.format(shear_profile_num)))
+                        kwargs_lens_model_list.append(self._profile_params(sim_dict, prefix + 'SHEAR_PROFILE_{0}-'.format(shear_profile_num), profiles))
                                                    
                 # Last Plane - treat as source
                 elif plane_num == sim_dict['NUMBER_OF_PLANES']:
@@ -154,7 +199,7 @@ class ImageGenerator():
                     for light_profile_num in range(1, sim_dict[prefix + 'NUMBER_OF_LIGHT_PROFILES'] +1):
                         kwargs_model['source_light_model_list'].append(sim_dict[prefix + 'LIGHT_PROFILE_{0}-NAME'.format(light_profile_num)])
                         kwargs_model['source_redshift_list'].append(sim_dict[prefix + 'REDSHIFT'])
-                        kwargs_source_list.append(select_params(sim_dict, prefix + 'LIGHT_PROFILE_{0}-'.format(light_profile_num)))
+                        kwargs_source_list.append(self._profile_params(sim_dict, prefix + 'LIGHT_PROFILE_{0}-'.format(light_profile_num), profiles))
                         
                 else:
                     # Should never get here
@@ -164,14 +209,19 @@ class ImageGenerator():
 
 
         
-    def sim_image(self, info_dict):
+    def sim_image(self, info_dict, profiles=None, image_positions=None):
         """
         Simulate an image based on specifications in sim_dict
         
         Args:
             info_dict (dict): A single element from the list produced interanlly by input_reader.Organizer.breakup(). 
                 Contains all the properties of a single image to generate.
+            profiles (dict or None, optional, default=None): ConfigurationPlan.profiles of the configuration, the parameters of profiles it does not list, or of all profiles if None, are found by searching the keys
+            image_positions (dict or None, optional, default=None): image positions of the object already solved by input_reader.Organizer for its time delays
         """
+        # the bands of an image share their lens equation solutions
+        solutions = {} if image_positions is None else dict(image_positions)
+
         output_image = []
         if self.return_planes:
             output_source, output_lens, output_point_source, output_noise = [], [], [], []
@@ -184,7 +234,7 @@ class ImageGenerator():
         for band, sim_dict in info_dict.items():
 
             # Parse the info dict
-            params = self.parse_single_band_info_dict(sim_dict, cosmo, band=band)
+            params = self.parse_single_band_info_dict(sim_dict, cosmo, band=band, profiles=profiles)
             kwargs_single_band = params[0]
             kwargs_model = params[1]
             kwargs_numerics = params[2]
@@ -225,7 +275,6 @@ class ImageGenerator():
 
 
             # solve for PS positions to incorporate time delays
-            lensEquationSolver = LensEquationSolver(lens_model_class)
             kwargs_ps = []
             for ps_idx, ps_mag in enumerate(kwargs_point_source_list):
 
@@ -246,12 +295,14 @@ class ImageGenerator():
                         amplitudes.append(ps[0]['source_amp'])
 
                     
-                    x_image, y_image = lensEquationSolver.findBrightImage(ps[0]['ra_source'],
-                                                                          ps[0]['dec_source'],
-                                                                          kwargs_lens_model_list,
-                                                                          numImages=4, # max number of images
-                                                                          min_distance=kwargs_single_band['pixel_scale'],
-                                                                          search_window=sim_dict['numPix'] * kwargs_single_band['pixel_scale'])
+                    x_image, y_image = self.solve_image_positions(solutions,
+                                                                  lens_model_class,
+                                                                  kwargs_model['lens_model_list'],
+                                                                  kwargs_lens_model_list,
+                                                                  ps[0]['ra_source'],
+                                                                  ps[0]['dec_source'],
+                                                                  kwargs_single_band['pixel_scale'],
+                                                                  sim_dict['numPix'])
                     magnification = lens_model_class.magnification(x_image, y_image, kwargs=kwargs_lens_model_list)
                     #amplitudes = np.array(amplitudes) * np.abs(magnification)
                     amplitudes = np.array([a * m for a, m in zip(amplitudes, magnification)])
@@ -304,7 +355,7 @@ class ImageGenerator():
             for noise_source_num in range(1, sim_dict['NUMBER_OF_NOISE_SOURCES'] + 1):
                 image_noise += self._generate_noise(sim_dict['NOISE_SOURCE_{0}-NAME'.format(noise_source_num)],
                                                     np.shape(image),
-                                                    select_params(sim_dict, 'NOISE_SOURCE_{0}-'.format(noise_source_num)))
+                                                    self._profile_params(sim_dict, 'NOISE_SOURCE_{0}-'.format(noise_source_num), profiles))
             image += image_noise
                 
             # Combine with other bands
@@ -1,17 +1,21 @@
 """Parse a user configuration file."""
 
-import copy
+import glob
+import hashlib
+import json
 import random
 import os
 import sys
 import yaml
 
 from astropy.cosmology import FlatLambdaCDM
+import lenstronomy
 from lenstronomy.Analysis.td_cosmography import TDCosmography
 from lenstronomy.SimulationAPI.sim_api import SimAPI
 import numpy as np
 import pandas as pd
 
+from deeplenstronomy import __version__
 import deeplenstronomy.timeseries as timeseries
 from deeplenstronomy.utils import dict_select, dict_select_choose, draw_from_user_dist, KeyPathDict, read_cadence_file
 import deeplenstronomy.distributions as distributions
@@ -19,6 +23,12 @@ import deeplenstronomy.special as special
 import deeplenstronomy.surveys as surveys
 import deeplenstronomy.check as big_check
 import deeplenstronomy.image_generator as image_generator
+import deeplenstronomy.plan as plan
+
+# number of light curve libraries kept in {OUTDIR}/lightcurves
+LIGHTCURVE_CACHE_SIZE = 64
+# time series models whose light curves are calculated from an sed and can be interpolated in redshift
+SED_MODELS = ['ia', 'cc', 'kn', 'user']
 
 class Parser():
     """ 
@@ -26,22 +36,23 @@ class Parser():
 
     """
 
-    def __init__(self, config, survey=None):
+    def __init__(self, config, survey=None, revalidate=False):
         """
         Args: 
             config (str): name of yaml configuration file
             survey (str or None, optional, default=None): Automatically passed from deeplenstronomy.make_dataset() args
+            revalidate (bool, optional, default=False): run the checks even if the configuration passed them before
         """
         
         # Check for annoying tabs - there's probably a better way to do this
         self._parse_for_tabs(config)
 
-        # Fill in sections of the configuration file for a specific survey
-        if survey is not None:
-            config = self.write_survey(config, survey)
-        
         # Read main configuration file
         self.full_dict = self.read(config)
+
+        # Fill in sections of the configuration file for a specific survey
+        if survey is not None:
+            self.apply_survey(survey)
         
         # If the main file points to any input files, read those too
         self._get_input_locations()
@@ -52,37 +63,21 @@ class Parser():
         self._get_image_locations()
         
         # Check for user errors in inputs
-        self.check()
+        self.check(revalidate)
 
         return
 
 
-    def write_survey(self, config, survey):
+    def apply_survey(self, survey):
         """
-        Writes survey information to config file. Creates a new file named {survey}_{config}
-        by copying the contents of {config} and appending the IMAGE and SURVEY sections for 
-        a desired survey. The yaml parser will automatically overwrite the IMAGE and SURVEY
-        dictionary keys.
+        Overwrites the IMAGE and SURVEY sections of the configuration with the settings
+        of a desired survey. The configuration file on disk is left untouched.
 
         Args:
-            config (str): name of yaml configuration file
-            survey (str or None, optional, default=None): Automatically passed from deeplenstronomy.make_dataset() args
-
-        Returns:
-            outfile (str): name of survey-specific configuration file
+            survey (str): name of a function in deeplenstronomy.surveys
         """
-        # set new config file name
-        config_basename = config.split('/')
-        if len(config_basename) == 1:
-            outfile = survey + '_' + config
-        else:
-            outfile = '/'.join(config_basename[0:-1]) + '/' + survey + '_' + config_basename[-1]
-
-        # write new config file
-        with open(config, 'r') as old, open(outfile, 'w+') as new:
-            new.writelines(old.readlines())
-            new.writelines(eval("surveys.{}()".format(survey)))
-        return outfile
+        self.full_dict.update(getattr(surveys, survey)())
+        return
     
     def _include_inputs(self):
         """
@@ -91,9 +86,9 @@ class Parser():
         config_dict = KeyPathDict(self.full_dict.copy(), keypath_separator='.')
         
         for input_path in self.input_paths:
-            input_dict = self.read(eval('config_dict["' + input_path.replace('.', '"]["') + '"]["INPUT"]'))
+            input_dict = self.read(config_dict.get_keypath(input_path + '.INPUT'))
             for k, v in input_dict.items():
-                exec('config_dict["' + input_path.replace('.', '"]["') + '"][k] = v')
+                config_dict.set_keypath(input_path.split('.') + [k], v)
 
         self.config_dict = config_dict
         return    
@@ -172,26 +167,109 @@ class Parser():
             sys.exit()
         return
     
-    def check(self):
+    def check(self, revalidate=False):
         """
-        Check configuration file for possible user errors.
+        Check configuration file for possible user errors. Configurations that passed before
+        are recorded in a cache directory and are not checked again unless the configuration,
+        its INPUT files, or the data files it points to have changed. Data files are compared
+        by their size and modification time only, so use revalidate=True after editing a file
+        in a way that keeps both.
+
+        The cache directory is the DEEPLENSTRONOMY_VALIDATION_CACHE environment variable if it
+        is set, or {OUTDIR}/validated otherwise. Setting the variable to an empty string turns
+        the cache off. A cache directory that cannot be read or created is treated as empty.
+
+        Args:
+            revalidate (bool, optional, default=False): run the checks even if the configuration passed them before
         """
+        cache_file = self._validation_cache_file()
+        if cache_file is not None and os.path.isfile(cache_file) and not revalidate:
+            return
+
         big_check._run_checks(self.full_dict, self.config_dict)
+        if cache_file is None:
+            return
+
+        # record the success, but never fail because the cache is not writable
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            open(cache_file, 'w').close()
+        except OSError:
+            pass
         
         return
+
+    def _validation_cache_file(self):
+        """
+        Find the file recording that this configuration passed the checks
+
+        :return: cache_file: path of the file, or None if the cache is turned off or the configuration has no OUTDIR
+        """
+        cache_dir = os.environ.get('DEEPLENSTRONOMY_VALIDATION_CACHE')
+        if cache_dir is None:
+            # the checks have not run yet, so the DATASET section may be missing or malformed
+            try:
+                cache_dir = os.path.join(str(self.full_dict['DATASET']['PARAMETERS']['OUTDIR']), 'validated')
+            except (KeyError, TypeError):
+                return None
+        if cache_dir == '':
+            return None
+
+        return os.path.join(cache_dir, self._validation_key())
+
+    def _validation_key(self):
+        """
+        Hash everything the checks depend on. The parsed configuration includes the contents of
+        INPUT files, and referenced files and directories (user distributions, backgrounds,
+        cadence files, filters) are represented by their size and modification time.
+
+        :return: key: hex digest identifying this configuration
+        """
+        def strings(d):
+            if isinstance(d, dict):
+                for v in d.values():
+                    yield from strings(v)
+            elif isinstance(d, list):
+                for v in d:
+                    yield from strings(v)
+            elif isinstance(d, str):
+                yield d
+
+        paths = sorted(set([x for x in strings(self.config_dict) if os.path.exists(x)] + ['filters']))
+        file_info = []
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            file_info.append((path, os.path.getsize(path), os.path.getmtime(path)))
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    stat = os.stat(os.path.join(path, name))
+                    file_info.append((path + '/' + name, stat.st_size, stat.st_mtime))
+
+        key_info = {'CONFIG': self.config_dict,
+                    'CWD': os.getcwd(),
+                    'FILES': file_info,
+                    'VERSIONS': [__version__, lenstronomy.__version__]}
+        return hashlib.sha1(json.dumps(key_info, sort_keys=True, default=str).encode('utf-8')).hexdigest()
     
 
 class Organizer():
-    def __init__(self, config_dict, forced_inputs={}, verbose=False):
+    def __init__(self, config_dict, forced_inputs={}, verbose=False, cache_lightcurves=True):
         """
         Break up config dict into individual simulation dicts.
         
         Args:
             config_dict (dict): an instance of Parser.config_dict
+            forced_inputs (dict, optional, default={}): maps (configuration, param_name, band) to arrays of USERDIST draws indexed by OBJID
             verbose (bool, optional, default=False): Automatically passed from deeplenstronomy.make_dataset() args
+            cache_lightcurves (bool, optional, default=True): read and write the light curve libraries in {OUTDIR}/lightcurves
         """
         self.main_dict = config_dict.copy()
         self.forced_inputs = forced_inputs
+        self.cache_lightcurves = cache_lightcurves
+        self._image_generator = image_generator.ImageGenerator()
+        # unit conversion and distances shared by the objects with the same lens models and redshifts
+        self._lens_setups = {}
         
         self.__track_species_keys()
         
@@ -268,25 +346,54 @@ class Organizer():
         :return: obj_string: the location of the object in the flattened dictionary
         """
 
-        d = KeyPathDict(self.main_dict['GEOMETRY'][configuration].copy(), keypath_separator='.')
+        d = KeyPathDict(self.main_dict['GEOMETRY'][configuration], keypath_separator='.')
         for x in d.keypaths():
-            f = "['" + "']['".join(x.split('.')) + "']"
-            k = eval("d" + f)
-            if k == obj_name:
+            if d.get_keypath(x) == obj_name:
                 return x.replace('.', '-')
 
-        #return [x.replace('.', '-') for x in d.keypaths() if eval("d['" + "']['".join(x.split('.')) + "']") == obj_name][0]
-
     
-    def _flatten_and_fill(self, config_dict, cosmo, inputs, objid=0):
+    def _fill_configuration(self, configuration_plan, cosmo, inputs):
+        """
+        Produce the inputs of every simulated object of a configuration. The slots are executed
+        for each object, then the SPECIAL magnitude offsets are subtracted from each affected
+        column of all objects at once, and finally the USERDIST draws are filled in.
+
+        :param configuration_plan: a plan.ConfigurationPlan instance from self.plan
+        :param cosmo: an astropy.cosmology instance
+        :param inputs: dict mapping (param_name, band) to arrays of USERDIST draws indexed by OBJID, or None
+        :return: output_dicts: list of the flattened and filled dictionary of each object
+        """
+        bands = list(self.plan.bands)
+        output_dicts = [self._flatten_and_fill(configuration_plan, cosmo, objid) for objid in range(configuration_plan.size)]
+
+        for keys, offsets in configuration_plan.special_offsets:
+            for band, offset in zip(bands, offsets):
+                for key in keys:
+                    values = np.array([output_dict[band][key] for output_dict in output_dicts], dtype=float) - offset
+                    for output_dict, value in zip(output_dicts, values.tolist()):
+                        output_dict[band][key] = value
+
+        # Overwrite with any forced param inputs from USERDISTs
+        if inputs is not None:
+            for objid, output_dict in enumerate(output_dicts):
+                for (param_name, band), values in inputs.items():
+                    if param_name in output_dict[band]:
+                        output_dict[band][param_name] = values[objid]
+                    else:
+                        print("WARNING: " + param_name + " is not present in the simulated dataset and may produce unexpected behavior. Use dataset.search(<param name>) to find all expected names")
+
+        return output_dicts
+
+    def _flatten_and_fill(self, configuration_plan, cosmo, objid=0):
         """
-        Flatten input dictionary, and sample from any specified distributions
+        Execute the slots of a configuration plan to produce the inputs of one simulated object
         
-        :param config_dict: dictionary built up by self.breakup()
+        :param configuration_plan: a plan.ConfigurationPlan instance from self.plan
         :param cosmo: an astropy.cosmology instance
+        :param objid: the OBJID of the object
         :return: flattened_and_filled dictionary: dict ready for individual image sim
         """
-        bands = config_dict['SURVEY_DICT']['BANDS'].split(',')
+        bands = list(self.plan.bands)
         output_dict = {x: {} for x in bands}
 
         #Object IDs
@@ -298,231 +405,83 @@ class Organizer():
             pointing = random.choice(list(set(self.cadence_dict.keys()) - set(['REFERENCE_MJD'])))
             for band in bands:
                 output_dict[band]['POINTING'] = pointing
-        
-        #COSMOLOGY
-        for k, v in config_dict['COSMOLOGY_DICT'].items():
-            if v != 'DISTRIBUTION':
-                for band in bands:
-                    output_dict[band][k] = v
-            else:
-                draws = self._draw(self.main_dict['COSMOLOGY']['PARAMETERS'][k]['DISTRIBUTION'], bands)
-                for band, draw in zip(bands, draws):
-                    output_dict[band][k] = draw
 
-        #IMAGE
-        for k, v in config_dict['IMAGE_DICT'].items():
-            if v != 'DISTRIBUTION':
-                for band in bands:
-                    output_dict[band][k] = v
-            else:
-                draws = self._draw(self.main_dict['IMAGE']['PARAMETERS'][k]['DISTRIBUTION'], bands)
-                for band, draw in zip(bands, draws):
-                    output_dict[band][k] = draw
+        for slot in configuration_plan.slots:
+            kind = slot[0]
 
-        #SURVEY
-        for k, v in config_dict['SURVEY_DICT'].items():
-            if k == 'BANDS': 
-                continue
-            if v != 'DISTRIBUTION':
+            if kind == 'set':
                 for band in bands:
-                    output_dict[band][k] = v
-            else:
-                draws = self._draw(self.main_dict['SURVEY']['PARAMETERS'][k]['DISTRIBUTION'], bands)
-                for band, draw in zip(bands, draws):
-                    output_dict[band][k] = draw
+                    for key in slot[1]:
+                        output_dict[band][key] = slot[2]
 
-        #NOISE
-        for band in bands:
-            output_dict[band]['NUMBER_OF_NOISE_SOURCES'] = config_dict['NOISE_DICT']['NUMBER_OF_NOISE_SOURCES']
-        for noise_idx in range(config_dict['NOISE_DICT']['NUMBER_OF_NOISE_SOURCES']):
-            noise_source_num = noise_idx + 1
-            noise_name = config_dict['NOISE_DICT']['NOISE_SOURCE_{0}-NAME'.format(noise_source_num)]
-            for band in bands:
-                output_dict[band]['NOISE_SOURCE_{0}-NAME'.format(noise_source_num)] = noise_name
-            for k, v in self.main_dict['SPECIES'][self._species_map[noise_name]]['PARAMETERS'].items():
-                if isinstance(v, dict):
-                    draws = self._draw(v['DISTRIBUTION'], bands)
-                    for band, draw in zip(bands, draws):
-                        output_dict[band]['NOISE_SOURCE_{0}-{1}'.format(noise_source_num, k)] = draw
-                else:
-                    for band in bands:
-                        output_dict[band]['NOISE_SOURCE_{0}-{1}'.format(noise_source_num, k)] = v
-
-        #REAL OBJECTS
-        for k, v in config_dict['SIM_DICT'].items():
-            for band in bands:
-                output_dict[band][k] = v
-
-        for plane_idx in range(config_dict['SIM_DICT']['NUMBER_OF_PLANES']):
-            geometry_key = config_dict['SIM_DICT']['CONFIGURATION_LABEL']
-            plane_num = plane_idx + 1
+            elif kind == 'draw':
+                draws = slot[2](bands)
+                for band, draw in zip(bands, draws):
+                    for key in slot[1]:
+                        output_dict[band][key] = draw
 
-            #GEOMETRY
-            for k_param, v_param in self.main_dict['GEOMETRY'][geometry_key]['PLANE_{0}'.format(plane_num)]['PARAMETERS'].items():
-                if isinstance(v_param, dict):
-                    draws = self._draw(v_param['DISTRIBUTION'], bands)
+            elif kind == 'redshift':
+                draws = slot[2](bands) if isinstance(slot[2], plan.Sampler) else [slot[2]] * len(bands)
+                for band, draw in zip(bands, draws):
+                    output_dict[band][slot[3]] = draws[0]
+                    for key in slot[1]:
+                        output_dict[band][key] = draw
+
+            elif kind == 'point_source':
+                _, prefix, host, obj_name, hostid, redshift_key, sep_slot, sep_unit, angle_slot = slot
+                ra_host, dec_host = output_dict[bands[0]][hostid + '-LIGHT_PROFILE_1-center_x'], output_dict[bands[0]][hostid + '-LIGHT_PROFILE_1-center_y']
+
+                # Determine location of point source in image
+                if sep_slot is not None:
+                    sep = sep_slot[2](bands)[0] if sep_slot[0] == 'draw' else sep_slot[2]
+                    if angle_slot is not None:
+                        angle = angle_slot[2](bands)[0] if angle_slot[0] == 'draw' else angle_slot[2]
+                    else:
+                        angle = None
 
-                    # Set the PLANE's redshift in the config_dict
-                    if k_param == 'REDSHIFT':
-                        config_dict['SIM_DICT']['PLANE_{0}-REDSHIFT'.format(plane_num)] = draws[0]
-                    
-                    for band, draw in zip(bands, draws):
-                        for obj_num in range(1, config_dict['SIM_DICT']['PLANE_{0}-NUMBER_OF_OBJECTS'.format(plane_num)] + 1):
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-{2}'.format(plane_num, obj_num, k_param)] = draw
+                    ##convert image separation into ra and dec
+                    ra, dec = self._choose_position(ra_host, dec_host, sep, sep_unit, cosmo, output_dict[bands[0]].get(redshift_key), angle)
                 else:
-                    # Set the PLANE's redshift in the config_dict
-                    if k_param == 'REDSHIFT':
-                        config_dict['SIM_DICT']['PLANE_{0}-REDSHIFT'.format(plane_num)]	= v_param
-                    
-                    for band in bands:
-                        for obj_num in range(1, config_dict['SIM_DICT']['PLANE_{0}-NUMBER_OF_OBJECTS'.format(plane_num)] + 1):
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-{2}'.format(plane_num, obj_num, k_param)] = v_param
+                    #set ra and dec to host center
+                    ra, dec = ra_host, dec_host
+                    sep = 0.0
 
-            for obj_idx in range(config_dict['SIM_DICT']['PLANE_{0}-NUMBER_OF_OBJECTS'.format(plane_num)]):
-                obj_num = obj_idx + 1
-                obj_name = config_dict['SIM_DICT']['PLANE_{0}-OBJECT_{1}-NAME'.format(plane_num, obj_num)]
-                
-                #save number of profiles
                 for band in bands:
-                    output_dict[band]['PLANE_{0}-OBJECT_{1}-NUMBER_OF_LIGHT_PROFILES'.format(plane_num, obj_num)] = config_dict['SPECIES_DICT'][obj_name]['NUMBER_OF_LIGHT_PROFILES']
-                    output_dict[band]['PLANE_{0}-OBJECT_{1}-NUMBER_OF_SHEAR_PROFILES'.format(plane_num, obj_num)] = config_dict['SPECIES_DICT'][obj_name]['NUMBER_OF_SHEAR_PROFILES']
-                    output_dict[band]['PLANE_{0}-OBJECT_{1}-NUMBER_OF_MASS_PROFILES'.format(plane_num, obj_num)] = config_dict['SPECIES_DICT'][obj_name]['NUMBER_OF_MASS_PROFILES']
-
-                #SPECIES- Point Sources
-                if 'HOST' in self.main_dict['SPECIES'][self._species_map[obj_name]].keys():
-                    host = self.main_dict['SPECIES'][self._species_map[obj_name]]['HOST']
-                    if host != 'Foreground':
-                        # Get host center
-                        possible_hostids = ['PLANE_{0}-OBJECT_{1}-NAME'.format(plane_num, x) for x in range(1, config_dict['SIM_DICT']['PLANE_{0}-NUMBER_OF_OBJECTS'.format(plane_num)] + 1)]
-                        hostid = [x[0:-5] for x in possible_hostids if config_dict['SIM_DICT'][x] == host][0]
-                        ra_host, dec_host = output_dict[bands[0]][hostid + '-LIGHT_PROFILE_1-center_x'], output_dict[bands[0]][hostid + '-LIGHT_PROFILE_1-center_y']
-                        
-                        # Determine location of point source in image
-                        if 'sep' in self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS'].keys():
-                            sep_unit = self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['sep_unit']
-                            if isinstance(self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['sep'], dict):
-                                draws = self._draw(self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['sep']['DISTRIBUTION'], bands)
-                                sep = draws[0]
-                            else:
-                                sep = self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['sep']
-
-                            if 'angle' in self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS'].keys():    
-                                if isinstance(self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['angle'], dict):
-                                    draws = self._draw(self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['angle']['DISTRIBUTION'], bands)
-                                    angle = draws[0]
-                                else:
-                                    angle = self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['angle']
-                            else:
-                                angle = None
-                                
-                            ##convert image separation into ra and dec
-                            ra, dec = self._choose_position(ra_host, dec_host, sep, sep_unit, cosmo, config_dict['SIM_DICT']['PLANE_{0}-REDSHIFT'.format(plane_num)], angle)
-
-                        else:
-                            #set ra and dec to host center
-                            ra, dec = ra_host, dec_host
-                            sep = 0.0
-                            sep_unit = 'arcsec'
-
-                        for band in bands:
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-HOST'.format(plane_num, obj_num)] = self.main_dict['SPECIES'][self._species_map[obj_name]]['HOST']
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-NAME'.format(plane_num, obj_num)] = obj_name
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-ra'.format(plane_num, obj_num)] = ra
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-dec'.format(plane_num, obj_num)] = dec
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-sep'.format(plane_num, obj_num)] = sep
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-sep_unit'.format(plane_num, obj_num)] = sep_unit
-                    else:
-                        #foreground, choose position randomly
-                        im_size = self.main_dict['IMAGE']['PARAMETERS']['numPix'] * self.main_dict['IMAGE']['PARAMETERS']['pixel_scale'] / 2
-                        ra, dec = random.uniform(-1 * im_size, im_size), random.uniform(-1 * im_size, im_size)
-                        if isinstance(self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['magnitude'], dict):
-                            draws = self._draw(self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['magnitude']['DISTRIBUTION'], bands)
-                        else:
-                            draws = [self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS']['magnitude']] * len(bands)
-                        for band, magnitude in zip(bands, draws):
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-HOST'.format(plane_num, obj_num)] = 'Foreground'
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-NAME'.format(plane_num, obj_num)] = obj_name
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-ra_image'.format(plane_num, obj_num)] = ra
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-dec_image'.format(plane_num, obj_num)] = dec
-                            output_dict[band]['PLANE_{0}-OBJECT_{1}-magnitude'.format(plane_num, obj_num)] = magnitude
-                        
-                        
+                    output_dict[band][prefix + 'HOST'] = host
+                    output_dict[band][prefix + 'NAME'] = obj_name
+                    output_dict[band][prefix + 'ra'] = ra
+                    output_dict[band][prefix + 'dec'] = dec
+                    output_dict[band][prefix + 'sep'] = sep
+                    output_dict[band][prefix + 'sep_unit'] = sep_unit
+
+            elif kind == 'foreground':
+                #foreground, choose position randomly
+                _, prefix, obj_name, im_size, magnitude_slot = slot
+                ra, dec = random.uniform(-1 * im_size, im_size), random.uniform(-1 * im_size, im_size)
+                if magnitude_slot[0] == 'draw':
+                    draws = magnitude_slot[2](bands)
                 else:
-                     for band in bands:
-                        output_dict[band]['PLANE_{0}-OBJECT_{1}-HOST'.format(plane_num, obj_num)] = 'None'
-
-                #SPECIES- Light Profiles
-                for light_profile_idx in range(config_dict['SPECIES_DICT'][obj_name]['NUMBER_OF_LIGHT_PROFILES']):
-                    light_profile_num = light_profile_idx + 1
-                    for band in bands:
-                        output_dict[band]['PLANE_{0}-OBJECT_{1}-LIGHT_PROFILE_{2}-NAME'.format(plane_num, obj_num, light_profile_num)] = self.main_dict['SPECIES'][self._species_map[obj_name]]['LIGHT_PROFILE_{0}'.format(light_profile_num)]['NAME']
-                    for k_param, v_param in self.main_dict['SPECIES'][self._species_map[obj_name]]['LIGHT_PROFILE_{0}'.format(light_profile_num)]['PARAMETERS'].items():
-                        if isinstance(v_param, dict):
-                            draws = self._draw(v_param['DISTRIBUTION'], bands)
-                            for band, draw in zip(bands, draws):
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-LIGHT_PROFILE_{2}-{3}'.format(plane_num, obj_num, light_profile_num, k_param)] = draw
-                        else:
-                            for band in bands:
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-LIGHT_PROFILE_{2}-{3}'.format(plane_num, obj_num, light_profile_num, k_param)] = v_param
-
-                #SPECIES- Mass Profiles
-                for mass_profile_idx in range(config_dict['SPECIES_DICT'][obj_name]['NUMBER_OF_MASS_PROFILES']):
-                    mass_profile_num = mass_profile_idx + 1
-                    for band in bands:
-                        output_dict[band]['PLANE_{0}-OBJECT_{1}-MASS_PROFILE_{2}-NAME'.format(plane_num, obj_num, mass_profile_num)] = self.main_dict['SPECIES'][self._species_map[obj_name]]['MASS_PROFILE_{0}'.format(mass_profile_num)]['NAME']
-                    for k_param, v_param in self.main_dict['SPECIES'][self._species_map[obj_name]]['MASS_PROFILE_{0}'.format(mass_profile_num)]['PARAMETERS'].items():
-                        if isinstance(v_param, dict):
-                            draws = self._draw(v_param['DISTRIBUTION'], bands)
-                            for band, draw in zip(bands, draws):
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-MASS_PROFILE_{2}-{3}'.format(plane_num, obj_num, mass_profile_num, k_param)] = draw
-                        else:
-                            for band in bands:
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-MASS_PROFILE_{2}-{3}'.format(plane_num, obj_num, mass_profile_num, k_param)] = v_param
-
-                #SPECIES- Shear Profiles
-                for shear_profile_idx in range(config_dict['SPECIES_DICT'][obj_name]['NUMBER_OF_SHEAR_PROFILES']):
-                    shear_profile_num = shear_profile_idx + 1
-                    for band in bands:
-                        output_dict[band]['PLANE_{0}-OBJECT_{1}-SHEAR_PROFILE_{2}-NAME'.format(plane_num, obj_num, shear_profile_num)] = self.main_dict['SPECIES'][self._species_map[obj_name]]['SHEAR_PROFILE_{0}'.format(shear_profile_num)]['NAME']
-                    for k_param, v_param in self.main_dict['SPECIES'][self._species_map[obj_name]]['SHEAR_PROFILE_{0}'.format(shear_profile_num)]['PARAMETERS'].items():
-                        if isinstance(v_param, dict):
-                            draws = self._draw(v_param['DISTRIBUTION'], bands)
-                            for band, draw in zip(bands, draws):
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-SHEAR_PROFILE_{2}-{3}'.format(plane_num, obj_num, shear_profile_num, k_param)] = draw
-                        else:
-                            for band in bands:
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-SHEAR_PROFILE_{2}-{3}'.format(plane_num, obj_num, shear_profile_num, k_param)] = v_param
-
-                #SPECIES- Additional Parameters
-                if 'PARAMETERS' in self.main_dict['SPECIES'][self._species_map[obj_name]].keys():
-                    for k_param, v_param in self.main_dict['SPECIES'][self._species_map[obj_name]]['PARAMETERS'].items():
-                        if k_param == 'sep':
-                            #sampling for point source separation is already done, so don't overwrite it
-                            continue
-                        if isinstance(v_param, dict):
-                            draws = self._draw(v_param['DISTRIBUTION'], bands)
-                            for band, draw in zip(bands, draws):
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-{2}'.format(plane_num, obj_num, k_param)] = draw
-                        else:
-                            for band in bands:
-                                output_dict[band]['PLANE_{0}-OBJECT_{1}-{2}'.format(plane_num, obj_num, k_param)] = v_param
+                    draws = [magnitude_slot[2]] * len(bands)
+                for band, magnitude in zip(bands, draws):
+                    output_dict[band][prefix + 'HOST'] = 'Foreground'
+                    output_dict[band][prefix + 'NAME'] = obj_name
+                    output_dict[band][prefix + 'ra_image'] = ra
+                    output_dict[band][prefix + 'dec_image'] = dec
+                    output_dict[band][prefix + 'magnitude'] = magnitude
 
-                #SPECIES- Special
-                if 'SPECIAL' in self.main_dict['SPECIES'][self._species_map[obj_name]].keys():
-                    for mode, args in self.main_dict['SPECIES'][self._species_map[obj_name]]['SPECIAL'].items():
-                        for arg in args:
-                            output_dict = eval('special.{0}(output_dict, "{1}", bands=bands)'.format(mode.lower(), arg))
+            elif kind == 'special':
+                for band, offset in zip(bands, slot[2]):
+                    for key in slot[1]:
+                        output_dict[band][key] = output_dict[band][key] - offset
 
+            elif kind == 'special_function':
+                keys = [set(output_dict[band].keys()) for band in bands]
+                output_dict = getattr(special, slot[1])(output_dict, slot[2], bands=bands)
 
-        # Overwrite with any forced param inputs from USERDISTs
-        if inputs is not None:
-            
-            for (param_name, band) in inputs.index.values:
-            
-                if param_name in output_dict[band]:
-                    output_dict[band][param_name] = inputs[(param_name, band)]
-                else:
-                    print("WARNING: " + param_name + " is not present in the simulated dataset and may produce unexpected behavior. Use dataset.search(<param name>) to find all expected names")
+                # the parameters of profiles that gained or lost keys are found by searching the keys
+                changed = set().union(*[x.symmetric_difference(output_dict[band].keys()) for x, band in zip(keys, bands)])
+                for profile_prefix in [x for x in configuration_plan.profiles if any([key.startswith(x) for key in changed])]:
+                    del configuration_plan.profiles[profile_prefix]
 
 
 #        for force_param, values in self.forced_inputs.items():
@@ -547,97 +506,70 @@ class Organizer():
         return output_dict
 
 
-    def _flatten_and_fill_time_series(self, config_dict, cosmo, configuration, obj_strings, objid, peakshift, inputs):
+    def _flatten_and_fill_time_series(self, configuration_plan, configuration, obj_strings, peakshift, base_output_dict, td_dict):
         """
         Generate an image info dictionary for each step in the time series
 
-        :param config_dict: dictionary built up by self.breakup()
+        :param configuration_plan: a plan.ConfigurationPlan instance from self.plan
         :param configuration: CONFIGURATION_1, CONFIGURATION_2, etc.
         :param obj_string: list of the strings targetting the object in the flattened dictionary (e.g. ['PLANE_2-OBJECT_2'])
         :param peakshifts: int or float in units of NITES to shift the peak
+        :param base_output_dict: the flattened and filled dictionary of the object from _flatten_and_fill
+        :param td_dict: the time delays of the object from _time_delays
         :return: flattened_and_filled dictionary: dict ready for individual image sim  
         """
         
         output_dicts = []
         bands = self.main_dict['SURVEY']['PARAMETERS']['BANDS'].split(',')
-        # Get flattened and filled dictionary
-        base_output_dict = self._flatten_and_fill(config_dict, cosmo, inputs, objid)
-
-        # Model the lens for time delay calculations
-        td_dict = {}
-        for obj_string in obj_strings:
-            td_dict[obj_string] = None
-            plane_num = int(obj_string.split('_')[1].split('-')[0])
-            if plane_num >= 2:
-                im_gen = image_generator.ImageGenerator(self.main_dict['SURVEY']['PARAMETERS']['BANDS'])
-                params = im_gen.parse_single_band_info_dict(base_output_dict[bands[0]], cosmo)
-                kwargs_lens_model_list = params[6]
-                kwargs_model = params[1]
-                kwargs_point_source_list = params[5] 
-                # use sim API in case sigma_v is used for mass profiles
-                sim = SimAPI(numpix=self.main_dict['IMAGE']['PARAMETERS']['numPix'],
-                         kwargs_single_band=params[0],
-                         kwargs_model=kwargs_model)
-                kwargs_lens_model_list = sim.physical2lensing_conversion(kwargs_mass=kwargs_lens_model_list)
-
-                try:
-                    z_lens = kwargs_model['lens_redshift_list'][0]
-                    z_source = kwargs_model['z_source']
-                    td_cosmo = TDCosmography(z_lens, z_source, kwargs_model, cosmo_fiducial=cosmo)
-                    td_dict[obj_string] = td_cosmo.time_delays(kwargs_lens_model_list, kwargs_point_source_list, kappa_ext=0).round().astype(int)
-                except IndexError:
-                    pass
         
         pointing = base_output_dict[bands[0]]['POINTING']
-        closest_redshift_lcs = []
+        interpolate_redshift = self.main_dict['GEOMETRY'][configuration]['TIMESERIES'].get('INTERPOLATE_REDSHIFT', False)
+        closest_redshift_lcs, weighted_lcs = [], []
         for obj_name, obj_string in zip(self.main_dict['GEOMETRY'][configuration]['TIMESERIES']['OBJECTS'], obj_strings):
-            # determine closest lc in library to redshift
+            # determine closest lc (or bracketing lcs) in library to redshift
             redshift = base_output_dict[bands[0]][obj_string + '-REDSHIFT']
             lcs = eval('self.{0}_{1}_lightcurves_{2}'.format(configuration, obj_name, pointing))
-            closest_redshift_lcs.append(lcs['library'][np.argmin(np.abs(redshift - lcs['redshifts']))])
-            
-        # overwrite the image sim dictionary
+            sed_model = self.main_dict['SPECIES'][self._species_map[obj_name]]['MODEL'].split('_')[0] in SED_MODELS
+            weighted_lcs.append(self._select_lightcurves(lcs, redshift, interpolate_redshift and sed_model))
+            closest_redshift_lcs.append(weighted_lcs[-1][0][0])
+
+        # evaluate the magnitudes on every (time-delay shifted) nite at once
         nite_dict = self.cadence_dict[pointing]
-        for nite_idx in range(len(nite_dict[bands[0]])):
+        epoch_info = []
+        for obj_string, lc_weights in zip(obj_strings, weighted_lcs):
+            td_shift = td_dict[obj_string]
+            if td_shift is None:
+                td_offsets = np.zeros(1)
+            else:
+                td_offsets = np.append(0.0, td_shift[1:] - td_shift[0])
+
+            band_info = {}
+            for band in bands:
+                # rows are nites and columns are lensed images; nites outside the sed are set to 99
+                shifted_nites = (np.array(nite_dict[band]) - peakshift)[:, np.newaxis] + td_offsets
+                band_info[band] = (shifted_nites, self._lightcurve_magnitudes(lc_weights, band, shifted_nites))
+            epoch_info.append(band_info)
+            
+        # overwrite the image sim dictionary, ordering the epochs by nite
+        for nite_idx in np.argsort(nite_dict[bands[0]], kind='stable'):
+            output_dict = {band: base_output_dict[band].copy() for band in bands}
             for band in bands:
                 orig_nite = nite_dict[band][nite_idx]
-                #for orig_nite in nite_dict[band]:
-                nite_ = orig_nite - peakshift
-                output_dict = base_output_dict.copy()
-                for obj_sting, closest_redshift_lc in zip(obj_strings, closest_redshift_lcs):
+                for obj_string, closest_redshift_lc, band_info in zip(obj_strings, closest_redshift_lcs, epoch_info):
+                    shifted_nites, mags = band_info[band]
 
                     # account for time delay
-                    td_shift = td_dict[obj_string]
-                    if td_shift is None:
-                        shifted_nites = [nite_]
-                    else:
-                        shifted_nites = [nite_] + [nite_ + x for x in list(td_shift[1:] - td_shift[0])]
-
-                    for idx, nite in enumerate(shifted_nites):
+                    for idx in range(shifted_nites.shape[1]):
 
                         if idx == 0:
                             suffix = ''
                         else:
                             suffix = f"_shift_{idx}"
 
-                        output_dict[band][obj_string + '-tdshift_' + str(idx)] = nite
-                            
-                        try:
-                            #try using the exact night
-                            output_dict[band][obj_string + '-magnitude' + suffix] = closest_redshift_lc['lc']['MAG'].values[(closest_redshift_lc['lc']['BAND'].values == band) & (closest_redshift_lc['lc']['NITE'].values == nite)][0] + fake_noise[noise_idx]
-                        except:
-                            band_df = closest_redshift_lc['lc'][closest_redshift_lc['lc']['BAND'].values == band].copy().reset_index(drop=True)
-                            # set mag to 99 if nite is outside the SED
-                            if nite < band_df['NITE'].values.min() or nite > band_df['NITE'].values.max():
-                                mag = 99.0
-                            # if nite is within bounds of SED, linearly interpolate
-                            else:
-                                closest_nite_indices = np.abs(nite - band_df['NITE'].values).argsort()[:2]
-                                mag = (band_df['MAG'].values[closest_nite_indices[1]] - band_df['MAG'].values[closest_nite_indices[0]]) * (nite - band_df['NITE'].values[closest_nite_indices[1]]) / (band_df['NITE'].values[closest_nite_indices[1]] - band_df['NITE'].values[closest_nite_indices[0]]) + band_df['MAG'].values[closest_nite_indices[1]]
-                                
-                            output_dict[band][obj_string + '-magnitude' + suffix] = mag
-                            output_dict[band][obj_string + '-magnitude_measured' + suffix] = np.random.normal(loc=mag, scale=0.03)
-                                
+                        mag = mags[nite_idx, idx]
+                        output_dict[band][obj_string + '-tdshift_' + str(idx)] = shifted_nites[nite_idx, idx]
+                        output_dict[band][obj_string + '-magnitude' + suffix] = mag
+                        output_dict[band][obj_string + '-magnitude_measured' + suffix] = np.random.normal(loc=mag, scale=0.03)
                         
                     output_dict[band][obj_string + '-nite'] = orig_nite
                     output_dict[band][obj_string + '-peaknite'] = peakshift
@@ -645,25 +577,267 @@ class Organizer():
                     output_dict[band][obj_string + '-type'] = closest_redshift_lc['obj_type']
 
                 # Use independent observing conditions for each nite if conditions are drawn from distributions
-                # seeing
-                if isinstance(self.main_dict["SURVEY"]["PARAMETERS"]["seeing"], dict):
-                    output_dict[band]["seeing"] = self._draw(self.main_dict["SURVEY"]["PARAMETERS"]["seeing"]["DISTRIBUTION"], bands=band)[0]
-                # sky_brightness
-                if isinstance(self.main_dict["SURVEY"]["PARAMETERS"]["sky_brightness"], dict):
-                    output_dict[band]["sky_brightness"] = self._draw(self.main_dict["SURVEY"]["PARAMETERS"]["sky_brightness"]["DISTRIBUTION"], bands=band)[0]
-                # magnitude_zero_point
-                if isinstance(self.main_dict["SURVEY"]["PARAMETERS"]["magnitude_zero_point"], dict):
-                    output_dict[band]["magnitude_zero_point"] = self._draw(self.main_dict["SURVEY"]["PARAMETERS"]["magnitude_zero_point"]["DISTRIBUTION"], bands=band)[0]
+                # (seeing, sky_brightness, magnitude_zero_point)
+                for _, keys, sampler in configuration_plan.epoch_slots:
+                    output_dict[band][keys[0]] = sampler([band])[0]
 
-                    
-            output_dicts.append(copy.deepcopy(output_dict))
-            del output_dict
+            output_dicts.append(output_dict)
                     
         return output_dicts
 
+    def _time_delays(self, configuration_plan, sim_dicts, obj_strings, cosmo):
+        """
+        Calculate the time delays between the lensed images of each time series object for all objects of a configuration
+
+        The image positions are solved here in one pass with the same settings used by the image
+        generator, which is given them for every band and epoch of the object.
+
+        :param configuration_plan: a plan.ConfigurationPlan instance from self.plan
+        :param sim_dicts: list with one band of the flattened and filled dictionary of each object
+        :param obj_strings: list of the strings targetting the objects in the flattened dictionary
+        :param cosmo: an astropy.cosmology instance
+        :return: td_dicts: list with a dictionary of integer time delays for each obj_string of each object, None for unlensed objects
+        :return: image_positions: list with the image positions solved for each object, as given to ImageGenerator.sim_image
+        """
+        td_dicts = [{obj_string: None for obj_string in obj_strings} for _ in sim_dicts]
+        image_positions = [{} for _ in sim_dicts]
+        if len(sim_dicts) == 0 or sim_dicts[0]['NUMBER_OF_PLANES'] < 2:
+            return td_dicts, image_positions
+
+        # the geometry is the same for every object of a configuration
+        lensed_obj_strings = [obj_string for obj_string in obj_strings
+                              if int(obj_string.split('_')[1].split('-')[0]) == sim_dicts[0]['NUMBER_OF_PLANES']
+                              and sim_dicts[0].get(obj_string + '-HOST', 'None') not in ['None', 'Foreground']]
+        if len(lensed_obj_strings) == 0:
+            return td_dicts, image_positions
+
+        profiles = configuration_plan.profiles
+        cosmo_key = repr(cosmo)
+        for sim_dict, td_dict, positions in zip(sim_dicts, td_dicts, image_positions):
+            if configuration_plan.special_functions:
+                # user SPECIAL functions can change the profiles, so find them like the image generator
+                params = self._image_generator.parse_single_band_info_dict(sim_dict, cosmo, profiles=profiles)
+                lens_model_list, lens_redshift_list = params[1]['lens_model_list'], params[1]['lens_redshift_list']
+                z_source, kwargs_mass = params[1]['z_source'], params[6]
+            else:
+                lens_model_list = [sim_dict[x + 'NAME'] for x, _ in configuration_plan.lens_profiles]
+                lens_redshift_list = [sim_dict[x] for _, x in configuration_plan.lens_profiles]
+                z_source = sim_dict[configuration_plan.source_redshift_key] if configuration_plan.source_redshift_key is not None else 0.0
+                kwargs_mass = [self._image_generator._profile_params(sim_dict, x, profiles) for x, _ in configuration_plan.lens_profiles]
+            if len(lens_model_list) == 0:
+                continue
+
+            # the unit conversion and distances only depend on the redshifts, lens models, and cosmology
+            key = (tuple(lens_model_list), tuple(lens_redshift_list), z_source, cosmo_key)
+            if key not in self._lens_setups:
+                params = self._image_generator.parse_single_band_info_dict(sim_dict, cosmo, profiles=profiles)
+                # use sim API in case sigma_v is used for mass profiles
+                sim = SimAPI(numpix=sim_dict['numPix'],
+                             kwargs_single_band=params[0],
+                             kwargs_model=params[1])
+                td_cosmo = TDCosmography(lens_redshift_list[0], z_source,
+                                         {'lens_model_list': lens_model_list,
+                                          'point_source_model_list': ['LENSED_POSITION']},
+                                         cosmo_fiducial=cosmo)
+                self._lens_setups[key] = (sim, td_cosmo)
+            sim, td_cosmo = self._lens_setups[key]
+            kwargs_lens_model_list = sim.physical2lensing_conversion(kwargs_mass=kwargs_mass)
+
+            for obj_string in lensed_obj_strings:
+                x_image, y_image = self._image_generator.solve_image_positions(positions,
+                                                                               td_cosmo.LensModel,
+                                                                               lens_model_list,
+                                                                               kwargs_lens_model_list,
+                                                                               sim_dict[obj_string + '-ra'],
+                                                                               sim_dict[obj_string + '-dec'],
+                                                                               sim_dict['pixel_scale'],
+                                                                               sim_dict['numPix'])
+                td_dict[obj_string] = td_cosmo.time_delays(kwargs_lens_model_list,
+                                                           [{'ra_image': x_image, 'dec_image': y_image}],
+                                                           kappa_ext=0,
+                                                           original_ps_position=True).round().astype(int)
+
+        return td_dicts, image_positions
+
+    def _select_lightcurves(self, lightcurves, redshift, interpolate=False):
+        """
+        Choose the library light curves to use for an object at a given redshift
+
+        :param lightcurves: dictionary with keys 'library', 'redshifts', and 'neighbours' from generate_time_series
+        :param redshift: the redshift of the object
+        :param interpolate: if True, weight the sed of the closest node at the bracketing redshifts
+        :return: lc_weights: list of (light curve, weight) pairs with the closest light curve first
+        """
+        redshifts = lightcurves['redshifts']
+        closest_idx = np.argmin(np.abs(redshift - redshifts))
+        closest_lc = lightcurves['library'][closest_idx]
+        upper_idx = np.searchsorted(redshifts, redshift)
+        if not interpolate or upper_idx == 0 or upper_idx == len(redshifts) or len(lightcurves.get('neighbours', [])) == 0:
+            return [(closest_lc, 1.0)]
+
+        # the other bracketing node, evaluated with the sed of the closest node
+        other_idx = upper_idx - 1 if closest_idx == upper_idx else upper_idx
+        other_lc = lightcurves['neighbours'][closest_idx][other_idx]
+
+        upper_weight = (redshift - redshifts[upper_idx - 1]) / (redshifts[upper_idx] - redshifts[upper_idx - 1])
+        if closest_idx == upper_idx:
+            return [(closest_lc, upper_weight), (other_lc, 1.0 - upper_weight)]
+        return [(closest_lc, 1.0 - upper_weight), (other_lc, upper_weight)]
+
+    def _lightcurve_magnitudes(self, lc_weights, band, nites):
+        """
+        Evaluate the magnitudes of the light curves chosen by _select_lightcurves
+
+        :param lc_weights: list of (light curve, weight) pairs with the closest light curve first
+        :param band: the band to evaluate
+        :param nites: array of nites relative to the peak
+        :return: mags: array of magnitudes with the shape of nites; nites outside the sed are set to 99
+        """
+        lc_nites, lc_mags = lc_weights[0][0]['interp'][band]
+        mags = np.interp(nites, lc_nites, lc_mags, left=99.0, right=99.0)
+        if len(lc_weights) == 2:
+            # interpolate in redshift where both light curves are defined
+            other_nites, other_mags = lc_weights[1][0]['interp'][band]
+            other = np.interp(nites, other_nites, other_mags, left=99.0, right=99.0)
+            mags = np.where((mags < 99.0) & (other < 99.0), lc_weights[0][1] * mags + lc_weights[1][1] * other, mags)
+        return mags
+
+    def _compile_lightcurves(self, lightcurves):
+        """
+        Store each light curve in a library as nite-sorted arrays for every band
+        so that magnitudes can be evaluated with np.interp
+
+        :param lightcurves: dictionary with keys 'library', 'redshifts', and 'neighbours' from generate_time_series
+        """
+        neighbour_lcs = [lc_dict for neighbours in lightcurves.get('neighbours', []) for lc_dict in neighbours.values()]
+        for lc_dict in lightcurves['library'] + neighbour_lcs:
+            if 'interp' in lc_dict:
+                continue
+            lc_dict['interp'] = {}
+            for band in self.main_dict['SURVEY']['PARAMETERS']['BANDS'].split(','):
+                band_mask = lc_dict['lc']['BAND'].values == band
+                band_nites = lc_dict['lc']['NITE'].values[band_mask].astype(float)
+                band_mags = lc_dict['lc']['MAG'].values[band_mask].astype(float)
+                order = np.argsort(band_nites)
+                lc_dict['interp'][band] = (band_nites[order], band_mags[order])
+        return
+
+    def _lightcurve_inputs(self, pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo):
+        """
+        Collect the configuration inputs that determine a light curve library
+
+        :param pointing: the name of the pointing in the cadence dict
+        :param nite_dict: the shifted nites of the pointing for each band
+        :param obj: the name of the timeseries object
+        :param redshift_dict: the redshift (or redshift distribution) of the object
+        :param num_redshifts: the number of redshifts in the library grid
+        :param cosmo: an astropy.cosmology instance
+        :return: key_info: a json-serializable dict of the inputs
+        """
+        return {'BANDS': self.main_dict['SURVEY']['PARAMETERS']['BANDS'],
+                'COSMOLOGY': {'H0': cosmo.H0.value, 'Om0': cosmo.Om0, 'Tcmb0': cosmo.Tcmb0.value,
+                              'Neff': cosmo.Neff, 'Ob0': cosmo.Ob0},
+                'MODEL': self.main_dict['SPECIES'][self._species_map[obj]]['MODEL'],
+                'NITES': nite_dict,
+                'POINTING': pointing,
+                'REDSHIFT': redshift_dict,
+                'REDSHIFT_NODES': num_redshifts,
+                'SEED': self.main_dict['DATASET']['PARAMETERS'].get('SEED')}
+
+    def _lightcurve_files(self, obj):
+        """
+        Find the size and modification time of the SED and filter files a light curve library is built from
+
+        :param obj: the name of the timeseries object
+        :return: file_info: list of (path, size, modification time) for the files that exist
+        """
+        model_info = self.main_dict['SPECIES'][self._species_map[obj]]['MODEL'].split('_')
+        if model_info[0] == 'user' and len(model_info) > 1:
+            sed_filename = model_info[1] if model_info[1].startswith('seds/user/') else 'seds/user/' + model_info[1]
+            paths = [sed_filename]
+        else:
+            paths = sorted(glob.glob('seds/{0}/*'.format(model_info[0])))
+        paths += sorted(glob.glob('filters/*.dat'))
+
+        file_info = []
+        for path in paths:
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                file_info.append((path, stat.st_size, stat.st_mtime))
+        return file_info
+
+    def _lightcurve_cache_key(self, pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo, interpolate_redshift=False):
+        """
+        Hash the inputs and data files that determine a light curve library
+
+        :param pointing: the name of the pointing in the cadence dict
+        :param nite_dict: the shifted nites of the pointing for each band
+        :param obj: the name of the timeseries object
+        :param redshift_dict: the redshift (or redshift distribution) of the object
+        :param num_redshifts: the number of redshifts in the library grid
+        :param cosmo: an astropy.cosmology instance
+        :param interpolate_redshift: whether the library holds the seds of its nodes at the neighbouring nodes
+        :return: key: a hexadecimal string identifying the library
+        """
+        key_info = self._lightcurve_inputs(pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo)
+        key_info['FILES'] = self._lightcurve_files(obj)
+        key_info['INTERPOLATE_REDSHIFT'] = interpolate_redshift
+        return hashlib.sha1(json.dumps(key_info, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _lightcurve_seed(self, pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo):
+        """
+        Seed for the random state a light curve library is built from. Unlike the cache key,
+        the seed does not depend on the data files, so a touched or re-downloaded SED does
+        not change the library.
+
+        :param pointing: the name of the pointing in the cadence dict
+        :param nite_dict: the shifted nites of the pointing for each band
+        :param obj: the name of the timeseries object
+        :param redshift_dict: the redshift (or redshift distribution) of the object
+        :param num_redshifts: the number of redshifts in the library grid
+        :param cosmo: an astropy.cosmology instance
+        :return: seed: int
+        """
+        key_info = self._lightcurve_inputs(pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo)
+        return int(hashlib.sha1(json.dumps(key_info, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:8], 16)
+
+    def _trim_lightcurve_cache(self, cache_dir):
+        """
+        Delete the least recently used libraries when the cache holds more than LIGHTCURVE_CACHE_SIZE
+
+        :param cache_dir: the directory of the cached libraries
+        """
+        cache_files = [cache_dir + '/' + x for x in os.listdir(cache_dir) if x.endswith('.npy')]
+        if len(cache_files) <= LIGHTCURVE_CACHE_SIZE:
+            return
+        for cache_file in sorted(cache_files, key=lambda x: os.stat(x).st_mtime if os.path.exists(x) else 0)[:-LIGHTCURVE_CACHE_SIZE]:
+            try:
+                os.remove(cache_file)
+            except FileNotFoundError:
+                # another process removed it first
+                pass
+        return
+
     def generate_time_series(self, configuration, nites, objects, redshift_dicts, cosmo):
         """
-        Generate a light curve bank for each configuration with timeseries info
+        Generate a light curve bank for each configuration with timeseries info.
+        Libraries are cached in {OUTDIR}/lightcurves and reused by later runs
+        when the bands, cadence, cosmology, model, redshifts, SEED, and the
+        size and modification time of the SED and filter files are unchanged.
+        Each library is built from a random state seeded by these inputs (not
+        the files) and leaves the global random state untouched, so a run draws the
+        same values whether or not its libraries are cached. Runs without a SEED
+        share their libraries. The LIGHTCURVE_CACHE_SIZE most recently used
+        libraries are kept. Nothing is read or written when the Organizer was
+        created with cache_lightcurves=False.
+
+        Redshift distributions are covered by a grid of TIMESERIES.REDSHIFT_NODES
+        redshifts (default 15). Objects use the closest light curve in the grid,
+        or with TIMESERIES.INTERPOLATE_REDSHIFT set to True, sed-based models are
+        linearly interpolated between the bracketing redshifts, so a coarse grid
+        is sufficient. The sed of each node is also evaluated at the neighbouring
+        nodes, so that an object keeps the sed of its closest node when the
+        nodes were generated with different (randomly chosen) seds.
 
         Args:
             configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc...
@@ -684,19 +858,42 @@ class Organizer():
         # Use the reference MJD to shift all the nites to be relative to 0
         shifted_cadence_dict = {k: {b: [x - cadence_dict['REFERENCE_MJD'] for x in cadence_dict[k][b]] for b in self.main_dict['SURVEY']['PARAMETERS']['BANDS'].split(',')} for k in cadence_dict.keys() if k.startswith('POINTING_')}
             
-        # instantiate an LCGen object
-        lc_gen = timeseries.LCGen(bands=self.main_dict['SURVEY']['PARAMETERS']['BANDS'])
+        # LCGen is only instantiated if a library is missing from the cache
+        lc_gen = None
+        cache_dir = '{0}/lightcurves'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR'])
+        num_redshifts = self.main_dict['GEOMETRY'][configuration]['TIMESERIES'].get('REDSHIFT_NODES', 15)
+        interpolate_redshift = self.main_dict['GEOMETRY'][configuration]['TIMESERIES'].get('INTERPOLATE_REDSHIFT', False)
 
         # make a library for each pointing - need to speed this up (horrible performance for non-fixed redshifts and many pointings)
         for pointing, nite_dict in shifted_cadence_dict.items():
             
             for obj, redshift_dict in zip(objects, redshift_dicts):
+
+                # use the cached library if one exists for these inputs
+                cache_key = self._lightcurve_cache_key(pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo, interpolate_redshift)
+                cache_file = '{0}/{1}.npy'.format(cache_dir, cache_key)
+                if self.cache_lightcurves and os.path.exists(cache_file):
+                    lightcurves = np.load(cache_file, allow_pickle=True).item()
+                    self._compile_lightcurves(lightcurves)
+                    setattr(self, configuration + '_' + obj + '_lightcurves_' + pointing, lightcurves)
+                    # mark the library as recently used
+                    os.utime(cache_file)
+                    continue
+
+                if lc_gen is None:
+                    lc_gen = timeseries.LCGen(bands=self.main_dict['SURVEY']['PARAMETERS']['BANDS'])
                 lc_library = []
+
+                # build the library from its own random state
+                np_random_state, random_state = np.random.get_state(), random.getstate()
+                seed = self._lightcurve_seed(pointing, nite_dict, obj, redshift_dict, num_redshifts, cosmo)
+                np.random.seed(seed)
+                random.seed(seed)
                 
                 # get redshifts to simulate light curves at
                 if isinstance(redshift_dict, dict):
                     drawn_redshifts = [self._draw(redshift_dict['DISTRIBUTION'], bands='g') for _ in range(100)]
-                    redshifts = np.linspace(np.min(drawn_redshifts), np.max(drawn_redshifts), 15)
+                    redshifts = np.linspace(np.min(drawn_redshifts), np.max(drawn_redshifts), num_redshifts)
                 else:
                     redshifts = np.array([redshift_dict])
 
@@ -708,8 +905,37 @@ class Organizer():
                 else:
                     for redshift in redshifts:
                         lc_library.append(eval('lc_gen.gen_{0}(redshift, nite_dict, sed_filename="{1}", cosmo=cosmo)'.format(model_info[0], model_info[1])))
+
+                # evaluate the sed of each node at the neighbouring nodes, so that objects
+                # can be interpolated in redshift without changing their sed
+                neighbours = []
+                if interpolate_redshift and model_info[0] in SED_MODELS:
+                    for node_idx, lc_dict in enumerate(lc_library):
+                        neighbours.append({})
+                        for neighbour_idx in [node_idx - 1, node_idx + 1]:
+                            if neighbour_idx < 0 or neighbour_idx == len(redshifts):
+                                continue
+                            if lc_library[neighbour_idx]['sed'] == lc_dict['sed']:
+                                neighbours[-1][neighbour_idx] = lc_library[neighbour_idx]
+                            else:
+                                neighbours[-1][neighbour_idx] = getattr(lc_gen, 'gen_' + model_info[0])(redshifts[neighbour_idx], nite_dict, sed_filename=lc_dict['sed'], cosmo=cosmo)
+            
+                np.random.set_state(np_random_state)
+                random.setstate(random_state)
             
-                setattr(self, configuration + '_' + obj + '_lightcurves_' + pointing, {'library': lc_library, 'redshifts': redshifts})
+                lightcurves = {'library': lc_library, 'redshifts': redshifts, 'neighbours': neighbours}
+                self._compile_lightcurves(lightcurves)
+                setattr(self, configuration + '_' + obj + '_lightcurves_' + pointing, lightcurves)
+
+                if not self.cache_lightcurves:
+                    continue
+
+                # write to a temporary file first, so other processes never read a partial library
+                tmp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+                with open(tmp_file, 'wb') as f:
+                    np.save(f, lightcurves, allow_pickle=True)
+                os.replace(tmp_file, cache_file)
+                self._trim_lightcurve_cache(cache_dir)
         
         return
     
@@ -720,69 +946,13 @@ class Organizer():
         Args:
             verbose (bool, optional, default=False): Automatically passed from deeplenstronomy.make_dataset() args.
         """
-        # Determine number of images to simulate for each configuration
-        global_size = self.main_dict['DATASET']['PARAMETERS']['SIZE']
-        configurations = {}
-        for k, v in self.main_dict['GEOMETRY'].items():
-            configurations[k] = v
-            configurations[k]['SIZE'] = int(global_size * v['FRACTION'])
-
-        # Determine objects and their planes, store in SIM_DICT key
-        for k, v in configurations.items():
-            sim_dict = {}
-            
-            sim_dict['CONFIGURATION_LABEL'] = k
-            sim_dict['CONFIGURATION_NAME'] = v['NAME']
-            sim_dict['NUMBER_OF_PLANES'] = len([x for x in v.keys() if x.find('PLANE') != -1])
-            
-            for config_key, config_dict in v.items():
-                if config_key.find('PLANE') != -1:
-                    sim_dict['PLANE_{0}-NUMBER_OF_OBJECTS'.format(config_key.split('_')[-1])] = len([y for y in config_dict.keys() if y.find('OBJECT') != -1])
-                    for obj_index in [x.split('_')[-1] for x in [y for y in config_dict.keys() if y.find('OBJECT') != -1]]:
-                        sim_dict[config_key + '-' + 'OBJECT_{0}-NAME'.format(obj_index)] = config_dict['OBJECT_{0}'.format(obj_index)]
-                    
-            configurations[k]['SIM_DICT'] = sim_dict
-            configurations[k] = dict_select(configurations[k], ['NAME', 'SIZE', 'SIM_DICT'])
-            
-        # Determine number of profiles for each object
-        species_dict = {}
-        for k, v in self.main_dict['SPECIES'].items():
-            species_dict[v['NAME']] = {'NUMBER_OF_LIGHT_PROFILES': len([x for x in v.keys() if x.find('LIGHT_PROFILE') != -1]),
-                                       'NUMBER_OF_MASS_PROFILES': len([x for x in v.keys() if x.find('MASS_PROFILE') != -1]),
-                                       'NUMBER_OF_SHEAR_PROFILES': len([x for x in v.keys() if x.find('SHEAR_PROFILE') != -1])}
-        for k in configurations.keys():
-            configurations[k]['SPECIES_DICT'] = species_dict
-
-        # Add image metadata
-        image_dict = {k: v if not isinstance(v, dict) else 'DISTRIBUTION' for k, v in self.main_dict['IMAGE']['PARAMETERS'].items()}
-        for k in configurations.keys():
-            configurations[k]['IMAGE_DICT'] = image_dict
-        
-        # Add survey metadata
-        survey_dict = {k: v if not isinstance(v, dict) else 'DISTRIBUTION' for k, v in self.main_dict['SURVEY']['PARAMETERS'].items()}
-        #survey_dict['NAME'] = self.main_dict['SURVEY']['NAME']
-        for k in configurations.keys():
-            configurations[k]['SURVEY_DICT'] = survey_dict
-            
-        # Add cosmology metadata
-        cosmo_dict = {k: v if not isinstance(v, dict) else 'DISTRIBUTION' for k, v in self.main_dict['COSMOLOGY']['PARAMETERS'].items()}
-        #cosmo_dict['NAME'] = self.main_dict['COSMOLOGY']['NAME']
-        for k in configurations.keys():
-            configurations[k]['COSMOLOGY_DICT'] = cosmo_dict
+        # Compile the configuration into per-configuration slots
+        self.plan = plan.SimulationPlan(self.main_dict)
+        configurations = self.plan.configurations
 
         # Set cosmology information
         cosmology_info = ['H0', 'Om0', 'Tcmb0', 'Neff', 'm_nu', 'Ob0']
-        cosmo = FlatLambdaCDM(**dict_select_choose(configurations[k]['COSMOLOGY_DICT'], cosmology_info))
-            
-        # Add noise metadata
-        for k in configurations.keys():
-            noise_dict = {}
-            number_of_noise_sources = len([x for x in self.main_dict['GEOMETRY'][k].keys() if x.find('NOISE_SOURCE') != -1])
-            noise_dict['NUMBER_OF_NOISE_SOURCES'] = number_of_noise_sources
-            for noise_source_idx in range(number_of_noise_sources):
-                noise_source_num = noise_source_idx + 1
-                noise_dict['NOISE_SOURCE_{0}-NAME'.format(noise_source_num)] = self.main_dict['GEOMETRY'][k]['NOISE_SOURCE_{0}'.format(noise_source_num)]
-            configurations[k]['NOISE_DICT'] = noise_dict
+        cosmo = FlatLambdaCDM(**dict_select_choose(self.plan.cosmology, cosmology_info))
             
         # Check for timeseries metadata
         for k in configurations.keys():
@@ -790,11 +960,8 @@ class Organizer():
             if 'TIMESERIES' in self.main_dict['GEOMETRY'][k].keys():
                 
                 # Make a directory to store light curve data
-                if not os.path.exists(self.main_dict['DATASET']['PARAMETERS']['OUTDIR']):
-                    os.mkdir(self.main_dict['DATASET']['PARAMETERS']['OUTDIR'])
-                    
-                if not os.path.exists('{0}/lightcurves'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR'])):
-                    os.mkdir('{0}/lightcurves'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR']))
+                if self.cache_lightcurves:
+                    os.makedirs('{0}/lightcurves'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR']), exist_ok=True)
 
                 # Find the plane of the ojects and save the redshift sub-dict
                 redshift_dicts = []
@@ -811,13 +978,6 @@ class Organizer():
 
                 if verbose: print("Generating time series data for {0}".format(k))
 
-                # If light curves already exist, skip generation
-                #if os.path.exists('{0}/lightcurves/{1}_{2}.npy'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR'], k, self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'][0])):
-                #    setattr(self, k + '_{0}_lightcurves'.format(self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'][0]), np.load('{0}/lightcurves/{1}_{2}.npy'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR'], k, self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'][0])), allow_pickle=True) 
-                #else:
-                #    self.generate_time_series(k, self.main_dict['GEOMETRY'][k]['TIMESERIES']['NITES'], self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'], redshift_dicts, cosmo)
-                #    np.save('{0}/lightcurves/{1}_{2}.npy'.format(self.main_dict['DATASET']['PARAMETERS']['OUTDIR'], k, self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'][0]), eval('self.' + k + '_{0}_lightcurves'.format(self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'][0])), allow_pickle=True)
-
                 # Generate the time-series data
                 self.generate_time_series(k, self.main_dict['GEOMETRY'][k]['TIMESERIES']['NITES'], self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS'], redshift_dicts, cosmo)
                 setattr(self, k + '_time_series', True)
@@ -825,12 +985,15 @@ class Organizer():
                 
         # For each configuration, generate full sim info for as many objects as user specified
         configuration_sim_dicts = {}
+        # image positions solved for the time delays of each object, keyed by configuration and OBJID
+        self.image_positions = {}
+        bands = list(self.plan.bands)
         if verbose: print("Entering main organization loop")
         for k, v in configurations.items():
             if verbose: print("Organizing {0}".format(k))
             configuration_sim_dicts[k] = []
 
-            time_series = eval('self.{0}_time_series'.format(k))
+            time_series = getattr(self, '{0}_time_series'.format(k))
             if time_series:
                 # Get string referencing the varaible object
                 obj_strings = [self._find_obj_string(x, k) for x in self.main_dict['GEOMETRY'][k]['TIMESERIES']['OBJECTS']]
@@ -838,11 +1001,11 @@ class Organizer():
                 # Get the PEAK for the configuration
                 if 'PEAK' in self.main_dict['GEOMETRY'][k]['TIMESERIES'].keys():
                     if isinstance(self.main_dict['GEOMETRY'][k]['TIMESERIES']['PEAK'], dict):
-                        peakshifts = [self._draw(self.main_dict['GEOMETRY'][k]['TIMESERIES']['PEAK']['DISTRIBUTION'], bands='b')[0] for _ in range(v['SIZE'])]
+                        peakshifts = [self._draw(self.main_dict['GEOMETRY'][k]['TIMESERIES']['PEAK']['DISTRIBUTION'], bands='b')[0] for _ in range(v.size)]
                     else:
-                        peakshifts = [float(self.main_dict['GEOMETRY'][k]['TIMESERIES']['PEAK'])] * v['SIZE']
+                        peakshifts = [float(self.main_dict['GEOMETRY'][k]['TIMESERIES']['PEAK'])] * v.size
                 else:
-                    peakshifts = [0.0] * v['SIZE']
+                    peakshifts = [0.0] * v.size
 
             # Handle forced inputs
             inputs = {}
@@ -850,18 +1013,23 @@ class Organizer():
                 configuration, param_name, band = force_param
                 if configuration == k:
                     inputs[(param_name, band)] = values
-
-            input_df = pd.DataFrame(inputs)
+            if len(inputs) == 0:
+                inputs = None
                     
             
-            for objid in range(v['SIZE']):
-
-                if time_series:
-                    flattened_image_infos = self._flatten_and_fill_time_series(v.copy(), cosmo, k, obj_strings, objid, peakshifts[objid], inputs=input_df.loc[objid] if len(input_df) != 0 else None)
+            if time_series:
+                # draw the objects, then find the time delays of all of them before filling in their epochs
+                base_output_dicts = self._fill_configuration(v, cosmo, inputs)
+                td_dicts, image_positions = self._time_delays(v, [x[bands[0]] for x in base_output_dicts], obj_strings, cosmo)
+                self.image_positions[k] = {objid: positions for objid, positions in enumerate(image_positions) if len(positions) > 0}
+                for objid in range(v.size):
+                    flattened_image_infos = self._flatten_and_fill_time_series(v, k, obj_strings, peakshifts[objid], base_output_dicts[objid], td_dicts[objid])
                     for flattened_image_info in flattened_image_infos:
                         configuration_sim_dicts[k].append(flattened_image_info)
-                else:
-                    configuration_sim_dicts[k].append(self._flatten_and_fill(v.copy(), cosmo, input_df.loc[objid] if len(input_df) != 0 else None, objid))    
+                del base_output_dicts
+            else:
+                self.image_positions[k] = {}
+                configuration_sim_dicts[k] = self._fill_configuration(v, cosmo, inputs)
 
         self.configuration_sim_dicts = configuration_sim_dicts
 
@@ -0,0 +1,634 @@
+"""Write simulated datasets to disk and read them back."""
+
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+
+import h5py
+import numpy as np
+import pandas as pd
+
+METADATA_FORMATS = ['csv', 'parquet', 'feather', 'npz']
+
+def _is_ragged(column):
+    """
+    Check if a metadata column holds an array in every row, like x_mins
+
+    :param column: a pandas.Series
+    :return: True if every value is a list or an array
+    """
+    return column.dtype.kind == 'O' and len(column) > 0 and all([isinstance(x, (list, np.ndarray)) for x in column.values])
+
+def _has_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+def default_metadata_format():
+    """
+    The metadata format used when none is given: 'parquet' if pyarrow is installed and 'npz' otherwise
+
+    Returns:
+        metadata_format (str): one of METADATA_FORMATS
+    """
+    return 'parquet' if _has_pyarrow() else 'npz'
+
+class BackgroundWriter():
+    def __init__(self, max_pending=2):
+        """
+        Run disk writes on a separate thread so that they overlap with image generation.
+        Writes are run one at a time in the order they are submitted. A write only overlaps
+        with the work done after it is submitted, so make_dataset overlaps the outputs of a
+        configuration with the next configuration, and the checkpoint chunks of a
+        configuration with its next chunk.
+
+        Args:
+            max_pending (int, optional, default=2): number of writes that can wait before submit() blocks
+        """
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            func, args, kwargs = task
+            if self._error is None:
+                try:
+                    func(*args, **kwargs)
+                except Exception as e:
+                    self._error = e
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a write. The arguments must not be modified after they are submitted.
+
+        Args:
+            func (callable): the function doing the write
+            args: positional arguments of func
+            kwargs: keyword arguments of func
+
+        Raises:
+            Exception: the error raised by an earlier write
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((func, args, kwargs))
+        return
+
+    def close(self):
+        """
+        Wait for all queued writes to finish. Closing again only raises the error of a write.
+
+        Raises:
+            Exception: the error raised by a write
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return
+
+
+class Checkpoint():
+    def __init__(self, directory, key, seed, resume=False):
+        """
+        Chunks of finished images and a manifest of the completed chunks, so that an interrupted
+        run can continue where it stopped. A chunk is added to the manifest only after it is saved.
+        Chunks are saved on the BackgroundWriter thread, so the manifest is only used under a lock.
+
+        Args:
+            directory (str): directory of the manifest and the chunks
+            key (dict): settings of the run, an earlier run is only continued if its settings are the same
+            seed (int): the SEED of the run, replaced by the SEED of the earlier run when continuing
+            resume (bool, optional, default=False): continue the run recorded in directory if there is one
+        """
+        self.directory = directory
+        self.manifest_file = directory + '/progress.json'
+        key = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.manifest = {'key': key, 'seed': seed, 'completed': {}}
+        if resume and os.path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+            if manifest['key'] == key:
+                self.manifest = manifest
+            else:
+                print("WARNING: {0} was written with different settings, starting over".format(self.manifest_file))
+        self.seed = self.manifest['seed']
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._write_manifest()
+        return
+
+    def _write_manifest(self):
+        """
+        Replace the manifest in one step, so an interruption never leaves it half written
+        """
+        with open(self.manifest_file + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(self.manifest_file + '.tmp', self.manifest_file)
+        return
+
+    def _chunk_file(self, configuration, chunk_num):
+        return '{0}/{1}_chunk_{2}.npy'.format(self.directory, configuration, chunk_num)
+
+    def is_complete(self, configuration, chunk_num):
+        """
+        Check if a chunk has been saved
+
+        Args:
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            chunk_num (int): index of the chunk in the configuration
+
+        Returns:
+            bool: True if the chunk is in the manifest
+        """
+        with self._lock:
+            return chunk_num in self.manifest['completed'].get(configuration, [])
+
+    def save(self, configuration, chunk_num, images, planes, rows):
+        """
+        Save a chunk and add it to the manifest
+
+        Args:
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            chunk_num (int): index of the chunk in the configuration
+            images (List[np.array]): the images of the chunk
+            planes (List[np.array] or None): the planes of the chunk, if they are returned
+            rows (List[dict]): the flattened metadata of each image
+        """
+        np.save(self._chunk_file(configuration, chunk_num),
+                {'images': np.array(images), 'planes': np.array(planes) if planes is not None else None, 'rows': rows},
+                allow_pickle=True)
+        with self._lock:
+            self.manifest['completed'].setdefault(configuration, []).append(chunk_num)
+            self._write_manifest()
+        return
+
+    def load(self, configuration, chunk_num):
+        """
+        Load a saved chunk
+
+        Args:
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            chunk_num (int): index of the chunk in the configuration
+
+        Returns:
+            chunk: dict with the 'images', 'planes', and metadata 'rows' given to save()
+        """
+        return np.load(self._chunk_file(configuration, chunk_num), allow_pickle=True).item()
+
+    def remove(self):
+        """
+        Delete the manifest and the chunks once the outputs are written
+        """
+        shutil.rmtree(self.directory)
+        return
+
+
+def save_h5(filename, name, data):
+    """
+    Write an array to a new HDF5 file as a single dataset
+
+    Args:
+        filename (str): name of the HDF5 file
+        name (str): name of the dataset
+        data (np.array): the array to write
+    """
+    hf = h5py.File(filename, 'w')
+    hf.create_dataset(name, data=data)
+    hf.close()
+    return
+
+
+def epoch_index(objids):
+    """
+    Index the epochs of time series objects. Images of an object are consecutive, so the
+    epochs of objids[k] are the images offsets[k] to offsets[k + 1].
+
+    Args:
+        objids (np.array): the OBJID of every image
+
+    Returns:
+        objids: np.array of the OBJID of each object
+        offsets: np.array of the index of the first image of each object, followed by the number of images
+    """
+    objids = np.asarray(objids)
+    starts = np.flatnonzero(np.append(True, objids[1:] != objids[:-1]))
+    return objids[starts], np.append(starts, len(objids))
+
+class MetadataWriter():
+    def __init__(self, columns=None):
+        """
+        Accumulate the metadata of simulated images column by column. Values that are
+        arrays, like the image positions from solving the lens equation, are kept as
+        arrays instead of being converted to strings.
+
+        Args:
+            columns (List[str] or None, optional, default=None): the expected columns, in order, 
+                like plan.ConfigurationPlan.metadata_columns(). Columns of the rows that are not 
+                listed are added after them, and listed columns that never get a value are dropped.
+        """
+        self.order = [] if columns is None else list(columns)
+        self.columns = {}
+        self.num_rows = 0
+        return
+
+    def append(self, row):
+        """
+        Add the metadata of one image
+
+        Args:
+            row (dict): flattened image info, mapping column names to values
+        """
+        for k, v in row.items():
+            if k not in self.columns:
+                self.columns[k] = [np.nan] * self.num_rows
+            self.columns[k].append(v)
+        self.num_rows += 1
+
+        if len(row) != len(self.columns):
+            for values in self.columns.values():
+                if len(values) < self.num_rows:
+                    values.append(np.nan)
+        return
+
+    def to_frame(self):
+        """
+        Convert the metadata to a dataframe
+
+        Returns:
+            pandas.DataFrame with one row per image
+        """
+        ordered = set(self.order)
+        columns = [k for k in self.order if k in self.columns] + [k for k in self.columns.keys() if k not in ordered]
+        return pd.DataFrame({k: self.columns[k] for k in columns})
+
+    @staticmethod
+    def write(metadata, filename, metadata_format=None):
+        """
+        Write metadata to disk. 'parquet' and 'feather' require pyarrow and fall back to
+        'npz' without it. Array-valued columns are joined with ';' in 'csv' files and
+        stored as their concatenated values plus a '{column}__offsets' array in 'npz' files.
+
+        Args:
+            metadata (pandas.DataFrame): the metadata to write
+            filename (str): name of the file without the extension
+            metadata_format (str or None, optional, default=None): one of METADATA_FORMATS, default_metadata_format() if None
+
+        Returns:
+            outfile (str): name of the file written
+        """
+        if metadata_format is None:
+            metadata_format = default_metadata_format()
+        if metadata_format in ['parquet', 'feather'] and not _has_pyarrow():
+            print("WARNING: pyarrow is not installed, writing {0} as npz instead of {1}".format(filename, metadata_format))
+            metadata_format = 'npz'
+
+        outfile = filename + '.' + metadata_format
+        if metadata_format == 'csv':
+            metadata = metadata.copy()
+            for column in metadata.columns:
+                if _is_ragged(metadata[column]):
+                    metadata[column] = [';'.join([str(x) for x in values]) for values in metadata[column].values]
+            metadata.to_csv(outfile, index=False)
+        elif metadata_format == 'parquet':
+            metadata.to_parquet(outfile, index=False)
+        elif metadata_format == 'feather':
+            metadata.reset_index(drop=True).to_feather(outfile)
+        elif metadata_format == 'npz':
+            arrays = {}
+            for column in metadata.columns:
+                if _is_ragged(metadata[column]):
+                    values = [np.asarray(x) for x in metadata[column].values]
+                    arrays[column] = np.concatenate(values) if len(values) > 0 else np.array([])
+                    arrays[column + '__offsets'] = np.cumsum([0] + [len(x) for x in values])
+                elif metadata[column].dtype.kind == 'O':
+                    arrays[column] = np.array([str(x) for x in metadata[column].values])
+                else:
+                    arrays[column] = metadata[column].values
+            np.savez(outfile, **arrays)
+        else:
+            print("ERROR: {0} is not a supported argument for metadata_format".format(metadata_format))
+        return outfile
+
+
+def read_metadata(filename, columns=None):
+    """
+    Read metadata written by MetadataWriter.write(). The format is taken from the extension.
+
+    Args:
+        filename (str): name of the metadata file
+        columns (List[str] or None, optional, default=None): columns to read, all columns if None
+
+    Returns:
+        pandas.DataFrame of the metadata
+    """
+    if filename.endswith('.csv'):
+        return pd.read_csv(filename, usecols=columns, float_precision='round_trip')
+    elif filename.endswith('.parquet'):
+        return pd.read_parquet(filename, columns=columns)
+    elif filename.endswith('.feather'):
+        return pd.read_feather(filename, columns=columns)
+
+    data = {}
+    with np.load(filename) as npz:
+        names = [x for x in npz.files if not x.endswith('__offsets')] if columns is None else columns
+        for name in names:
+            if name + '__offsets' in npz.files:
+                offsets = npz[name + '__offsets']
+                values = npz[name]
+                data[name] = [values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+            else:
+                data[name] = npz[name]
+    return pd.DataFrame(data)
+
+class HDF5Writer():
+    def __init__(self, filename, compression=None, mode='a'):
+        """
+        Write images, planes, and metadata of every configuration to a single HDF5 file.
+        Each configuration is a group holding an 'images' dataset, an optional 'planes'
+        dataset, and a 'metadata' group with one typed dataset per column. Images and
+        planes are chunked per image, and every dataset can be appended to.
+
+        Args:
+            filename (str): name of the HDF5 file
+            compression (str or None, optional, default=None): 'lzf', 'gzip', or None
+            mode (str, optional, default='a'): h5py file mode, 'a' appends to an existing file and 'w' overwrites it
+        """
+        self.filename = filename
+        self.compression = compression
+        self.hf = h5py.File(filename, mode)
+        return
+
+    def _append_array(self, group, name, data):
+        """
+        Append rows to a dataset of a group, creating it if it doesn't exist
+
+        :param group: an h5py.Group
+        :param name: name of the dataset
+        :param data: array whose first axis indexes the rows
+        """
+        if name not in group:
+            group.create_dataset(name, data=data, maxshape=(None,) + data.shape[1:],
+                                 chunks=(1,) + data.shape[1:] if data.ndim > 1 else True,
+                                 compression=self.compression)
+        else:
+            dset = group[name]
+            start = dset.shape[0]
+            dset.resize(start + len(data), axis=0)
+            if h5py.check_vlen_dtype(dset.dtype) is not None and h5py.check_string_dtype(dset.dtype) is None:
+                # h5py can't broadcast a block of variable length arrays, so write them one at a time
+                for idx, values in enumerate(data):
+                    dset[start + idx] = values
+            else:
+                dset[start:] = data
+        return
+
+    @staticmethod
+    def _column_array(column):
+        """
+        Convert a metadata column to an array with an HDF5-compatible type
+
+        :param column: a pandas.Series
+        :return: array of numbers or booleans, of variable length float arrays for array-valued columns,
+                 or of variable length strings for mixed and string columns
+        """
+        if column.dtype.kind in 'biuf':
+            return column.values
+        if _is_ragged(column):
+            ragged = np.empty(len(column), dtype=h5py.vlen_dtype(np.float64))
+            ragged[:] = [np.asarray(x, dtype=float) for x in column.values]
+            return ragged
+        return np.array([str(x) for x in column.values], dtype=h5py.string_dtype())
+
+    @staticmethod
+    def _fill(dtype, size):
+        """
+        Build the values of a column for rows where it is missing
+
+        :param dtype: dtype of the column
+        :param size: number of rows
+        :return: array of NaN, empty strings, empty arrays, or zeros for integer and boolean columns
+        """
+        fill = np.empty(size, dtype=dtype)
+        if h5py.check_string_dtype(dtype) is not None:
+            fill[:] = ''
+        elif h5py.check_vlen_dtype(dtype) is not None:
+            for idx in range(size):
+                fill[idx] = np.array([])
+        elif np.dtype(dtype).kind == 'f':
+            fill[:] = np.nan
+        else:
+            fill[:] = 0
+        return fill
+
+    def _append_metadata(self, group, metadata):
+        """
+        Append metadata rows as typed columns. Columns missing from earlier or later rows
+        are filled with NaN, empty strings, or zeros for integer and boolean columns.
+
+        :param group: the metadata h5py.Group of a configuration
+        :param metadata: pandas.DataFrame of the new rows
+        """
+        num_rows = group.attrs.get('num_rows', 0)
+        for column in metadata.columns:
+            values = self._column_array(metadata[column])
+            if column not in group and num_rows > 0:
+                self._append_array(group, column, self._fill(float if values.dtype.kind in 'biu' else values.dtype, num_rows))
+            self._append_array(group, column, values)
+
+        for column in group.keys():
+            if column not in metadata.columns:
+                self._append_array(group, column, self._fill(group[column].dtype, len(metadata)))
+
+        group.attrs['num_rows'] = num_rows + len(metadata)
+        return
+
+    def append(self, configuration, metadata, images=None, planes=None):
+        """
+        Append simulated objects to a configuration
+
+        Args:
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            metadata (pandas.DataFrame): one row per image
+            images (np.array or None, optional, default=None): images with shape (number of images, bands, numPix, numPix)
+            planes (np.array or None, optional, default=None): planes with shape (number of images, 4, bands, numPix, numPix)
+        """
+        if configuration not in self.hf:
+            self.hf.create_group(configuration)
+            self.hf[configuration].create_group('metadata', track_order=True)
+        group = self.hf[configuration]
+        if images is not None:
+            self._append_array(group, 'images', np.asarray(images))
+        if planes is not None:
+            self._append_array(group, 'planes', np.asarray(planes))
+        self._append_metadata(group['metadata'], metadata)
+        return
+
+    def write_epoch_index(self, configuration, objids, offsets):
+        """
+        Store the output of epoch_index() in the 'epoch_index' group of a configuration,
+        replacing any earlier index
+
+        Args:
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            objids (np.array): the OBJID of each object
+            offsets (np.array): the index of the first image of each object, followed by the number of images
+        """
+        group = self.hf[configuration]
+        if 'epoch_index' in group:
+            del group['epoch_index']
+        group.create_group('epoch_index')
+        group['epoch_index'].create_dataset('objid', data=objids)
+        group['epoch_index'].create_dataset('offsets', data=offsets)
+        return
+
+    def close(self):
+        """
+        Close the HDF5 file
+        """
+        self.hf.close()
+        return
+
+
+def read_hdf5_metadata(filename, configuration, columns=None, rows=None):
+    """
+    Read the metadata of a configuration from a file written by HDF5Writer.
+
+    Args:
+        filename (str): name of the HDF5 file
+        configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+        columns (List[str] or None, optional, default=None): columns to read, all columns if None
+        rows (List[int] or None, optional, default=None): rows to read, all rows if None
+
+    Returns:
+        pandas.DataFrame of the metadata
+    """
+    if rows is not None:
+        # h5py reads sorted, unique indices
+        unique_rows, order = np.unique(rows, return_inverse=True)
+
+    with h5py.File(filename, 'r') as hf:
+        group = hf[configuration]['metadata']
+        columns = list(group.keys()) if columns is None else columns
+        data = {}
+        for column in columns:
+            values = group[column][()] if rows is None else group[column][unique_rows][order]
+            if h5py.check_string_dtype(group[column].dtype) is not None:
+                # fill an empty object array, np.array() would stack strings into characters or rows into 2D
+                decoded = np.empty(len(values), dtype=object)
+                decoded[:] = [x.decode('utf-8') if isinstance(x, bytes) else x for x in values]
+                values = decoded
+            data[column] = values
+    return pd.DataFrame(data)
+
+
+class LazyMetadata():
+    def __init__(self, filename, configuration=None):
+        """
+        Metadata of a configuration that is only read when it is accessed. Select columns
+        with metadata['column'] or metadata[['column_1', 'column_2']], and rows with
+        metadata.objid(objids).
+
+        Args:
+            filename (str): a metadata file written by MetadataWriter.write() or a file written by HDF5Writer
+            configuration (str or None, optional, default=None): the configuration group, required for HDF5Writer files
+        """
+        self.filename = filename
+        self.configuration = configuration
+        self._columns = None
+        self._objid_index = None
+        return
+
+    @property
+    def columns(self):
+        """
+        Names of the columns, read without reading any values
+        """
+        if self._columns is None:
+            if self.configuration is not None:
+                with h5py.File(self.filename, 'r') as hf:
+                    self._columns = list(hf[self.configuration]['metadata'].keys())
+            elif self.filename.endswith('.csv'):
+                self._columns = list(pd.read_csv(self.filename, nrows=0).columns)
+            elif self.filename.endswith('.parquet'):
+                import pyarrow.parquet
+                self._columns = pyarrow.parquet.read_schema(self.filename).names
+            elif self.filename.endswith('.feather'):
+                import pyarrow.ipc
+                self._columns = pyarrow.ipc.open_file(self.filename).schema.names
+            else:
+                with np.load(self.filename) as npz:
+                    self._columns = [x for x in npz.files if not x.endswith('__offsets')]
+        return self._columns
+
+    def read(self, columns=None):
+        """
+        Read columns of the metadata
+
+        Args:
+            columns (List[str] or None, optional, default=None): columns to read, all columns if None
+
+        Returns:
+            pandas.DataFrame of the metadata
+        """
+        if self.configuration is not None:
+            return read_hdf5_metadata(self.filename, self.configuration, columns)
+        return read_metadata(self.filename, columns)
+
+    def __getitem__(self, columns):
+        if isinstance(columns, str):
+            return self.read([columns])[columns]
+        return self.read(list(columns))
+
+    def __len__(self):
+        return len(self.read([self.columns[0]]))
+
+    def objid(self, objids, columns=None):
+        """
+        Read the rows of objects. Time series objects have a row for every epoch.
+
+        Args:
+            objids (int or List[int]): the OBJIDs to read
+            columns (List[str] or None, optional, default=None): columns to read, all columns if None
+
+        Returns:
+            pandas.DataFrame of the rows of the objects
+        """
+        if self._objid_index is None:
+            objid_column = [x for x in self.columns if x.startswith('OBJID')][0]
+            objid_values = self.read([objid_column])[objid_column].values
+            self._objid_index = pd.Series(np.arange(len(objid_values)), index=objid_values)
+
+        rows = self._objid_index.loc[np.atleast_1d(objids)].values
+        if self.configuration is not None:
+            # only the requested rows are read from HDF5 files
+            return read_hdf5_metadata(self.filename, self.configuration, columns, rows)
+        return self.read(columns).iloc[rows].reset_index(drop=True)
+
+
+def open_hdf5_dataset(filename, name=None):
+    """
+    Open the images or planes of a file written with image_file_format='h5' without reading them
+
+    Args:
+        filename (str): name of the HDF5 file
+        name (str or None, optional, default=None): the NAME of the dataset, the first dataset in the file if None
+
+    Returns:
+        h5py.Dataset that reads images when indexed
+    """
+    hf = h5py.File(filename, 'r')
+    return hf[list(hf.keys())[0] if name is None else name]
@@ -0,0 +1,272 @@
+"""Compile a parsed configuration into a reusable simulation plan."""
+
+import deeplenstronomy.distributions as distributions
+import deeplenstronomy.special as special
+
+
+class Sampler():
+    def __init__(self, distribution_dict):
+        """
+        A DISTRIBUTION entry of the configuration file bound to its function in deeplenstronomy.distributions.
+        Only the names are stored, so samplers can be pickled.
+
+        Args:
+            distribution_dict (dict): dictionary with keys NAME and PARAMETERS
+        """
+        self.name = distribution_dict['NAME']
+        if isinstance(distribution_dict.get('PARAMETERS'), dict):
+            self.parameters = tuple(distribution_dict['PARAMETERS'].items())
+        else:
+            self.parameters = ()
+        return
+
+    def __call__(self, bands):
+        """
+        Draw a value for each band
+
+        Args:
+            bands (List[str]): the bands to draw for
+
+        Returns:
+            draws: a list with one value for each band
+        """
+        return getattr(distributions, self.name)(bands=','.join(bands), **dict(self.parameters))
+
+
+def _slot(keys, value):
+    """
+    Build a slot setting one or more output keys to a fixed value or to the draws of a sampler
+
+    :param keys: the output key or a list of output keys
+    :param value: a fixed value or a dictionary containing a DISTRIBUTION
+    :return: slot: ('draw', keys, Sampler) or ('set', keys, value)
+    """
+    keys = (keys,) if isinstance(keys, str) else tuple(keys)
+    if isinstance(value, dict):
+        return ('draw', keys, Sampler(value['DISTRIBUTION']))
+    return ('set', keys, value)
+
+
+def _columns(slots):
+    """
+    List the output keys produced by a sequence of slots
+
+    :param slots: list of slots
+    :return: columns: list of output keys, in the order they are first set
+    """
+    columns = ['OBJID']
+    for slot in slots:
+        if slot[0] in ['set', 'draw', 'redshift']:
+            columns += slot[1]
+        elif slot[0] == 'point_source':
+            columns += [slot[1] + x for x in ['HOST', 'NAME', 'ra', 'dec', 'sep', 'sep_unit']]
+        elif slot[0] == 'foreground':
+            columns += [slot[1] + x for x in ['HOST', 'NAME', 'ra_image', 'dec_image', 'magnitude']]
+    return list(dict.fromkeys(columns))
+
+
+def _profile_keys(profile_prefix, parameters):
+    """
+    List the parameters of a profile with their keys in the flattened dictionary
+
+    :param profile_prefix: e.g. 'PLANE_1-OBJECT_1-LIGHT_PROFILE_1-' or 'NOISE_SOURCE_1-'
+    :param parameters: the PARAMETERS of the profile in the configuration
+    :return: profile_keys: tuple of (parameter name, key) pairs, without NAME entries
+    """
+    return tuple([(k, profile_prefix + k) for k in parameters.keys() if not k.endswith('NAME')])
+
+
+class ConfigurationPlan():
+    def __init__(self, config_dict, configuration, species_map, bands):
+        """
+        The ordered slots that produce the simulation inputs of one configuration. Slots are
+        executed by input_reader.Organizer in the order the random draws have always been made.
+        SPECIAL magnitude offsets are applied to all objects of the configuration at once.
+        ImageGenerator reads the parameters of each profile through profiles, and make_dataset
+        lays out the metadata with metadata_columns().
+
+        Args:
+            config_dict (dict): an instance of Parser.config_dict
+            configuration (str): like 'CONFIGURATION_1', 'CONFIGURATION_2', etc.
+            species_map (dict): map of object names to their keys in the SPECIES section
+            bands (List[str]): the bands of the survey
+        """
+        geometry = config_dict['GEOMETRY'][configuration]
+        self.label = configuration
+        self.name = geometry['NAME']
+        self.size = int(config_dict['DATASET']['PARAMETERS']['SIZE'] * geometry['FRACTION'])
+        self.time_series = 'TIMESERIES' in geometry.keys()
+
+        slots = []
+        # parameter keys of every profile and noise source, in the order they are set
+        profiles = {}
+        # mass and shear profiles of the lens planes with the keys of their redshifts
+        lens_profiles = []
+        source_redshift_key = None
+
+        # COSMOLOGY, IMAGE, SURVEY
+        for section in ['COSMOLOGY', 'IMAGE', 'SURVEY']:
+            for k, v in config_dict[section]['PARAMETERS'].items():
+                if section == 'SURVEY' and k == 'BANDS':
+                    continue
+                slots.append(_slot(k, v))
+
+        # NOISE
+        noise_names = [geometry['NOISE_SOURCE_{0}'.format(idx)]
+                       for idx in range(1, len([x for x in geometry.keys() if x.find('NOISE_SOURCE') != -1]) + 1)]
+        slots.append(('set', ('NUMBER_OF_NOISE_SOURCES',), len(noise_names)))
+        for noise_source_num, noise_name in enumerate(noise_names, 1):
+            slots.append(('set', ('NOISE_SOURCE_{0}-NAME'.format(noise_source_num),), noise_name))
+            for k, v in config_dict['SPECIES'][species_map[noise_name]]['PARAMETERS'].items():
+                slots.append(_slot('NOISE_SOURCE_{0}-{1}'.format(noise_source_num, k), v))
+            profiles['NOISE_SOURCE_{0}-'.format(noise_source_num)] = _profile_keys('NOISE_SOURCE_{0}-'.format(noise_source_num),
+                                                                                  config_dict['SPECIES'][species_map[noise_name]]['PARAMETERS'])
+
+        # Structure of the configuration
+        plane_keys = [x for x in geometry.keys() if x.find('PLANE') != -1]
+        sim_dict = {'CONFIGURATION_LABEL': configuration,
+                    'CONFIGURATION_NAME': self.name,
+                    'NUMBER_OF_PLANES': len(plane_keys)}
+        for plane_key in plane_keys:
+            obj_keys = [y for y in geometry[plane_key].keys() if y.find('OBJECT') != -1]
+            sim_dict['{0}-NUMBER_OF_OBJECTS'.format(plane_key)] = len(obj_keys)
+            for obj_key in obj_keys:
+                sim_dict['{0}-{1}-NAME'.format(plane_key, obj_key)] = geometry[plane_key][obj_key]
+        self.sim_dict = sim_dict
+        for k, v in sim_dict.items():
+            slots.append(('set', (k,), v))
+        # the redshift of each plane is filled in when it is drawn
+        for plane_num in range(1, sim_dict['NUMBER_OF_PLANES'] + 1):
+            if 'REDSHIFT' in geometry['PLANE_{0}'.format(plane_num)].get('PARAMETERS', {}):
+                slots.append(('set', ('PLANE_{0}-REDSHIFT'.format(plane_num),), None))
+
+        for plane_num in range(1, sim_dict['NUMBER_OF_PLANES'] + 1):
+            num_objects = sim_dict['PLANE_{0}-NUMBER_OF_OBJECTS'.format(plane_num)]
+
+            #GEOMETRY
+            for k_param, v_param in geometry['PLANE_{0}'.format(plane_num)]['PARAMETERS'].items():
+                keys = ['PLANE_{0}-OBJECT_{1}-{2}'.format(plane_num, obj_num, k_param) for obj_num in range(1, num_objects + 1)]
+                if k_param == 'REDSHIFT':
+                    # the redshift drawn for the first band is the redshift of the plane
+                    slots.append(('redshift',) + _slot(keys, v_param)[1:] + ('PLANE_{0}-REDSHIFT'.format(plane_num),))
+                else:
+                    slots.append(_slot(keys, v_param))
+
+            for obj_num in range(1, num_objects + 1):
+                prefix = 'PLANE_{0}-OBJECT_{1}-'.format(plane_num, obj_num)
+                obj_name = sim_dict[prefix + 'NAME']
+                species = config_dict['SPECIES'][species_map[obj_name]]
+                profile_nums = {p: len([x for x in species.keys() if x.find(p) != -1]) for p in ['LIGHT_PROFILE', 'MASS_PROFILE', 'SHEAR_PROFILE']}
+
+                #save number of profiles
+                slots.append(('set', (prefix + 'NUMBER_OF_LIGHT_PROFILES',), profile_nums['LIGHT_PROFILE']))
+                slots.append(('set', (prefix + 'NUMBER_OF_SHEAR_PROFILES',), profile_nums['SHEAR_PROFILE']))
+                slots.append(('set', (prefix + 'NUMBER_OF_MASS_PROFILES',), profile_nums['MASS_PROFILE']))
+
+                #SPECIES- Point Sources
+                if 'HOST' in species.keys():
+                    if species['HOST'] != 'Foreground':
+                        hostid = ['PLANE_{0}-OBJECT_{1}'.format(plane_num, x) for x in range(1, num_objects + 1)
+                                  if sim_dict['PLANE_{0}-OBJECT_{1}-NAME'.format(plane_num, x)] == species['HOST']][0]
+                        if 'sep' in species['PARAMETERS'].keys():
+                            sep = _slot(prefix + 'sep', species['PARAMETERS']['sep'])
+                            sep_unit = species['PARAMETERS']['sep_unit']
+                            angle = _slot(prefix + 'angle', species['PARAMETERS']['angle']) if 'angle' in species['PARAMETERS'].keys() else None
+                        else:
+                            sep, sep_unit, angle = None, 'arcsec', None
+                        slots.append(('point_source', prefix, species['HOST'], obj_name, hostid, 'PLANE_{0}-REDSHIFT'.format(plane_num), sep, sep_unit, angle))
+                    else:
+                        im_size = config_dict['IMAGE']['PARAMETERS']['numPix'] * config_dict['IMAGE']['PARAMETERS']['pixel_scale'] / 2
+                        slots.append(('foreground', prefix, obj_name, im_size, _slot(prefix + 'magnitude', species['PARAMETERS']['magnitude'])))
+                else:
+                    slots.append(('set', (prefix + 'HOST',), 'None'))
+
+                #SPECIES- Light, Mass, and Shear Profiles
+                for profile in ['LIGHT_PROFILE', 'MASS_PROFILE', 'SHEAR_PROFILE']:
+                    for profile_num in range(1, profile_nums[profile] + 1):
+                        profile_dict = species['{0}_{1}'.format(profile, profile_num)]
+                        profile_prefix = prefix + '{0}_{1}-'.format(profile, profile_num)
+                        slots.append(('set', (profile_prefix + 'NAME',), profile_dict['NAME']))
+                        for k_param, v_param in profile_dict['PARAMETERS'].items():
+                            slots.append(_slot(profile_prefix + k_param, v_param))
+                        profiles[profile_prefix] = _profile_keys(profile_prefix, profile_dict['PARAMETERS'])
+                        if profile != 'LIGHT_PROFILE' and plane_num < sim_dict['NUMBER_OF_PLANES'] and 'HOST' not in species.keys():
+                            lens_profiles.append((profile_prefix, prefix + 'REDSHIFT'))
+                if plane_num == sim_dict['NUMBER_OF_PLANES'] and 'HOST' not in species.keys():
+                    source_redshift_key = prefix + 'REDSHIFT'
+
+                #SPECIES- Additional Parameters
+                if 'PARAMETERS' in species.keys():
+                    for k_param, v_param in species['PARAMETERS'].items():
+                        if k_param == 'sep':
+                            #sampling for point source separation is already done, so don't overwrite it
+                            continue
+                        slots.append(_slot(prefix + k_param, v_param))
+
+                #SPECIES- Special
+                if 'SPECIAL' in species.keys():
+                    for mode, args in species['SPECIAL'].items():
+                        for arg in args:
+                            if mode.lower() in special.TRANSFORMS:
+                                # find the affected magnitude columns once instead of for every object
+                                light_profile, offsets = special.magnitude_offsets(mode.lower(), str(arg), bands)
+                                columns = _columns(slots)
+                                keys = tuple(columns[idx] for idx in special.magnitude_columns(columns, light_profile))
+                                slots.append(('special', keys, tuple(offsets)))
+                            else:
+                                slots.append(('special_function', mode.lower(), str(arg)))
+
+        # user SPECIAL functions read and change the values of the object, so magnitude offsets are only
+        # applied after all objects are drawn when there are none. Otherwise they stay in the slots
+        self.special_functions = any([slot[0] == 'special_function' for slot in slots])
+        if self.special_functions:
+            self.special_offsets = ()
+        else:
+            self.special_offsets = tuple([slot[1:] for slot in slots if slot[0] == 'special'])
+            slots = [slot for slot in slots if slot[0] != 'special']
+        self.slots = tuple(slots)
+
+        # keys produced by the slots, in order (TIMESERIES and user SPECIAL functions may add more)
+        self.columns = tuple(_columns(self.slots))
+
+        # user SPECIAL functions can add or remove profile parameters, so the Organizer removes the
+        # profiles they change, and ImageGenerator searches the keys of those profiles
+        self.profiles = profiles
+
+        # the lens models in the order of ImageGenerator's lens model list, and the redshift of the lensed sources
+        self.lens_profiles = tuple(lens_profiles)
+        self.source_redshift_key = source_redshift_key
+
+        # observing conditions drawn independently for each epoch of a time series
+        self.epoch_slots = tuple([_slot(k, config_dict['SURVEY']['PARAMETERS'][k]) for k in ['seeing', 'sky_brightness', 'magnitude_zero_point']
+                                  if isinstance(config_dict['SURVEY']['PARAMETERS'][k], dict)])
+        return
+
+    def metadata_columns(self, bands):
+        """
+        Names of the metadata columns of the keys produced by the slots
+
+        Args:
+            bands (List[str]): the bands of the survey
+
+        Returns:
+            columns: list of '{key}-{band}' in the order of the flattened image info
+        """
+        return ['{0}-{1}'.format(column, band) for band in bands for column in self.columns]
+
+
+class SimulationPlan():
+    def __init__(self, config_dict):
+        """
+        Compile a parsed configuration so that simulation inputs can be produced without
+        walking the configuration dictionary for every object. The plan is picklable.
+
+        Args:
+            config_dict (dict): an instance of Parser.config_dict
+        """
+        self.bands = tuple(config_dict['SURVEY']['PARAMETERS']['BANDS'].split(','))
+        self.species_map = {v['NAME']: k for k, v in config_dict['SPECIES'].items()}
+        self.cosmology = {k: v for k, v in config_dict['COSMOLOGY']['PARAMETERS'].items()}
+        self.configurations = {k: ConfigurationPlan(config_dict, k, self.species_map, list(self.bands))
+                               for k in config_dict['GEOMETRY'].keys()}
+        return
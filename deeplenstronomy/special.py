@@ -1,13 +1,98 @@
 """Special functions, useful for implementing correlations in sampled parameters.
-Utilizing the special keyword is discouraged, but makes it possible to update 
+Utilizing the special keyword is discouraged, but makes it possible to update
 all values drawn from a distribution prior to image generation.
+
+Each transform is defined by the magnitude offset it subtracts in every band. The
+offsets are applied to the magnitude columns of a light profile. The simulation plan
+finds the columns and offsets once per configuration with magnitude_offsets() and
+magnitude_columns(), and the functions named after each transform apply them to a
+single flat dictionary.
 """
 
+import numpy as np
+
 import deeplenstronomy.distributions as distributions
 
 # Examples of ways where a user can implement their own relationships not already
 # in deeplenstronomy
 
+def _parse_light_profile_mag(light_profile_mag):
+    """
+    Split a SPECIAL argument into the light profile and the number of magnitudes
+
+    :param light_profile_mag: light profile id + '-' + mags. E.g. 'LIGHT_PROFILE_1-2.5'
+    :return: light_profile: the light profile id
+    :return: mag: the number of magnitudes
+    """
+    return light_profile_mag.split('-')[0], float(light_profile_mag.split('-')[1])
+
+def _brighten_everything_offsets(mag, bands):
+    return [mag for band in bands]
+
+def _make_blueer_offsets(mag, bands):
+    # brighten g and r
+    mag_correction = {'g': mag, 'r': 0.5 * mag, 'i': 0.0, 'z': 0.0, 'Y': 0.0}
+    return [mag_correction[band] for band in bands]
+
+def _make_redder_offsets(mag, bands):
+    # brighten i, z, and Y
+    mag_correction = {'g': 0.0, 'r': 0.0, 'i': 0.5 * mag, 'z': mag, 'Y': 1.5 * mag}
+    return [mag_correction[band] for band in bands]
+
+TRANSFORMS = {'brighten_everything': _brighten_everything_offsets,
+              'make_blueer': _make_blueer_offsets,
+              'make_redder': _make_redder_offsets}
+
+
+def magnitude_offsets(mode, light_profile_mag, bands):
+    """
+    Calculate the magnitude offset of a transform in each band.
+
+    Args:
+        mode (str): name of the transform, a key of TRANSFORMS
+        light_profile_mag (str): light profile id to be recolored + '-' + mags to brighten. E.g. 'LIGHT_PROFILE_1-2.5'
+        bands (List[str]): bands used
+
+    Returns:
+        light_profile: the light profile id
+        offsets: np.array of the magnitudes to subtract in each band
+    """
+    light_profile, mag = _parse_light_profile_mag(light_profile_mag)
+    return light_profile, np.array(TRANSFORMS[mode](mag, bands), dtype=float)
+
+
+def magnitude_columns(columns, light_profile):
+    """
+    Find the magnitude columns of a light profile.
+
+    Args:
+        columns (List[str]): column names, e.g. the keys of one band of a flat dictionary
+        light_profile (str): light profile id, e.g. 'LIGHT_PROFILE_1'
+
+    Returns:
+        indices: list of the indices of the matching columns
+    """
+    return [idx for idx, column in enumerate(columns) if column.find(light_profile + '-magnitude') != -1]
+
+
+def _apply_to_output_dict(mode, output_dict, light_profile_mag):
+    """
+    Apply a transform to the magnitude entries of a flat dictionary
+
+    :param mode: name of the transform, a key of TRANSFORMS
+    :param output_dict: flat dictionary being used to simulate images
+    :param light_profile_mag: light profile id + '-' + mags. E.g. 'LIGHT_PROFILE_1-2.5'
+    :return: output_dict: the same dictionary with some overwritten values
+    """
+    band_list = list(output_dict.keys())
+    light_profile, offsets = magnitude_offsets(mode, light_profile_mag, band_list)
+    for band, offset in zip(band_list, offsets):
+        keys = list(output_dict[band].keys())
+        for idx in magnitude_columns(keys, light_profile):
+            output_dict[band][keys[idx]] = output_dict[band][keys[idx]] - offset
+    return output_dict
+
+
 def brighten_everything(output_dict, light_profile_mag, bands):
     """
     Brighten everything in a light profile by a given number of mags.
@@ -16,20 +101,11 @@ def brighten_everything(output_dict, light_profile_mag, bands):
         output_dict (dict): flat dictionary being used to simulate images
         light_profile_mag (str): light profile id to be recolored + '-' + mags to brighten. E.g. 'LIGHT_PROFILE_1-2.5'
         bands (str): comma-separated string of bands used
-    
+
     Returns:
         output_dict: the same dictionary with some overwritten values
     """
-
-    light_profile = light_profile_mag.split('-')[0]
-    mag = float(light_profile_mag.split('-')[1])
-    
-    for band, sim_dict in output_dict.items():
-        for k in sim_dict.keys():
-            if k.find(light_profile + '-magnitude') != -1:
-                output_dict[band][k] = output_dict[band][k] - mag
-
-    return output_dict
+    return _apply_to_output_dict('brighten_everything', output_dict, light_profile_mag)
 
 
 def make_blueer(output_dict, light_profile_mag, bands):
@@ -40,22 +116,11 @@ def make_blueer(output_dict, light_profile_mag, bands):
         output_dict (dict): flat dictionary being used to simulate images
         light_profile_mag (str): light profile id to be recolored + '-' + mags to brighten. E.g. 'LIGHT_PROFILE_1-2.5'
         bands (str): comma-separated string of bands used
-    
-    Returns: 
+
+    Returns:
         output_dict: the same dictionary with some overwritten values
     """
-    # brighten g and r
-
-    light_profile = light_profile_mag.split('-')[0]
-    mag = float(light_profile_mag.split('-')[1])
-    mag_correction = {'g': mag, 'r': 0.5 * mag, 'i': 0.0, 'z': 0.0, 'Y': 0.0}
-
-    for band, sim_dict in output_dict.items():
-        for k in sim_dict.keys():
-            if k.find(light_profile + '-magnitude') != -1:
-                output_dict[band][k] = output_dict[band][k] - mag_correction[band]
-
-    return output_dict
+    return _apply_to_output_dict('make_blueer', output_dict, light_profile_mag)
 
 def make_redder(output_dict, light_profile_mag, bands):
     """
@@ -65,20 +130,8 @@ def make_redder(output_dict, light_profile_mag, bands):
         output_dict (dict): flat dictionary being used to simulate images
         light_profile_mag (str): light profile id to be recolored + '-' + mags to brighten. E.g. 'LIGHT_PROFILE_1-2.5'
         bands (str): comma-separated string of bands used
-    
-    Returns: 
+
+    Returns:
         output_dict: the same dictionary with some overwritten values
     """
-    # brighten i, z, and Y
-    
-    light_profile = light_profile_mag.split('-')[0]
-    mag = float(light_profile_mag.split('-')[1])
-    mag_correction = {'g': 0.0, 'r': 0.0, 'i': 0.5 * mag, 'z': mag, 'Y': 1.5 * mag}
-
-    for band, sim_dict in output_dict.items():
-        for k in sim_dict.keys():
-            if k.find(light_profile + '-magnitude') != -1:
-                output_dict[band][k] = output_dict[band][k] - mag_correction[band]
-
-    return output_dict
-
+    return _apply_to_output_dict('make_redder', output_dict, light_profile_mag)
@@ -13,21 +13,62 @@ import pandas as pd
 from scipy.interpolate import interp1d
 from scipy.integrate import quad
 
+# Filter transmission curves and normalizations, keyed by filter file and modification time
+_passband_cache = {}
+
 class LCGen():
     """Light Curve Generation"""    
     def __init__(self, bands=''):
         """
-        Initialize the LCGen object, download data if necessary, collect 
-        necessary filter and sed information.
+        Initialize the LCGen object. Seds and filter transmission curves are
+        only collected (and downloaded if necessary) once a model that needs
+        them is used.
         
         Args:
             bands (str): comma-separated string of bands, i.e. 'g,r,i,z'
         """
-        # Check for filtes / seds and download if necessary
-        self.__download_data()
+        self.bands = bands.split(',')
+
+        # Load corrections
+        self._load_corrections()
         
-        # Collect sed files
+        return
+
+    def __download_data(self, path):
+        """
+        Check for required data and download if it is missing
+
+        :param path: the data directory needed, e.g. 'seds/ia' or 'filters'
+        """
+        if os.path.exists(path):
+            return
+        if path.startswith('seds/') and not os.path.exists('seds'):
+            os.mkdir('seds')
+        os.system('svn checkout https://github.com/rmorgan10/deeplenstronomy_data/trunk/' + path)
+        if path.startswith('seds/'):
+            os.system('mv {0} seds'.format(path.split('/')[-1]))
+
+    def _load_ia_seds(self):
+        """
+        Collect SN-Ia sed files
+
+        :assign ia_sed_files: list of SN-Ia sed filenames
+        """
+        if hasattr(self, 'ia_sed_files'):
+            return
+        self.__download_data('seds/ia')
         self.ia_sed_files = glob.glob('seds/ia/*.dat')
+        return
+
+    def _load_cc_seds(self):
+        """
+        Collect Core-Collapse SNe sed files and their weights
+
+        :assign cc_sed_files: list of SN-CC sed filenames
+        """
+        if hasattr(self, 'cc_sed_files'):
+            return
+        self.__download_data('seds/cc')
         cc_sed_files = glob.glob('seds/cc/*.SED')
         bad_seds = ['seds/cc/SDSS-018892.SED',
                     'seds/cc/Nugent+Scolnic_IIL.SED',
@@ -38,50 +79,44 @@ class LCGen():
                     'seds/cc/SDSS-019323.SED']
         self.cc_sed_files = [x for x in cc_sed_files if x not in bad_seds]
         self.__read_cc_weights()
-        
-        # Collect filter transmission curves
-        self.filter_files = glob.glob('filters/*.dat')
-        self.bands = bands.split(',')
-
-        # Load corrections
-        self._load_corrections()
-        
-        # Interpolate the transmission curves
-        self.norm_dict = {}
-        for band in self.bands:
-            transmission_frequency, transmission_wavelength = self.__read_passband(band)
-            setattr(self, '{0}_transmission_frequency'.format(band), transmission_frequency)
-            setattr(self, '{0}_transmission_wavelength'.format(band), transmission_wavelength)
-            
-            # Store normalizations
-            lower_bound = eval('self._{0}_obs_frame_freq_min'.format(band))
-            upper_bound = eval('self._{0}_obs_frame_freq_max'.format(band))        
-            frequency_arr = np.linspace(upper_bound, lower_bound, 10000)
-            norm_arr = np.ones(len(frequency_arr)) * 3631.0
-            
-            norm_sed = pd.DataFrame(data=np.vstack((norm_arr, frequency_arr)).T,
-                                    columns=['FLUX', 'FREQUENCY_REST'])
-            self.norm_dict[band] = self._integrate_through_band(norm_sed, band, 0.0, frame='REST')
-        
         return
 
-    def __download_data(self):
+    def _load_passbands(self):
         """
-        Check for required data and download if it is missing
+        Interpolate the transmission curves and calculate the normalization of each band.
+        Results are reused for every LCGen reading the same, unmodified filter file.
+
+        :assign norm_dict: flat-spectrum normalization for each band
         """
-        if not os.path.exists('seds'):
-            os.mkdir('seds')
-        if not os.path.exists('seds/ia'):
-            os.system('svn checkout https://github.com/rmorgan10/deeplenstronomy_data/trunk/seds/ia')
-            os.system('mv ia seds')
-        if not os.path.exists('seds/cc'):
-            os.system('svn checkout https://github.com/rmorgan10/deeplenstronomy_data/trunk/seds/cc')
-            os.system('mv cc seds')
-        if not os.path.exists('seds/kn'):
-            os.system('svn checkout https://github.com/rmorgan10/deeplenstronomy_data/trunk/seds/kn')
-            os.system('mv kn seds')
-        if not os.path.exists('filters'):
-            os.system('svn checkout https://github.com/rmorgan10/deeplenstronomy_data/trunk/filters')
+        if hasattr(self, 'norm_dict'):
+            return
+        self.__download_data('filters')
+        self.filter_files = glob.glob('filters/*.dat')
+
+        norm_dict = {}
+        for band in self.bands:
+            #Target filter file associated with band
+            filter_file = [x for x in self.filter_files if x.find('_' + band) != -1][0]
+            key = (os.path.abspath(filter_file), os.path.getmtime(filter_file))
+
+            if key not in _passband_cache:
+                passband_info = self.__read_passband(filter_file)
+                for attr, value in passband_info.items():
+                    setattr(self, attr.format(band), value)
+
+                # Store normalizations
+                frequency_arr = np.linspace(passband_info['_{0}_obs_frame_freq_max'], passband_info['_{0}_obs_frame_freq_min'], 10000)
+                norm_arr = np.ones(len(frequency_arr)) * 3631.0
+                norm_sed = pd.DataFrame(data=np.vstack((norm_arr, frequency_arr)).T,
+                                        columns=['FLUX', 'FREQUENCY_REST'])
+                _passband_cache[key] = (passband_info, self._integrate_through_band(norm_sed, band, 0.0, frame='REST'))
+
+            passband_info, norm_dict[band] = _passband_cache[key]
+            for attr, value in passband_info.items():
+                setattr(self, attr.format(band), value)
+
+        self.norm_dict = norm_dict
+        return
     
     def __read_cc_weights(self):
         """
@@ -96,23 +131,20 @@ class LCGen():
         return
         
     
-    def __read_passband(self, band):
+    def __read_passband(self, filter_file):
         """
         Read and interolate filter transmission curves
         
-        :param band: the single-letter band identifier
-        :return: transmisison_frequency: interpolated filter transmission as a function of frequency
-        :return: transmisison_wavelength: interpolated filter transmission as a function of wavelength
+        :param filter_file: the filter transmission file associated with the band
+        :return: passband_info: dictionary of attribute name templates (formatted with the band) and values, including
+          the transmission interpolated as a function of frequency and as a function of wavelength
         """
-        #Target filter file associated with band
-        filter_file = [x for x in self.filter_files if x.find('_' + band) != -1][0]
-        
         # Read and format filter transmission info
         passband = pd.read_csv(filter_file, 
                                names=['WAVELENGTH', 'TRANSMISSION'], 
                                delim_whitespace=True, comment='#')
-        setattr(self, '_{0}_obs_frame_freq_min'.format(band), 2.99792458e18 / np.max(passband['WAVELENGTH'].values))
-        setattr(self, '_{0}_obs_frame_freq_max'.format(band), 2.99792458e18 / np.min(passband['WAVELENGTH'].values))
+        passband_info = {'_{0}_obs_frame_freq_min': 2.99792458e18 / np.max(passband['WAVELENGTH'].values),
+                         '_{0}_obs_frame_freq_max': 2.99792458e18 / np.min(passband['WAVELENGTH'].values)}
         
         # Add boundary terms to cover the whole range
         passband.loc[passband.shape[0]] = (1.e-9, 0.0)
@@ -120,12 +152,12 @@ class LCGen():
         
         # Convert to frequency using speed of light in angstroms
         passband['FREQUENCY'] = 2.99792458e18 / passband['WAVELENGTH'].values
-        setattr(self, '{0}_obs_frame_transmission'.format(band), passband)
+        passband_info['{0}_obs_frame_transmission'] = passband
         
-        # Interpolate and return
-        transmission_frequency = interp1d(passband['FREQUENCY'].values, passband['TRANSMISSION'].values, fill_value=0.0)
-        transmission_wavelength = interp1d(passband['WAVELENGTH'].values, passband['TRANSMISSION'].values, fill_value=0.0)
-        return transmission_frequency, transmission_wavelength
+        # Interpolate
+        passband_info['{0}_transmission_frequency'] = interp1d(passband['FREQUENCY'].values, passband['TRANSMISSION'].values, fill_value=0.0)
+        passband_info['{0}_transmission_wavelength'] = interp1d(passband['WAVELENGTH'].values, passband['TRANSMISSION'].values, fill_value=0.0)
+        return passband_info
 
     
     def _read_sed(self, sed_filename):
@@ -452,6 +484,7 @@ class LCGen():
 
         sed_filename = 'seds/kn/kn.SED'
         if sed is None:
+            self.__download_data('seds/kn')
             attr_name = sed_filename.split('.')[0]
             if hasattr(self, attr_name):
                 sed = getattr(self, attr_name)
@@ -481,6 +514,7 @@ class LCGen():
         
         # Read rest-frame sed if not supplied as argument
         if sed is None:
+            self._load_ia_seds()
             if sed_filename is None:
                 sed_filename = random.choice(self.ia_sed_files)
             
@@ -518,6 +552,7 @@ class LCGen():
         """
 
         # If sed not specified, choose sed based on weight map
+        self._load_cc_seds()
         if sed is None:
             if sed_filename is None:
                 sed_filename = random.choices(self.cc_sed_files, weights=self.cc_weights, k=1)[0]
@@ -558,6 +593,9 @@ class LCGen():
               - 'sed' contains the filename of the sed used  
         """
         
+        # Filter transmission curves are only needed for sed-based models
+        self._load_passbands()
+
         # Adjust nites
         nites = {}
         sed_nites = np.unique(sed['NITE'].values)
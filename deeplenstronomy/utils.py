@@ -1,13 +1,32 @@
 """Helper functions and classes utilized internally."""
 
+from collections import OrderedDict
+import math
 import os
 import sys
 import yaml
 
 from astropy.io import fits
+import h5py
 import numpy as np
 import pandas as pd
 from scipy.interpolate import LinearNDInterpolator, interp1d
+from scipy.spatial import cKDTree, Delaunay
+
+from deeplenstronomy.output import _has_pyarrow
+
+# largest interpolation grid evaluated densely, larger grids are sampled through the triangulation
+MAX_INTERPOLATION_GRID_SIZE = 10**6
+
+# largest number of dimensions triangulated, the size of a Delaunay triangulation grows quickly
+# with the dimensions so tables with more parameters are sampled from a kernel density estimate
+MAX_TRIANGULATION_DIMENSIONS = 4
+
+# number of nearest neighbours setting the kernel width of a point in more than MAX_TRIANGULATION_DIMENSIONS
+NUM_SAMPLING_NEIGHBOURS = 8
+
+# number of simulations matched to background images at a time
+BACKGROUND_QUERY_CHUNK_SIZE = 100000
 
 def dict_select(input_dict, keys):
     """
@@ -69,53 +88,349 @@ class KeyPathDict(dict):
         # Inherit attributes of the base dict
         super().__init__(base_dict)
 
-        # Set the keypath sepatator and find all nested keys
+        # Set the keypath sepatator and index all nested keys
         self.keypath_separator = keypath_separator
-        self.kls = self._keylists(base_dict)
+        self._index = {}
+        self._keypaths = None
+        self._add_to_index(self, ())
 
         return
 
-    def _get_keylist(self, item, parent_keys):
+    def _add_to_index(self, item, parent_path):
         """
-        Recursively search for all nested dictionary keys.
+        Recursively record the container and key of every nested dictionary key.
 
         :param item: parent dictionary or value in a dictionary
-        :param parent_keys: the keys of the dictionary one level up
-        :return: keylist: list, list of all keys on a single level in the dictionary
+        :param parent_path: tuple of the keys (as strings) of the dictionary one level up
         """
-        keylist = []
         for key, value in item.items():
-            # Collect the keys of the dictionary
-            keys = parent_keys + [key]
-            keylist += [keys]
+            path = parent_path + ('{}'.format(key),)
+            self._index[path] = (item, key)
             # If the value is a dict, recursively search that dict
             if isinstance(value, dict):
-                keylist += self._get_keylist(value, keys)
-        return keylist
+                self._add_to_index(value, path)
+        return
 
-    def _keylists(self, d):
+    def _remove_from_index(self, item, parent_path):
         """
-        Shell function to call the recursive key search
+        Recursively remove the keys of a nested dictionary from the index.
 
-        :param d: dict, the dictionary to search
-        :return: keylist: list, nested list of all keys in the dictionary
+        :param item: dictionary that is being replaced
+        :param parent_path: tuple of the keys (as strings) of the dictionary
         """
-        return self._get_keylist(d, [])
-    
-    def keypaths(self):
+        for key, value in item.items():
+            path = parent_path + ('{}'.format(key),)
+            self._index.pop(path, None)
+            if isinstance(value, dict):
+                self._remove_from_index(value, path)
+        return
+
+    def _path(self, keypath):
+        """
+        Convert a keypath string or sequence of keys to an index key
+
+        :param keypath: str joined by keypath_separator, or a list / tuple of keys
+        :return: path: tuple of keys as strings
+        """
+        if isinstance(keypath, str):
+            return tuple(keypath.split(self.keypath_separator))
+        return tuple('{}'.format(key) for key in keypath)
+
+    def get_keypath(self, keypath):
+        """
+        Get the value at a keypath.
+
+        Args:
+            keypath (str or list): keys joined by the keypath_separator, or a list of keys
+
+        Returns:
+            The value in the dictionary at the location of the keypath
+
+        Raises:
+            KeyError: if the keypath does not exist
+        """
+        parent, key = self._index[self._path(keypath)]
+        return parent[key]
+
+    def set_keypath(self, keypath, value):
+        """
+        Set the value at a keypath, creating the last key if needed. Use this instead of 
+        item assignment on nested dictionaries to keep the keypath index up to date.
+
+        Args:
+            keypath (str or list): keys joined by the keypath_separator, or a list of keys
+            value: the new value
+
+        Raises:
+            KeyError: if the parent of the keypath does not exist
+        """
+        path = self._path(keypath)
+        if path in self._index:
+            parent, key = self._index[path]
+            # drop the index entries below the old value
+            if isinstance(parent[key], dict):
+                self._remove_from_index(parent[key], path)
+        else:
+            parent = self if len(path) == 1 else self.get_keypath(path[:-1])
+            key = path[-1] if isinstance(keypath, str) else keypath[-1]
+
+        parent[key] = value
+        self._index[path] = (parent, key)
+        if isinstance(value, dict):
+            self._add_to_index(value, path)
+        self._keypaths = None
+        return
+
+    def has_keypath(self, keypath):
+        """
+        Check whether a keypath exists.
+
+        Args:
+            keypath (str or list): keys joined by the keypath_separator, or a list of keys
+
+        Returns:
+            bool
+        """
+        return self._path(keypath) in self._index
+
+    def keypaths(self, prefix=None):
         """
         Join the keylists using the keypath_separator.
 
+        Args:
+            prefix (str, optional, default=None): only return this keypath and the keypaths below it,
+                or only the keypaths below it if it ends with the keypath_separator
+
         Returns: 
-            list of all keypaths in the dictionary as strings
+            sorted list of all keypaths in the dictionary as strings
+        """
+        if prefix is None:
+            if self._keypaths is None:
+                self._keypaths = sorted([self.keypath_separator.join(path) for path in self._index.keys()])
+            return self._keypaths[:]
+
+        path = self._path(prefix.rstrip(self.keypath_separator))
+        if path not in self._index:
+            return []
+        paths = [] if prefix.endswith(self.keypath_separator) else [path]
+        parent, key = self._index[path]
+        if isinstance(parent[key], dict):
+            self._collect_paths(parent[key], path, paths)
+        return sorted([self.keypath_separator.join(x) for x in paths])
+
+    def _collect_paths(self, item, parent_path, paths):
         """
-        kps = [self.keypath_separator.join(['{}'.format(key) for key in kl]) for kl in self.kls]
-        kps.sort()
-        return kps
+        Recursively list the paths of the keys of a nested dictionary.
+
+        :param item: dictionary to walk
+        :param parent_path: tuple of the keys (as strings) of the dictionary
+        :param paths: list the paths are appended to
+        """
+        for key, value in item.items():
+            path = parent_path + ('{}'.format(key),)
+            paths.append(path)
+            if isinstance(value, dict):
+                self._collect_paths(value, path, paths)
+        return
+
+class AliasTable():
+    def __init__(self, weights):
+        """
+        Alias table for drawing indices with probabilities proportional to weights.
+        Building the table is O(n) and every draw afterwards is O(1).
+
+        Args:
+            weights (np.array): non-negative weight of each index
+        """
+        weights = np.asarray(weights, dtype=float)
+        num = len(weights)
+        prob = weights * num / weights.sum()
+        alias = np.arange(num)
+
+        small = np.where(prob < 1.0)[0]
+        large = np.where(prob >= 1.0)[0]
+        while len(small) > 0 and len(large) > 0:
+            # lay the deficits of the small columns end to end along the excesses of the large
+            # columns, and alias each small column to the large column where its deficit ends
+            deficit_ends = np.cumsum(1.0 - prob[small])
+            excess_ends = np.cumsum(prob[large] - 1.0)
+            owner = np.minimum(np.searchsorted(excess_ends, deficit_ends), len(large) - 1)
+            alias[small] = large[owner]
+            prob[large] -= np.bincount(owner, weights=1.0 - prob[small], minlength=len(large))
+
+            # a large column that gave away more than its excess is small in the next pass
+            small = large[prob[large] < 1.0]
+            large = large[prob[large] >= 1.0]
+
+        # leftover columns are only off from 1 by rounding
+        prob[small] = 1.0
+        prob[large] = 1.0
+
+        self.prob = prob
+        self.alias = alias
+        return
+
+    def draw(self, size):
+        """
+        Draw indices from the table
+
+        Args:
+            size (int): the number of draws
+
+        Returns:
+            np.array of drawn indices
+        """
+        columns = np.random.randint(0, len(self.prob), size=size)
+        keep = np.random.uniform(size=size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
+
+# number of USERDIST tables kept in memory, the least recently used table is dropped first
+DISTRIBUTION_CACHE_SIZE = 8
+
+# USERDIST file extensions read as binary tables, see _read_distribution_table
+BINARY_DISTRIBUTION_EXTENSIONS = ['.npy', '.h5', '.hdf5', '.parquet']
+
+# number of rows of a binary USERDIST table read at a time when it is sampled
+DISTRIBUTION_CHUNK_SIZE = 10**6
+
+# USERDIST tables and their alias tables, keyed by file and modification time
+_distribution_cache = OrderedDict()
+
+def _distribution_entry(filename):
+    """
+    Get the cache entry of a USERDIST file, starting a new one if the file is new or has changed
+
+    :param filename: the file containing the distribution
+    :return: entry: dictionary holding, once they are needed, the table ('df') or the alias table
+    """
+    path = os.path.abspath(filename)
+    key = (path, os.path.getmtime(filename))
+    if key in _distribution_cache:
+        _distribution_cache.move_to_end(key)
+        return _distribution_cache[key]
+
+    # drop older versions of the file and the least recently used tables
+    for old_key in [x for x in _distribution_cache.keys() if x[0] == path]:
+        del _distribution_cache[old_key]
+    while len(_distribution_cache) >= DISTRIBUTION_CACHE_SIZE:
+        _distribution_cache.popitem(last=False)
+
+    _distribution_cache[key] = {}
+    return _distribution_cache[key]
+
+def _read_distribution_table(filename):
+    """
+    Read a USERDIST file based on its extension. Binary tables are .npy structured arrays,
+    .h5/.hdf5 files with one dataset per column, and .parquet files. Anything else is read
+    as whitespace-separated text with a header row.
+
+    :param filename: the file containing the distribution
+    :return: df: pandas.DataFrame containing the tabular distribution
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.npy':
+        table = np.load(filename, mmap_mode='r')
+        return pd.DataFrame({name: np.asarray(table[name]) for name in table.dtype.names})
+    elif extension in ['.h5', '.hdf5']:
+        with h5py.File(filename, 'r') as hf:
+            return pd.DataFrame({name: hf[name][()] for name in hf.keys()})
+    elif extension == '.parquet':
+        return pd.read_parquet(filename)
+    else:
+        return pd.read_csv(filename, delim_whitespace=True)
+
+def _read_distribution_columns(filename):
+    """
+    Read the column names of a USERDIST file. Only the header of a binary table is read.
+
+    :param filename: the file containing the distribution
+    :return: columns: list of the column names, in the order of _read_distribution_table
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.npy':
+        return list(np.load(filename, mmap_mode='r').dtype.names)
+    elif extension in ['.h5', '.hdf5']:
+        with h5py.File(filename, 'r') as hf:
+            return list(hf.keys())
+    elif extension == '.parquet' and _has_pyarrow():
+        import pyarrow.parquet as pq
+        # pandas stores a named or non-default index as extra columns
+        return [x for x in pq.read_schema(filename).names if not x.startswith('__index_level_')]
+    else:
+        entry = _distribution_entry(filename)
+        if 'df' not in entry:
+            entry['df'] = _read_distribution_table(filename)
+        return list(entry['df'].columns)
+
+def _iter_distribution_chunks(filename, names):
+    """
+    Read columns of a binary USERDIST table DISTRIBUTION_CHUNK_SIZE rows at a time
+
+    :param filename: the file containing the distribution
+    :param names: list of the columns to read
+    :return: generator of lists of arrays, one array of the chunk for each name
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.npy':
+        table = np.load(filename, mmap_mode='r')
+        for start in range(0, len(table), DISTRIBUTION_CHUNK_SIZE):
+            chunk = table[start:start + DISTRIBUTION_CHUNK_SIZE]
+            yield [np.array(chunk[name]) for name in names]
+    elif extension in ['.h5', '.hdf5']:
+        with h5py.File(filename, 'r') as hf:
+            for start in range(0, len(hf[names[0]]), DISTRIBUTION_CHUNK_SIZE):
+                yield [hf[name][start:start + DISTRIBUTION_CHUNK_SIZE] for name in names]
+    elif _has_pyarrow():
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(filename).iter_batches(batch_size=DISTRIBUTION_CHUNK_SIZE, columns=names):
+            yield [batch.column(idx).to_numpy(zero_copy_only=False) for idx in range(len(names))]
+    else:
+        # without pyarrow the parquet reader of pandas can only read whole columns
+        df = pd.read_parquet(filename, columns=names)
+        yield [df[name].values for name in names]
+
+def _read_distribution_rows(filename, names, indices):
+    """
+    Read rows of a binary USERDIST table one chunk at a time
+
+    :param filename: the file containing the distribution
+    :param names: list of the columns to read
+    :param indices: array of the rows to read, which can repeat
+    :return: values: array with shape (len(indices), len(names))
+    """
+    rows, inverse = np.unique(indices, return_inverse=True)
+    values, start = [], 0
+    for chunk in _iter_distribution_chunks(filename, names):
+        chunk_rows = rows[(rows >= start) & (rows < start + len(chunk[0]))] - start
+        values.append(np.column_stack([x[chunk_rows] for x in chunk]))
+        start += len(chunk[0])
+    return np.concatenate(values)[inverse]
+
+def read_distribution_columns(filename):
+    """
+    Read the column names of a USERDIST file. Binary tables (see _read_distribution_table)
+    are not read into memory, text tables are kept in memory like in read_distribution_file.
+
+    Args:
+        filename (str): the file containing the distribution
+
+    Returns:
+        columns (List[str]): the column names
+
+    Raises:
+        AssertionError: if "WEIGHT" is not one of the column names
+    """
+    columns = _read_distribution_columns(filename)
+
+    assert 'WEIGHT' in columns, "'WEIGHT' must be a column in {}".format(filename)
+
+    return columns
 
 def read_distribution_file(filename):
     """
-    Load the file information into a pandas dataframe
+    Load the file information into a pandas dataframe. The DISTRIBUTION_CACHE_SIZE most
+    recently used files are kept in memory until they are modified. See 
+    _read_distribution_table for the formats.
     
     Args:
         filename (str): the file containing the distribution    
@@ -126,13 +441,115 @@ def read_distribution_file(filename):
     Raises:
         AssertionError: if "WEIGHT" is not one of the column names
     """
-    df = pd.read_csv(filename, delim_whitespace=True)
+    entry = _distribution_entry(filename)
+    if 'df' not in entry:
+        entry['df'] = _read_distribution_table(filename)
+    df = entry['df']
 
     assert 'WEIGHT' in df.columns, "'WEIGHT' must be a column in {}".format(filename)
 
     return df
         
 
+def _sample_triangulation(points, weights, size):
+    """
+    Sample the piecewise linear interpolation of weights defined on a set of points.
+    A simplex of the Delaunay triangulation is chosen by its probability mass, then a
+    point inside it is drawn with a density proportional to the interpolated weight.
+
+    :param points: array with shape (number of points, number of dimensions)
+    :param weights: array of the weight of each point
+    :param size: the number of draws
+    :return: choices: array with shape (size, number of dimensions)
+    """
+    triangulation = Delaunay(points)
+    vertices = points[triangulation.simplices]
+    vertex_weights = weights[triangulation.simplices]
+    dimensions = points.shape[1]
+
+    # mass of a simplex is its volume times the mean weight of its vertices
+    volumes = np.abs(np.linalg.det(vertices[:, 1:, :] - vertices[:, :1, :])) / math.factorial(dimensions)
+    masses = volumes * vertex_weights.mean(axis=1)
+    simplex_draws = np.random.choice(np.arange(len(masses)), size=size, p=masses / masses.sum())
+
+    # a density linear in the barycentric coordinates is a mixture of Dirichlet distributions,
+    # with the extra concentration on each vertex chosen in proportion to its weight
+    draw_weights = vertex_weights[simplex_draws]
+    cumulative = np.cumsum(draw_weights, axis=1)
+    vertex_draws = (np.random.uniform(size=(size, 1)) * cumulative[:, -1:] > cumulative).sum(axis=1)
+    concentration = np.ones((size, dimensions + 1))
+    concentration[np.arange(size), vertex_draws] += 1.0
+    barycentric = np.random.standard_gamma(concentration)
+    barycentric /= barycentric.sum(axis=1, keepdims=True)
+
+    return np.einsum('ij,ijk->ik', barycentric, vertices[simplex_draws])
+
+def _sample_kde(points, weights, size):
+    """
+    Sample a kernel density estimate of the weights for tables with too many dimensions to
+    triangulate. A point is chosen by its weight and moved by a gaussian kernel. The width of
+    the kernel follows the mean distance to the NUM_SAMPLING_NEIGHBOURS nearest neighbours of the
+    point, with the spread of the linear interpolation between neighbours, so the kernels are
+    narrow where the table is dense and wide where it is sparse. Distances are measured in units
+    of the range of each parameter, and draws outside the range are drawn again.
+
+    :param points: array with shape (number of points, number of dimensions)
+    :param weights: array of the weight of each point
+    :param size: the number of draws
+    :return: choices: array with shape (size, number of dimensions)
+    """
+    num_neighbours = min(NUM_SAMPLING_NEIGHBOURS, len(points) - 1)
+    if num_neighbours == 0:
+        return points[np.zeros(size, dtype=int)]
+
+    low, high = points.min(axis=0), points.max(axis=0)
+    width = np.where(high > low, high - low, 1.0)
+    scaled_points = (points - low) / width
+
+    # the closest point of each point is itself, so the neighbours start at the second
+    distances, _ = cKDTree(scaled_points).query(scaled_points, k=num_neighbours + 1)
+    # a triangular kernel reaching the neighbours has a standard deviation of its half-width / sqrt(6)
+    bandwidths = distances[:, 1:].mean(axis=1) / np.sqrt(6.0)
+
+    scaled_draws = np.empty((0, points.shape[1]))
+    while len(scaled_draws) < size:
+        point_draws = np.random.choice(np.arange(len(points)), size=size - len(scaled_draws), p=weights / weights.sum())
+        draws = scaled_points[point_draws] + np.random.normal(size=(len(point_draws), points.shape[1])) * bandwidths[point_draws, np.newaxis]
+        scaled_draws = np.concatenate((scaled_draws, draws[np.all((draws >= 0.0) & (draws <= 1.0), axis=1)]))
+
+    return low + scaled_draws * (high - low)
+
+def _sample_grid(sampler, points, weights, size, step):
+    """
+    Draw points of the interpolation grid from a sampler of the interpolated distribution, with
+    the probability of each grid point proportional to its interpolated weight like the dense grid.
+    A draw is moved to one of the corners of its grid cell with the weights of a linear interpolation
+    between them. Grid points on the edge of the range in a dimension only collect draws from one side,
+    so the draws are kept with a probability that makes up for it.
+
+    :param sampler: function drawing from the interpolated distribution, like _sample_triangulation
+    :param points: array with shape (number of points, number of dimensions)
+    :param weights: array of the weight of each point
+    :param size: the number of draws
+    :param step: the number of steps of the grid in each dimension
+    :return: choices: array with shape (size, number of dimensions)
+    """
+    low, high = points.min(axis=0), points.max(axis=0)
+    width = np.where(high > low, high - low, 1.0)
+    dimensions = points.shape[1]
+
+    grid_idx = np.empty((0, dimensions))
+    while len(grid_idx) < size:
+        # about one in 2**dimensions draws is kept away from the edges
+        scaled_draws = (sampler(points, weights, (size - len(grid_idx)) * 2**dimensions) - low) / width * (step - 1)
+        lower_idx = np.clip(np.floor(scaled_draws), 0, step - 2)
+        draw_idx = lower_idx + (np.random.uniform(size=scaled_draws.shape) < scaled_draws - lower_idx)
+        num_edges = ((draw_idx == 0) | (draw_idx == step - 1)).sum(axis=1)
+        keep = np.random.uniform(size=len(draw_idx)) < 2.0**(num_edges - dimensions)
+        grid_idx = np.concatenate((grid_idx, draw_idx[keep]))
+
+    return low + grid_idx[:size] * (high - low) / (step - 1)
+
 def draw_from_user_dist(filename, size, mode, step=10):
     """
     Interpolate a user-specified N-dimensional probability distribution and
@@ -141,8 +558,15 @@ def draw_from_user_dist(filename, size, mode, step=10):
     Args:
         filename (str): the file containing the distribution 
         size (int):  the number of times to sample the probability distribution 
-        mode (str): choose from ['interpolate', 'sample'] 
-        step (int): the number of steps on the interpolation grid  
+        mode (str): choose from ['interpolate', 'sample']. Binary tables are sampled without
+            reading them into memory: their weights are read DISTRIBUTION_CHUNK_SIZE rows at a
+            time to build the alias table, which is kept with the weights, and the drawn rows
+            are read the same way
+        step (int): the number of steps on the interpolation grid. Grids with more than
+            MAX_INTERPOLATION_GRID_SIZE points are not evaluated densely: draws come from the
+            interpolated distribution directly and are moved to a corner of their grid cell. Above
+            MAX_TRIANGULATION_DIMENSIONS parameters, the interpolation is approximated by a kernel
+            density estimate of the table
         
     Returns:
         parameters: list, the names of the paramters
@@ -152,6 +576,15 @@ def draw_from_user_dist(filename, size, mode, step=10):
         NotImplementedError: if a mode other than "sample" or "interpolate" is passed
     """
 
+    if mode == 'sample' and os.path.splitext(filename)[1].lower() in BINARY_DISTRIBUTION_EXTENSIONS:
+        # only the weights are kept in memory, and the drawn rows are read from the file
+        entry = _distribution_entry(filename)
+        if 'alias' not in entry:
+            entry['parameters'] = [x for x in read_distribution_columns(filename) if x != 'WEIGHT']
+            entry['alias'] = AliasTable(np.concatenate([x[0] for x in _iter_distribution_chunks(filename, ['WEIGHT'])]))
+        index_arr = entry['alias'].draw(size)
+        return entry['parameters'], _read_distribution_rows(filename, entry['parameters'], index_arr)
+
     df = read_distribution_file(filename)
 
     parameters = [x for x in df.columns if x != 'WEIGHT']
@@ -160,7 +593,7 @@ def draw_from_user_dist(filename, size, mode, step=10):
 
     if mode == 'interpolate':
         # 2+ Dimension case
-        if len(parameters) > 1:
+        if len(parameters) > 1 and step**len(parameters) <= MAX_INTERPOLATION_GRID_SIZE:
             # Interpolate the distribution and evaluate it on a grid of all possible parameter combinations
             interpolator = LinearNDInterpolator(points, weights, fill_value=0.0)
             grid_vectors = [np.linspace(df[x].values.min(), df[x].values.max(), step) for x in parameters]
@@ -171,6 +604,14 @@ def draw_from_user_dist(filename, size, mode, step=10):
             draws = np.random.choice(np.arange(len(param_grids)), size=size, p=weighted_params/weighted_params.sum())
             choices = param_grids[draws]
 
+        elif len(parameters) > 1:
+            # The grid is too large to evaluate, so draw from the interpolated distribution directly
+            # and move the draws to points of the grid
+            if len(parameters) <= MAX_TRIANGULATION_DIMENSIONS:
+                choices = _sample_grid(_sample_triangulation, points, weights, size, step)
+            else:
+                choices = _sample_grid(_sample_kde, points, weights, size, step)
+
         elif len(parameters) == 1:
             # Interpolate the 1D grid
             grid = np.linspace(df[parameters].values.min(), df[parameters].values.max(), step)
@@ -181,7 +622,10 @@ def draw_from_user_dist(filename, size, mode, step=10):
             choices = np.random.choice(grid, size=size, p=weighted_params/weighted_params.sum())
 
     elif mode == 'sample':
-        index_arr = np.random.choice(np.arange(len(points), dtype=int), size=size, p=weights / weights.sum())
+        entry = _distribution_entry(filename)
+        if 'alias' not in entry:
+            entry['alias'] = AliasTable(weights)
+        index_arr = entry['alias'].draw(size)
         choices = points[index_arr]
 
     else:
@@ -189,32 +633,14 @@ def draw_from_user_dist(filename, size, mode, step=10):
             
     return parameters, choices
 
-def read_images(im_dir, im_size, bands):
+def _resize_images(im_array, im_size):
     """
-    Read images into memory and resize to match simulations.
+    Pad or crop images to match simulations
 
-    Args:
-        im_dir (str): path to directory of images 
-        im_size (int): numPix along onle side of an image 
-        bands (List[str]): list of bands used in simulation 
-
-    Returns:
-        array of processed images
+    :param im_array: array of images with shape (number of images, number of bands, height, width)
+    :param im_size: numPix along one side of an image
+    :return: im_array: the resized images
     """
-    # Load images into an array
-    im_array = []
-    for band in bands:
-        if not os.path.exists(im_dir + '/' + band + '.fits'):
-            print(im_dir + " is missing " + band + ".fits")
-            sys.exit()
-            
-        hdu = fits.open(im_dir + '/' + band + '.fits')
-        im_array.append(hdu[0].data)
-        hdu.close()
-
-    im_array = np.swapaxes(np.array(im_array), 0, 1)
-    
-    # Resize the images to match the simulations
     if im_array.shape[-1] < im_size:
         # pad with zeros
         pad_width = ((0,0), (0,0), (0,0), (im_size // 4, im_size // 4 + 1))
@@ -237,6 +663,75 @@ def read_images(im_dir, im_size, bands):
 
     return im_array
 
+class BackgroundBank():
+    def __init__(self, im_dir, im_size, bands):
+        """
+        Image backgrounds read from memory-mapped {band}.fits files. Images are only
+        read, stacked across bands, and resized to match simulations when indexed.
+
+        Args:
+            im_dir (str): path to directory of images 
+            im_size (int): numPix along one side of an image 
+            bands (List[str]): list of bands used in simulation 
+        """
+        self.im_size = im_size
+        self._hdus = []
+        for band in bands:
+            if not os.path.exists(im_dir + '/' + band + '.fits'):
+                print(im_dir + " is missing " + band + ".fits")
+                sys.exit()
+
+            self._hdus.append(fits.open(im_dir + '/' + band + '.fits', memmap=True))
+        return
+
+    def __len__(self):
+        return len(self._hdus[0][0].data)
+
+    def __getitem__(self, indices):
+        """
+        Read the backgrounds at the given indices
+
+        Args:
+            indices (int, slice, or array of ints): which images to read
+
+        Returns:
+            array of processed images with shape (number of images, number of bands, numPix, numPix),
+            or (number of bands, numPix, numPix) for a single index
+        """
+        single = np.ndim(indices) == 0 and not isinstance(indices, slice)
+        if single:
+            indices = [indices]
+        im_array = _resize_images(np.stack([hdu[0].data[indices] for hdu in self._hdus], axis=1), self.im_size)
+        return im_array[0] if single else im_array
+
+    def close(self):
+        """
+        Close the underlying FITS files
+        """
+        for hdu in self._hdus:
+            hdu.close()
+        return
+
+def read_images(im_dir, im_size, bands):
+    """
+    Read images into memory and resize to match simulations. Use BackgroundBank
+    to read only the images that are needed.
+
+    Args:
+        im_dir (str): path to directory of images 
+        im_size (int): numPix along onle side of an image 
+        bands (List[str]): list of bands used in simulation 
+
+    Returns:
+        array of processed images
+    """
+    bank = BackgroundBank(im_dir, im_size, bands)
+    im_array = bank[:]
+    bank.close()
+
+    return im_array
+
+
 def organize_image_backgrounds(im_dir, image_bank_size, config_dicts, configuration):
     """
     Sort image files based on map. If no map exists, sort randomly.
@@ -287,20 +782,22 @@ def organize_image_backgrounds(im_dir, image_bank_size, config_dicts, configurat
     
     else:
         # Trim df to just the columns needed
-        map_param_array = df[map_columns].values[:, np.newaxis]
+        map_param_array = df[map_columns].values.astype(float)
         
-        # for each entry in config_dict, set up numpy broadcasting
-        im_param_array = []
-        for config_dict in config_dicts:
-            im_param_array.append([config_dict[x] if not x.startswith('CONFIGURATION') else config_dict['-'.join(x.split('-')[1:])] for x in map_columns])
-        im_param_array = np.array(im_param_array)
+        # Collect the simulated values of each column
+        sim_names = [x if not x.startswith('CONFIGURATION') else '-'.join(x.split('-')[1:]) for x in map_columns]
+        im_param_array = np.array([[config_dict[name] for config_dict in config_dicts] for name in sim_names], dtype=float).T
 
         # divide by stds to put parameters on same footing
-        im_stds = np.std(im_param_array, axis=0)[np.newaxis, :]
-        im_stds = np.where(im_stds < 1.0, np.ones(len(im_stds)), im_stds)
-
-        # Find the closest image to each parameter combination in map_param_array
-        image_indices = np.argmin(np.sum(np.abs(im_param_array - map_param_array) / im_stds, axis=2), axis=0)
+        im_stds = np.std(im_param_array, axis=0)
+        im_stds = np.where(im_stds < 1.0, 1.0, im_stds)
+
+        # Find the closest image to each parameter combination, using the summed absolute scaled differences
+        tree = cKDTree(map_param_array / im_stds)
+        image_indices = np.empty(len(im_param_array), dtype=int)
+        for start in range(0, len(im_param_array), BACKGROUND_QUERY_CHUNK_SIZE):
+            stop = start + BACKGROUND_QUERY_CHUNK_SIZE
+            image_indices[start:stop] = tree.query(im_param_array[start:stop] / im_stds, k=1, p=1)[1]
 
     return image_indices
     
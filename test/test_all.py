@@ -36,7 +36,13 @@ os.system("pytest test_existance_and_attributes.py -v --capture=tee-sys")
 os.system("pytest test_expected_outputs.py -v --capture=tee-sys")
 os.system("pytest test_expected_behaviors_fixed.py -v --capture=tee-sys")
 os.system("pytest test_expected_behaviors_configurations.py -v --capture=tee-sys")
+os.system("pytest test_output_formats.py -v --capture=tee-sys")
+os.system("pytest test_user_distributions.py -v --capture=tee-sys")
+os.system("pytest test_shards_and_checkpoints.py -v --capture=tee-sys")
 
 
 
 
+os.system("pytest test_stream_dataset.py -v --capture=tee-sys")
+os.system("pytest test_lightcurve_interpolation.py -v --capture=tee-sys")
+os.system("pytest test_image_backgrounds.py -v --capture=tee-sys")
@@ -72,7 +72,7 @@ has_planes = [hasattr(dataset, x + '_planes') for x in dataset.configurations]
 images_exist = [os.path.exists(dataset.outdir +'/' + x + '_images.' +
                                dataset.arguments['image_file_format'])
                 for x in dataset.configurations]
-metadata_exist = [os.path.exists(dataset.outdir +'/' + x + '_metadata.csv')
+metadata_exist = [any([os.path.exists(dataset.outdir +'/' + x + '_metadata.' + ext) for ext in ['csv', 'parquet', 'feather', 'npz']])
                   for x in dataset.configurations]
 planes_exist = [os.path.exists(dataset.outdir +'/' + x + '_planes.' +
                                dataset.arguments['image_file_format'])
@@ -152,3 +152,22 @@ def test_planes_and_objects():
             assert all(md_planes == number_of_planes)
 
 
+def test_plane_redshifts():
+    for conf in dataset.configurations:
+
+        if all(has_metadata):
+            md = eval(f'dataset.{conf}_metadata')
+        else:
+            # this test requires metadata
+            return
+
+        for plane in dataset.config_dict['GEOMETRY'][conf].keys():
+            if not plane.startswith('PLANE_'):
+                continue
+            if 'REDSHIFT' not in dataset.config_dict['GEOMETRY'][conf][plane].get('PARAMETERS', {}):
+                continue
+
+            for band in dataset.bands:
+                plane_redshifts = md[f'{plane}-REDSHIFT-{band}'].values.astype(float)
+                object_redshifts = md[f'{plane}-OBJECT_1-REDSHIFT-{band}'].values.astype(float)
+                assert all(plane_redshifts == object_redshifts)
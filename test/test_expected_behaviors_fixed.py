@@ -70,7 +70,7 @@ has_planes = [hasattr(dataset, x + '_planes') for x in dataset.configurations]
 images_exist = [os.path.exists(dataset.outdir +'/' + x + '_images.' +
                                dataset.arguments['image_file_format'])
                 for x in dataset.configurations]
-metadata_exist = [os.path.exists(dataset.outdir +'/' + x + '_metadata.csv')
+metadata_exist = [any([os.path.exists(dataset.outdir +'/' + x + '_metadata.' + ext) for ext in ['csv', 'parquet', 'feather', 'npz']])
                   for x in dataset.configurations]
 planes_exist = [os.path.exists(dataset.outdir +'/' + x + '_planes.' +
                                dataset.arguments['image_file_format'])
@@ -36,9 +36,9 @@ doc = """
 \t\t\tdeeplenstronomy.make_dataset()
 
 \t\t- test_survey
-\t\t\tTesting if use of a pre-defined survey produced an new configuration file 
-\t\t\tautomatically and that the survey-specific configuration file is being 
-\t\t\tutilized by deeplenstronomy
+\t\t\tTesting if use of a pre-defined survey overwrites the IMAGE and SURVEY
+\t\t\tsections of the configuration in memory without writing a new
+\t\t\tconfiguration file
 
 \t\t- test_solve_lens_equation
 \t\t\tTesting if the x_mins, y_mins, and num_sources keywords are present in the
@@ -83,7 +83,7 @@ has_planes = [hasattr(dataset, x + '_planes') for x in dataset.configurations]
 images_exist = [os.path.exists(dataset.outdir +'/' + x + '_images.' +
                                dataset.arguments['image_file_format'])
                 for x in dataset.configurations]
-metadata_exist = [os.path.exists(dataset.outdir +'/' + x + '_metadata.csv')
+metadata_exist = [any([os.path.exists(dataset.outdir +'/' + x + '_metadata.' + ext) for ext in ['csv', 'parquet', 'feather', 'npz']])
                   for x in dataset.configurations]
 planes_exist = [os.path.exists(dataset.outdir +'/' + x + '_planes.' +
                                dataset.arguments['image_file_format'])
@@ -148,12 +148,12 @@ def test_return_planes():
 def test_survey():
     if dataset.arguments['survey'] is not None:
         config_path = dataset.config_file.split('/')
-        if len(config_path) == 1:
-            survey_file = dataset.arguments['survey'] + dataset.config_file
-        else:
-            survey_file = ('/'.join(config_path[0:-1]) + '/' +
-                           dataset.arguments['survey'] + '_' + config_path[-1])
-            assert os.path.exists(survey_file)
+        survey_file = '/'.join(config_path[0:-1] + [dataset.arguments['survey'] + '_' + config_path[-1]])
+        assert not os.path.exists(survey_file)
+
+        survey_dict = eval('dl.surveys.' + dataset.arguments['survey'] + '()')
+        for section in ['IMAGE', 'SURVEY']:
+            assert dataset.config_dict[section] == survey_dict[section]
 
 def test_solve_lens_equation():
     if dataset.arguments['solve_lens_equation']:
@@ -0,0 +1,79 @@
+"""
+Image Backgrounds
+"""
+import tempfile
+
+from astropy.io import fits
+import numpy as np
+import pandas as pd
+
+import deeplenstronomy.utils as utils
+from deeplenstronomy.utils import BackgroundBank, organize_image_backgrounds, read_images
+
+doc = """
+
+
+
+\tRunning tests from test_image_backgrounds.py
+
+
+\tThe tests included in this module demonstrate that image backgrounds are
+\tmatched to simulations and read as expected. The functions are:
+
+\t\t- test_background_matching
+\t\t\tTesting that the KD-tree matching of a map.txt finds the same images as
+\t\t\ta brute-force search for the smallest summed absolute scaled difference,
+\t\t\twhen the simulations are queried in several chunks
+
+"""
+print(doc)
+
+
+im_dir = tempfile.mkdtemp()
+
+
+def test_background_matching(monkeypatch):
+    np.random.seed(21)
+    columns = ['PLANE_1-OBJECT_1-REDSHIFT-g', 'CONFIGURATION_1-PLANE_2-OBJECT_1-REDSHIFT-g', 'exposure_time-g']
+    sim_names = ['PLANE_1-OBJECT_1-REDSHIFT-g', 'PLANE_2-OBJECT_1-REDSHIFT-g', 'exposure_time-g']
+    map_table = np.random.uniform(0.0, [1.0, 3.0, 200.0], size=(40, 3))
+    pd.DataFrame(map_table, columns=columns).to_csv(im_dir + '/map.txt', sep=' ', index=False)
+    config_dicts = [dict(zip(sim_names, x)) for x in np.random.uniform(0.0, [1.0, 3.0, 200.0], size=(25, 3))]
+
+    # query the simulations in more than one chunk
+    monkeypatch.setattr(utils, 'BACKGROUND_QUERY_CHUNK_SIZE', 7)
+    image_indices = organize_image_backgrounds(im_dir, len(map_table), config_dicts, 'CONFIGURATION_1')
+
+    sim_table = np.array([[x[name] for name in sim_names] for x in config_dicts])
+    stds = np.std(sim_table, axis=0)
+    stds = np.where(stds < 1.0, 1.0, stds)
+    distances = np.abs(sim_table[:, np.newaxis, :] / stds - map_table[np.newaxis, :, :] / stds).sum(axis=2)
+    assert np.array_equal(image_indices, np.argmin(distances, axis=1))
+
+def test_background_bank():
+    bands = ['g', 'r']
+    cube_dir = tempfile.mkdtemp()
+    cubes = {band: np.random.uniform(size=(5, 6, 6)).astype(np.float32) for band in bands}
+    for band in bands:
+        fits.PrimaryHDU(cubes[band]).writeto(cube_dir + '/' + band + '.fits')
+
+    # crop, keep, and pad the 6x6 images
+    for im_size in [4, 6, 9]:
+        images = read_images(cube_dir, im_size, bands)
+        assert images.shape == (5, len(bands), im_size, im_size)
+
+        bank = BackgroundBank(cube_dir, im_size, bands)
+        assert len(bank) == 5
+        assert np.array_equal(bank[3], images[3])
+        assert np.array_equal(bank[[4, 0, 4]], images[[4, 0, 4]])
+        assert np.array_equal(bank[1:3], images[1:3])
+        bank.close()
+
+        if im_size == 4:
+            assert np.array_equal(images[:, 0], cubes['g'][:, 1:5, 1:5])
+        elif im_size == 6:
+            assert np.array_equal(images[:, 1], cubes['r'])
+        else:
+            # padded to 11x11 and cropped back to 9x9
+            assert np.array_equal(images[:, 0, 1:7, 1:7], cubes['g'])
+            assert np.isclose(images.sum(), sum([x.sum() for x in cubes.values()]))
@@ -0,0 +1,71 @@
+"""
+Light Curves Interpolated in Redshift
+"""
+import numpy as np
+
+from deeplenstronomy.input_reader import Organizer, Parser
+
+doc = """
+
+
+
+\tRunning tests from test_lightcurve_interpolation.py
+
+
+\tThe tests included in this module demonstrate that light curves are
+\tinterpolated between the redshift nodes of a library with INTERPOLATE_REDSHIFT.
+\tThe functions are:
+
+\t\t- test_interpolated_magnitudes
+\t\t\tTesting that an object between two nodes gets the magnitudes of the sed
+\t\t\tof its closest node at its own redshift, even when the nodes were
+\t\t\tgenerated with different seds, and that these differ from the
+\t\t\tmagnitudes of the closest node
+
+\t\t- test_nearest_node
+\t\t\tTesting that without interpolation, and outside of the nodes, objects
+\t\t\tget the light curve of the closest node
+
+"""
+print(doc)
+
+
+organizer = Organizer(Parser('config.yaml').config_dict)
+band = 'g'
+nites = np.arange(-10.0, 11.0)
+redshifts = np.array([0.2, 0.4, 0.6])
+seds = {'a': 0.0, 'b': 1.0, 'c': 2.0}
+
+
+def _lightcurve(sed, redshift):
+    """
+    Library light curve whose magnitudes are linear in redshift
+    """
+    return {'sed': sed, 'interp': {band: (nites, 20.0 + seds[sed] + 5.0 * redshift + 0.01 * nites ** 2)}}
+
+# the seds of the nodes differ, like with MODEL: ia_random
+library = [_lightcurve(sed, redshift) for sed, redshift in zip(['a', 'b', 'c'], redshifts)]
+neighbours = [{1: _lightcurve('a', redshifts[1])},
+              {0: _lightcurve('b', redshifts[0]), 2: _lightcurve('b', redshifts[2])},
+              {1: _lightcurve('c', redshifts[1])}]
+lightcurves = {'library': library, 'redshifts': redshifts, 'neighbours': neighbours}
+
+
+def test_interpolated_magnitudes():
+    for redshift, sed in [(0.35, 'b'), (0.45, 'b'), (0.25, 'a'), (0.55, 'c')]:
+        lc_weights = organizer._select_lightcurves(lightcurves, redshift, interpolate=True)
+        closest_idx = np.argmin(np.abs(redshift - redshifts))
+
+        assert lc_weights[0][0] is library[closest_idx]
+        assert all([lc['sed'] == sed for lc, _ in lc_weights])
+
+        mags = organizer._lightcurve_magnitudes(lc_weights, band, nites)
+        nearest_mags = organizer._lightcurve_magnitudes([(library[closest_idx], 1.0)], band, nites)
+        assert np.allclose(mags, _lightcurve(sed, redshift)['interp'][band][1])
+        assert not np.allclose(mags, nearest_mags)
+
+def test_nearest_node():
+    for redshift, interpolate in [(0.35, False), (0.1, True), (0.7, True)]:
+        lc_weights = organizer._select_lightcurves(lightcurves, redshift, interpolate=interpolate)
+        assert len(lc_weights) == 1
+        assert lc_weights[0][0] is library[np.argmin(np.abs(redshift - redshifts))]
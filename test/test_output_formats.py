@@ -0,0 +1,72 @@
+"""
+Output Formats Round Trip
+"""
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from deeplenstronomy.output import HDF5Writer, MetadataWriter, read_hdf5_metadata, read_metadata
+
+doc = """
+
+
+
+\tRunning tests from test_output_formats.py
+
+
+\tThe tests included in this module demonstrate that data written to disk by
+\tdeeplenstronomy can be read back unchanged. The functions are:
+
+\t\t- test_hdf5_metadata_round_trip
+\t\t\tTesting that metadata appended to an hdf5 file, including ragged
+\t\t\tcolumns like x_mins, is read back with the same values
+
+\t\t- test_metadata_round_trip
+\t\t\tTesting that metadata written in the npz and csv formats is read
+\t\t\tback with the same values
+
+"""
+print(doc)
+
+
+outdir = tempfile.mkdtemp()
+
+# Equal-length ragged rows are the case that numpy would stack into a 2D array
+metadata = pd.DataFrame({'OBJID-g': [0, 1, 2],
+                         'PLANE_1-REDSHIFT-g': [0.5, 0.7, 0.9],
+                         'PLANE_1-OBJECT_1-NAME-g': ['LENS', 'LENS', 'LENS'],
+                         'x_mins-g': [np.array([0.1, -0.2, 0.3, -0.4]), np.array([0.5, -0.6, 0.7, -0.8]), np.array([0.9, -1.0, 1.1, -1.2])],
+                         'y_mins-g': [np.array([0.1, 0.2]), np.array([]), np.array([0.3])]})
+
+
+def _assert_equal(expected, actual):
+    assert list(expected.columns) == list(actual.columns)
+    assert len(expected) == len(actual)
+    for column in expected.columns:
+        for expected_value, actual_value in zip(expected[column].values, actual[column].values):
+            if isinstance(expected_value, np.ndarray):
+                assert np.array_equal(expected_value, np.asarray(actual_value, dtype=float))
+            else:
+                assert expected_value == actual_value
+
+def test_hdf5_metadata_round_trip():
+    filename = outdir + '/round_trip.hdf5'
+    writer = HDF5Writer(filename, mode='w')
+    writer.append('CONFIGURATION_1', metadata.iloc[0:2])
+    writer.append('CONFIGURATION_1', metadata.iloc[2:])
+    writer.close()
+
+    _assert_equal(metadata, read_hdf5_metadata(filename, 'CONFIGURATION_1'))
+    _assert_equal(metadata.iloc[[2, 0]], read_hdf5_metadata(filename, 'CONFIGURATION_1', rows=[2, 0]))
+
+def test_metadata_round_trip():
+    outfile = MetadataWriter.write(metadata, outdir + '/CONFIGURATION_1_metadata', 'npz')
+    _assert_equal(metadata, read_metadata(outfile))
+
+    # csv files keep ragged columns as ';'-joined strings
+    outfile = MetadataWriter.write(metadata, outdir + '/CONFIGURATION_1_metadata', 'csv')
+    csv_metadata = read_metadata(outfile)
+    _assert_equal(metadata.drop(columns=['x_mins-g', 'y_mins-g']), csv_metadata.drop(columns=['x_mins-g', 'y_mins-g']))
+    assert csv_metadata['x_mins-g'].values[0] == ';'.join([str(x) for x in metadata['x_mins-g'].values[0]])
@@ -0,0 +1,111 @@
+"""
+Shards and Checkpoints Match a Single Run
+"""
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import deeplenstronomy.deeplenstronomy as dl
+from deeplenstronomy.image_generator import ImageGenerator
+
+doc = """
+
+
+
+\tRunning tests from test_shards_and_checkpoints.py
+
+
+\tThe tests included in this module demonstrate that datasets generated in
+\tparts are the same as datasets generated in a single run. The functions are:
+
+\t\t- test_merge_shards
+\t\t\tTesting that the merged shards of a dataset have the same images,
+\t\t\tplanes, and metadata as the dataset generated in one run
+
+\t\t- test_resume
+\t\t\tTesting that a run interrupted by an error and continued with
+\t\t\tresume=True only generates the unfinished images, and that the
+\t\t\tresult is the same as the dataset generated in one run
+
+"""
+print(doc)
+
+
+def _write_config(outdir):
+    """
+    Copy config.yaml with its OUTDIR set to outdir
+    """
+    with open('config.yaml', 'r') as infile:
+        config = infile.read().replace('OUTDIR: TestResults', 'OUTDIR: ' + outdir)
+    filename = outdir + '_config.yaml'
+    with open(filename, 'w') as outfile:
+        outfile.write(config)
+    return filename
+
+def _assert_same_dataset(expected, actual):
+    assert sorted(expected.configurations) == sorted(actual.configurations)
+    for configuration in expected.configurations:
+        for kind in ['images', 'planes']:
+            expected_array = np.asarray(getattr(expected, '{0}_{1}'.format(configuration, kind)))
+            actual_array = np.asarray(getattr(actual, '{0}_{1}'.format(configuration, kind)))
+            assert np.array_equal(expected_array, actual_array)
+        expected_metadata = getattr(expected, '{0}_metadata'.format(configuration)).read()
+        actual_metadata = getattr(actual, '{0}_metadata'.format(configuration)).read()
+        assert expected_metadata.astype(str).equals(actual_metadata.astype(str))
+
+tempdir = tempfile.mkdtemp()
+kwargs = {'save_to_disk': True, 'store_in_memory': False, 'return_planes': True}
+
+single_config = _write_config(tempdir + '/single')
+dl.make_dataset(single_config, **kwargs)
+single = dl.Dataset.load(tempdir + '/single')
+
+
+def test_merge_shards():
+    config = _write_config(tempdir + '/sharded')
+    for shard_index in range(3):
+        dl.make_dataset(config, shard_index=shard_index, num_shards=3, **kwargs)
+
+    _assert_same_dataset(single, dl.merge_shards(tempdir + '/sharded'))
+
+def test_resume(monkeypatch):
+    config = _write_config(tempdir + '/resumed')
+    sim_image = ImageGenerator.sim_image
+    calls = []
+
+    def failing_sim_image(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 5:
+            raise MemoryError("simulated interruption")
+        return sim_image(self, *args, **kwargs)
+
+    monkeypatch.setattr(ImageGenerator, 'sim_image', failing_sim_image)
+    try:
+        dl.make_dataset(config, checkpoint_size=1, **kwargs)
+    except MemoryError:
+        pass
+
+    # the finished chunks are written on a separate thread
+    manifest_file = tempdir + '/resumed/checkpoint/progress.json'
+    for _ in range(100):
+        if os.path.exists(manifest_file) and len(json.load(open(manifest_file, 'r'))['completed']) > 0:
+            break
+        time.sleep(0.1)
+    completed = sum([len(x) for x in json.load(open(manifest_file, 'r'))['completed'].values()])
+    assert completed > 0
+
+    def counting_sim_image(self, *args, **kwargs):
+        calls.append(1)
+        return sim_image(self, *args, **kwargs)
+
+    monkeypatch.setattr(ImageGenerator, 'sim_image', counting_sim_image)
+    calls.clear()
+    resumed = dl.make_dataset(config, checkpoint_size=1, resume=True, **kwargs)
+
+    total = sum([len(np.asarray(getattr(single, '{0}_images'.format(x)))) for x in single.configurations])
+    assert len(calls) == total - completed
+    assert not os.path.exists(tempdir + '/resumed/checkpoint')
+    _assert_same_dataset(single, dl.Dataset.load(resumed.outdir))
@@ -0,0 +1,54 @@
+"""
+Streamed Batches
+"""
+import tempfile
+
+import numpy as np
+
+import deeplenstronomy.deeplenstronomy as dl
+
+doc = """
+
+
+
+\tRunning tests from test_stream_dataset.py
+
+
+\tThe tests included in this module demonstrate that stream_dataset yields
+\tbatches of the requested size with one metadata row per image. The
+\tfunctions are:
+
+\t\t- test_stream_batches
+\t\t\tTesting that the batches have the requested shape and number of
+\t\t\tmetadata rows, and that the first round of a worker has the images
+\t\t\tand inputs of the dataset make_dataset generates with its seed
+
+"""
+print(doc)
+
+
+tempdir = tempfile.mkdtemp()
+
+
+def test_stream_batches():
+    batch_size, num_batches = 3, 4
+    batches = list(dl.stream_dataset('config.yaml', batch_size=batch_size, num_batches=num_batches, num_workers=1))
+
+    assert len(batches) == num_batches
+    for images, metadata in batches:
+        assert images.shape == (batch_size, 5, 100, 100)
+        assert len(metadata) == batch_size
+
+    # the first round of the only worker uses SEED + 1
+    with open('config.yaml', 'r') as infile:
+        config = infile.read().replace('SEED: 6', 'SEED: 7').replace('OUTDIR: TestResults', 'OUTDIR: ' + tempdir)
+    with open(tempdir + '/config.yaml', 'w') as outfile:
+        outfile.write(config)
+    dataset = dl.make_dataset(tempdir + '/config.yaml')
+    expected_images = np.concatenate([getattr(dataset, '{0}_images'.format(x)) for x in dataset.configurations])
+
+    streamed_images = np.concatenate([x[0] for x in batches])[:len(expected_images)]
+    streamed_objids = np.concatenate([x[1]['OBJID-g'].values for x in batches])[:len(expected_images)]
+    expected_objids = np.concatenate([getattr(dataset, '{0}_metadata'.format(x))['OBJID-g'].values for x in dataset.configurations])
+    assert np.array_equal(expected_images, streamed_images)
+    assert np.array_equal(expected_objids, streamed_objids)
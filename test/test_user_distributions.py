@@ -0,0 +1,134 @@
+"""
+User Distributions
+"""
+import os
+import tempfile
+
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+from deeplenstronomy.output import _has_pyarrow
+import deeplenstronomy.utils as utils
+from deeplenstronomy.utils import AliasTable, draw_from_user_dist, read_distribution_columns, read_distribution_file
+
+doc = """
+
+
+
+\tRunning tests from test_user_distributions.py
+
+
+\tThe tests included in this module demonstrate that USERDIST files are read
+\tthe same way in every format and sampled with the right probabilities. The
+\tfunctions are:
+
+\t\t- test_alias_table
+\t\t\tTesting that indices drawn from an alias table follow the weights,
+\t\t\tand that indices with zero weight are never drawn
+
+\t\t- test_binary_distribution_files
+\t\t\tTesting that npy, h5, hdf5, and parquet USERDIST files are read back
+\t\t\tas the same table as the text file and can be sampled
+
+"""
+print(doc)
+
+
+outdir = tempfile.mkdtemp()
+
+distribution = pd.DataFrame({'REDSHIFT': [0.1, 0.3, 0.5, 0.7, 0.9],
+                             'magnitude': [18.0, 19.0, 20.0, 21.0, 22.0],
+                             'WEIGHT': [0.1, 0.0, 0.4, 0.2, 0.3]})
+
+
+def _grid_distribution(filename, dimensions, num_nodes=5):
+    """
+    Write a smooth distribution tabulated on a regular grid of the unit cube
+    """
+    nodes = np.meshgrid(*[np.linspace(0.0, 1.0, num_nodes)] * dimensions)
+    points = np.array([x.flatten() for x in nodes]).T
+    df = pd.DataFrame(points, columns=['PARAM_{0}'.format(x) for x in range(dimensions)])
+    df['WEIGHT'] = np.exp(-((points - 0.3)**2).sum(axis=1) / 0.1) + 0.2 * points[:, 0]
+    df.to_csv(filename, sep=' ', index=False)
+
+
+def test_alias_table():
+    np.random.seed(7)
+    weights = distribution['WEIGHT'].values
+    draws = AliasTable(weights).draw(200000)
+    frequencies = np.bincount(draws, minlength=len(weights)) / len(draws)
+
+    assert frequencies[1] == 0.0
+    assert np.allclose(frequencies, weights / weights.sum(), atol=0.005)
+
+def test_binary_distribution_files():
+    filenames = [outdir + '/dist.txt', outdir + '/dist.npy', outdir + '/dist.h5', outdir + '/dist.hdf5']
+    distribution.to_csv(filenames[0], sep=' ', index=False)
+    np.save(filenames[1], distribution.to_records(index=False))
+    for filename in filenames[2:]:
+        with h5py.File(filename, 'w') as hf:
+            for column in distribution.columns:
+                hf.create_dataset(column, data=distribution[column].values)
+    if _has_pyarrow():
+        filenames.append(outdir + '/dist.parquet')
+        distribution.to_parquet(filenames[-1])
+
+    for filename in filenames:
+        df = read_distribution_file(filename)
+        for column in distribution.columns:
+            assert np.allclose(df[column].values, distribution[column].values)
+
+        parameters, choices = draw_from_user_dist(filename, 50, 'sample')
+        assert sorted(parameters) == ['REDSHIFT', 'magnitude']
+        assert choices.shape == (50, 2)
+        assert not np.any(np.isclose(choices[:, parameters.index('REDSHIFT')], 0.3))
+
+def test_chunked_sampling(monkeypatch):
+    filenames = [outdir + '/chunked.txt', outdir + '/chunked.npy', outdir + '/chunked.h5']
+    distribution.to_csv(filenames[0], sep=' ', index=False)
+    np.save(filenames[1], distribution.to_records(index=False))
+    with h5py.File(filenames[2], 'w') as hf:
+        for column in distribution.columns:
+            hf.create_dataset(column, data=distribution[column].values)
+    monkeypatch.setattr(utils, 'DISTRIBUTION_CHUNK_SIZE', 2)
+
+    draws = []
+    for filename in filenames:
+        np.random.seed(13)
+        parameters, choices = draw_from_user_dist(filename, 200, 'sample')
+        draws.append(choices[:, [parameters.index(x) for x in ['REDSHIFT', 'magnitude']]])
+    for choices in draws[1:]:
+        assert np.array_equal(choices, draws[0])
+    assert read_distribution_columns(filenames[1]) == list(distribution.columns)
+
+def test_triangulation_marginals(monkeypatch):
+    np.random.seed(11)
+    filename, step, size = outdir + '/grid_3d.txt', 10, 100000
+    _grid_distribution(filename, 3)
+
+    _, dense_choices = draw_from_user_dist(filename, size, 'interpolate', step=step)
+    monkeypatch.setattr(utils, 'MAX_INTERPOLATION_GRID_SIZE', 1)
+    _, triangulation_choices = draw_from_user_dist(filename, size, 'interpolate', step=step)
+
+    # draws are points of the grid, so compare how often each point of the 2-D marginals is drawn
+    for columns in [[0, 1], [0, 2], [1, 2]]:
+        frequencies = []
+        for choices in [dense_choices, triangulation_choices]:
+            grid_idx = np.rint(choices[:, columns] * (step - 1)).astype(int)
+            assert np.allclose(grid_idx, choices[:, columns] * (step - 1))
+            frequencies.append(np.bincount(grid_idx[:, 0] * step + grid_idx[:, 1], minlength=step**2) / size)
+        assert 0.5 * np.abs(frequencies[0] - frequencies[1]).sum() < 0.05
+
+def test_kde_sampling():
+    np.random.seed(12)
+    filename, step, size = outdir + '/grid_5d.txt', 20, 1000
+    _grid_distribution(filename, 5, num_nodes=4)
+    assert 5 > utils.MAX_TRIANGULATION_DIMENSIONS and step**5 > utils.MAX_INTERPOLATION_GRID_SIZE
+
+    parameters, choices = draw_from_user_dist(filename, size, 'interpolate', step=step)
+    assert parameters == ['PARAM_{0}'.format(x) for x in range(5)]
+    assert choices.shape == (size, 5)
+    assert np.all((choices >= 0.0) & (choices <= 1.0))
+    assert np.allclose(choices * (step - 1), np.rint(choices * (step - 1)))